@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from scipy.sparse.csgraph import breadth_first_order
+
+from CompiledNet import GOAL_REACHED, GOAL_NOT_REACHED
+from CTMC import CTMC, build_ctmc
+
+#Class of the absorbing states where no goal place is marked:
+DEADLOCK = 'DEADLOCK'
+#Class of the states from which no absorbing state can be reached (the chain is trapped cycling among them):
+NO_ABSORPTION = 'NO_ABSORPTION'
+
+#Number of transient states listed in the text report:
+_REPORT_STATES = 20
+
+def absorbing_classes(ctmc, goals = None):
+    """Classifies the states of a CTMC for absorption analysis.
+
+    Goal states (where a place of a goal class is marked, checking the
+    classes in order) are made absorbing; the remaining absorbing states are
+    DEADLOCK states, and the states that cannot reach any absorbing state
+    are NO_ABSORPTION states.
+
+    Keyword Arguments:
+    goals -- List of (class name, list of place ids) tuples. By default,
+             the places named GOAL_REACHED and GOAL_NOT_REACHED, if any.
+
+    Returns (labels, names): an array with the class index of every state
+    (-1 for the transient ones) and the list of class names.
+    """
+
+    net = ctmc.net
+    if goals is None:
+        goals = [(name, net.places_named(name)) for name in (GOAL_REACHED, GOAL_NOT_REACHED)]
+        goals = [(name, places) for name, places in goals if places]
+    else:
+        goals = [(name, [net.place_index[p_id] for p_id in place_ids]) for name, place_ids in goals]
+
+    n = ctmc.num_states
+    labels = np.repeat(-1, n)
+    names = []
+    markings = ctmc.markings() if n else None
+    for name, places in goals:
+        if places:
+            marked = (markings[:, places] > 0).any(axis = 1) & (labels < 0)
+            labels[marked] = len(names)
+        names.append(name)
+
+    absorbing = np.zeros(n, dtype = bool)
+    absorbing[np.asarray(ctmc.absorbing, dtype = np.int64)] = True
+    labels[absorbing & (labels < 0)] = len(names)
+    names.append(DEADLOCK)
+
+    #States reaching an absorbing state: search the reversed graph from a virtual node linked to every absorbing state.
+    targets = np.flatnonzero(labels >= 0)
+    Q = ctmc.Q.tocoo()
+    off_diagonal = Q.row != Q.col
+    rows = np.concatenate((Q.col[off_diagonal], np.repeat(n, len(targets))))
+    cols = np.concatenate((Q.row[off_diagonal], targets))
+    graph = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape = (n + 1, n + 1))
+    reaching = np.zeros(n + 1, dtype = bool)
+    reaching[breadth_first_order(graph, n, directed = True, return_predecessors = False)] = True
+    labels[~reaching[:n]] = len(names)
+    names.append(NO_ABSORPTION)
+
+    return labels, names
+
+class Absorption(object):
+    """Absorption analysis of a CTMC.
+
+    Attributes:
+    ctmc -- The analyzed CTMC object.
+    classes -- Names of the absorbing classes.
+    labels -- Class index of every state (-1 for the transient states).
+    probabilities -- Dictionary with the probability of ending in every class.
+    expected_time -- Expected time to absorption (infinite if the chain can
+                     end in NO_ABSORPTION states).
+    transient_states -- Array with the ids of the transient states.
+    state_probabilities -- Dictionary with an array for every class: the
+                           probability of ending in it from every transient state.
+    state_expected_time -- Expected time to absorption from every transient
+                           state (or to reaching a NO_ABSORPTION state).
+    expected_time_in_state -- Expected time spent in every transient state.
+    expected_visits -- Expected number of visits to every transient state.
+    """
+
+    def __init__(self, ctmc, classes, labels, probabilities, expected_time, transient_states,
+                 state_probabilities, state_expected_time, expected_time_in_state, expected_visits):
+
+        super(Absorption, self).__init__()
+
+        self.ctmc = ctmc
+        self.classes = classes
+        self.labels = labels
+        self.probabilities = probabilities
+        self.expected_time = expected_time
+        self.transient_states = transient_states
+        self.state_probabilities = state_probabilities
+        self.state_expected_time = state_expected_time
+        self.expected_time_in_state = expected_time_in_state
+        self.expected_visits = expected_visits
+
+    def __str__(self):
+
+        net = self.ctmc.net
+        lines = [str(self.ctmc.num_states) + ' tangible states, ' + str(len(self.transient_states)) + ' transient.']
+        lines.append('')
+        lines.append('{0:<40}{1:>16}{2:>12}'.format('Class', 'Probability', 'States'))
+        for c, name in enumerate(self.classes):
+            lines.append('{0:<40}{1:>16.10f}{2:>12}'.format(name, self.probabilities[name], int((self.labels == c).sum())))
+        lines.append('')
+        lines.append('Expected time to absorption: ' + '{0:.10g}'.format(self.expected_time))
+
+        if len(self.transient_states):
+            order = np.argsort(-self.expected_visits, kind = 'mergesort')[:_REPORT_STATES]
+            lines.append('')
+            lines.append('Most visited transient states:')
+            lines.append('{0:>12}{1:>16}  {2}'.format('Visits', 'Time', 'Marking'))
+            for i in order:
+                marking = self.ctmc.marking(self.transient_states[i])
+                marked = ', '.join(net.place_names[p] + ('' if m == 1 else '*' + str(m)) for p, m in enumerate(marking) if m)
+                lines.append('{0:>12.6g}{1:>16.6g}  {2}'.format(self.expected_visits[i], self.expected_time_in_state[i], marked))
+        return '\n'.join(lines)
+
+def absorption_analysis(model, goals = None):
+    """Computes the absorption probabilities, times and visits of a CTMC (or of the CTMC of a PetriNet).
+
+    With Q_TT the generator restricted to the transient states (see
+    absorbing_classes) and alpha the initial distribution on them:
+
+    - The probabilities b_c of ending in class c solve -Q_TT.b_c = r_c,
+      where r_c are the rates from every transient state into class c.
+    - The expected times to absorption tau solve -Q_TT.tau = 1.
+    - The expected times spent in the transient states z solve
+      z.(-Q_TT) = alpha; the expected visits are z times the exit rates.
+
+    -Q_TT is factorized once (sparse LU) and used for every solve, the
+    inverse (fundamental matrix) is never formed.
+
+    Keyword Arguments:
+    goals -- See absorbing_classes.
+
+    Returns an Absorption object.
+    """
+
+    ctmc = model if isinstance(model, CTMC) else build_ctmc(model)
+    labels, classes = absorbing_classes(ctmc, goals)
+    initial = ctmc.initial
+    transient = np.flatnonzero(labels < 0)
+    alpha = initial[transient]
+
+    state_probabilities = {}
+    if len(transient):
+        Q = ctmc.Q.tocsr()
+        rows = Q[transient]
+        lu = spla.splu(sp.csc_matrix(-rows[:, transient]))
+        for c, name in enumerate(classes):
+            r = np.asarray(rows[:, labels == c].sum(axis = 1)).ravel()
+            state_probabilities[name] = lu.solve(r) if r.any() else np.zeros(len(transient))
+        state_expected_time = lu.solve(np.ones(len(transient)))
+        expected_time_in_state = lu.solve(alpha, trans = 'T')
+        expected_visits = expected_time_in_state*ctmc.exit_rates[transient]
+    else:
+        for name in classes:
+            state_probabilities[name] = np.zeros(0)
+        state_expected_time = expected_time_in_state = expected_visits = np.zeros(0)
+
+    probabilities = {}
+    for c, name in enumerate(classes):
+        probabilities[name] = float(alpha.dot(state_probabilities[name]) + initial[labels == c].sum())
+
+    if probabilities[NO_ABSORPTION] > 0:
+        expected_time = float('inf')
+    else:
+        expected_time = float(alpha.dot(state_expected_time))
+
+    return Absorption(ctmc, classes, labels, probabilities, expected_time, transient,
+                      state_probabilities, state_expected_time, expected_time_in_state, expected_visits)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+import random
+
+import numpy as np
+
+from CompiledNet import CompiledNet
+from Simulation import MAX_IMMEDIATE, SimulationResult
+
+class _BatchNet(object):
+    """Arcs of a CompiledNet as flat NumPy arrays, to check the enabling of many markings at once."""
+
+    def __init__(self, net):
+
+        super(_BatchNet, self).__init__()
+
+        self.num_transitions = net.num_transitions
+        self.delta = net.incidence.T.astype(np.int64)
+
+        #Input arcs, grouped by transition: the ones of pre_transitions[i] start at pre_start[i] in pre_place and pre_weight.
+        self.pre_transitions, self.pre_start, self.pre_place, self.pre_weight = self._flatten(net.pre_arcs)
+        #Capacity constraints of the output places (the marking plus the change must not exceed the capacity):
+        self.cap_transitions, self.cap_start, self.cap_place, self.cap_limit = self._flatten(
+            [[(p, capacity - d) for p, d, capacity in arcs] for arcs in net.capacity_arcs])
+
+        self.is_immediate = np.array(net._is_immediate, dtype = np.bool_)
+        self.priority = np.array(net._priority, dtype = np.int64)
+
+    @staticmethod
+    def _flatten(arcs):
+        transitions = np.array([t for t, t_arcs in enumerate(arcs) if t_arcs], dtype = np.int64)
+        lengths = [len(arcs[t]) for t in transitions]
+        start = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64) if lengths else np.zeros(0, dtype = np.int64)
+        places = np.array([p for t in transitions for p, _ in arcs[t]], dtype = np.int64)
+        values = np.array([v for t in transitions for _, v in arcs[t]], dtype = np.int64)
+        return transitions, start, places, values
+
+    def enabled(self, M):
+        """Returns a boolean (markings x transitions) matrix with the transitions enabled in every row of M."""
+
+        E = np.ones((M.shape[0], self.num_transitions), dtype = np.bool_)
+        if len(self.pre_transitions):
+            ok = M[:, self.pre_place] >= self.pre_weight
+            E[:, self.pre_transitions] = np.logical_and.reduceat(ok, self.pre_start, axis = 1)
+        if len(self.cap_transitions):
+            ok = M[:, self.cap_place] <= self.cap_limit
+            E[:, self.cap_transitions] &= np.logical_and.reduceat(ok, self.cap_start, axis = 1)
+        return E
+
+    def fireable(self, E):
+        """Filters an enabled matrix by priority. Returns (fireable matrix, boolean vector of the vanishing rows)."""
+
+        immediate = E & self.is_immediate
+        vanishing = immediate.any(axis = 1)
+        if not vanishing.any():
+            return E & ~self.is_immediate, vanishing
+        top = np.where(immediate, self.priority, np.iinfo(np.int64).min).max(axis = 1)
+        F = np.where(vanishing[:, np.newaxis], immediate & (self.priority == top[:, np.newaxis]), E & ~self.is_immediate)
+        return F, vanishing
+
+def simulate_batch(petri_net, end_time, replications = 1000, warmup = 0.0, seed = None, rates = None,
+                   confidence = 0.95, max_immediate = MAX_IMMEDIATE):
+    """Simulates many replications of a PetriNet (or CompiledNet) at once, with NumPy array operations.
+
+    Replications follow the same semantics as Simulation.replicate, but all
+    of them advance together: markings are rows of a (replications x places)
+    matrix, and every step computes the enabled transitions, the priority
+    filter, the firing times and the winners of the race for all the running
+    replications with a few array operations. The winner is drawn with
+    probability proportional to its rate and the time to the firing is
+    exponential with the total rate, which is equivalent to drawing one
+    exponential per transition and taking the minimum, with fewer random
+    numbers. Replications stop when they reach end_time or a dead marking.
+
+    Keyword Arguments:
+    replications -- Number of independent replications.
+    warmup -- Initial time discarded from the statistics of every replication.
+    seed -- Seed of the NumPy random generator. If None, one is chosen at random.
+    rates -- Rates (and weights of the immediate transitions) to use instead
+             of the ones of the net: an array with one value per transition
+             (in the CompiledNet order), or a (replications x transitions)
+             array to give every replication its own rates, e.g. to study
+             the sensitivity of the results to the rates.
+    confidence -- Confidence level of the intervals reported.
+    max_immediate -- Maximum number of consecutive immediate firings.
+
+    Returns a Simulation.SimulationResult object.
+    """
+
+    if end_time <= warmup or warmup < 0:
+        raise Exception('The simulation end time must be greater than the warm-up time, which must not be negative.')
+    if replications < 1:
+        raise Exception('At least one replication is needed.')
+
+    net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+    batch = _BatchNet(net)
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(32)
+    rng = np.random.RandomState(seed)
+
+    num_places = net.num_places
+    num_transitions = net.num_transitions
+    if rates is None:
+        rates = np.array(net._rate, dtype = np.float64)
+    rates = np.asarray(rates, dtype = np.float64)
+    if rates.shape not in ((num_transitions,), (replications, num_transitions)):
+        raise Exception('The rates must have one value per transition, or one row per replication.')
+    per_replication_rates = rates.ndim == 2
+
+    M = np.tile(np.asarray(net.init_marking, dtype = np.int64), (replications, 1))
+    t = np.zeros(replications)
+    area = np.zeros((replications, num_places))
+    firings = np.zeros((replications, num_transitions), dtype = np.int64)
+    fired = np.zeros(replications, dtype = np.int64)
+    immediate_run = np.zeros(replications, dtype = np.int64)
+    running = np.arange(replications)
+
+    while len(running):
+        m = M[running]
+        F, vanishing = batch.fireable(batch.enabled(m))
+        W = F*(rates[running] if per_replication_rates else rates)
+        total = W.sum(axis = 1)
+
+        immediate_run[running] = np.where(vanishing, immediate_run[running] + 1, 0)
+        if vanishing.any():
+            if (vanishing & (total <= 0)).any():
+                r = running[np.flatnonzero(vanishing & (total <= 0))[0]]
+                raise Exception('The immediate transitions enabled in marking ' + str(net.marking_dict(M[r]))
+                                + ' have a total weight of 0.')
+            if immediate_run.max() > max_immediate:
+                r = int(np.argmax(immediate_run))
+                raise Exception('Vanishing loop: more than ' + str(max_immediate) + ' consecutive immediate firings in marking '
+                                + str(net.marking_dict(M[r])) + '.')
+
+        #Time of the next firing (infinite in dead markings, no delay in vanishing ones):
+        start = t[running]
+        dead = total <= 0
+        delay = np.zeros(len(running))
+        timed = ~vanishing & ~dead
+        delay[timed] = rng.exponential(1.0, timed.sum())/total[timed]
+        delay[dead] = np.inf
+        end = start + delay
+
+        #Tokens held until the firing (or until end_time), within the observed interval:
+        observed = np.minimum(end, end_time) - np.maximum(start, warmup)
+        observed[vanishing] = 0.0
+        observed = np.maximum(observed, 0.0)
+        area[running] += m*observed[:, np.newaxis]
+
+        firing = end < end_time
+        t[running] = end
+        running, m, W, total, end = running[firing], m[firing], W[firing], total[firing], end[firing]
+
+        #Race winners, drawn from the cumulative rates:
+        u = rng.random_sample(len(running))*total
+        winners = (W.cumsum(axis = 1) <= u[:, np.newaxis]).sum(axis = 1)
+        #Round-off can leave u beyond the last cumulative rate, the winner is then the last transition that can fire:
+        np.minimum(winners, num_transitions - 1 - np.argmax(W[:, ::-1] > 0, axis = 1), winners)
+        M[running] = m + batch.delta[winners]
+        fired[running] += 1
+        counted = end >= warmup
+        np.add.at(firings, (running[counted], winners[counted]), 1)
+
+    observed_time = end_time - warmup
+    return SimulationResult(net, end_time, warmup, confidence, seed, area/observed_time,
+                            firings/observed_time, [int(f) for f in fired])
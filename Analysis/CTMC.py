@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+from array import array
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+from CompiledNet import CompiledNet
+from Reachability import MarkingTable, marking_typecode
+
+class CTMC(object):
+    """Continuous time Markov chain of a GSPN (a PetriNet with immediate and timed stochastic transitions).
+
+    States are the tangible markings (the ones where no immediate transition
+    is enabled), identified by integer ids and stored in a MarkingTable.
+
+    Attributes:
+    Q -- Generator matrix (SciPy CSR, states x states): Q[i, j] is the rate
+         from state i to state j and every row adds up to zero.
+    initial -- Initial probability vector (the initial marking may be vanishing).
+    transition_rates -- SciPy CSR matrix (states x transitions): the rate at
+                        which every transition fires while the chain is in
+                        each state, including the immediate transitions fired
+                        in the vanishing markings reached from it. The
+                        throughputs are pi * transition_rates.
+    absorbing -- Array with the ids of the states with no outgoing rate.
+    """
+
+    def __init__(self, net, states, Q, initial, transition_rates, absorbing):
+
+        super(CTMC, self).__init__()
+
+        self.net = net
+        self.states = states
+        self.Q = Q
+        self.initial = initial
+        self.transition_rates = transition_rates
+        self.absorbing = absorbing
+
+    @property
+    def num_states(self):
+        return len(self.states)
+
+    @property
+    def exit_rates(self):
+        """Read-only property. Total outgoing rate of every state (the negated diagonal of Q)."""
+        return -self.Q.diagonal()
+
+    def marking(self, state):
+        """Returns the marking of a state as a list, in the CompiledNet place order."""
+        return self.states.get(state)
+
+    def marking_dict(self, state):
+        """Returns the marking of a state as a dictionary with place ids as keys."""
+        return self.net.marking_dict(self.states.get(state))
+
+    def markings(self):
+        """Returns every tangible marking as a (states x places) NumPy array."""
+        return self.states.to_numpy()
+
+    def state_id(self, marking):
+        """Returns the id of a tangible marking (sequence or dictionary with place ids as keys), or None."""
+
+        if isinstance(marking, dict):
+            marking = [marking.get(p_id, 0) for p_id in self.net.place_ids]
+        state = self.states.find(self.states.pack(marking))
+        return state if state >= 0 else None
+
+class _VanishingResolver(object):
+    """Eliminates vanishing markings, memoizing the result for every vanishing marking found.
+
+    In a vanishing marking only the enabled immediate transitions with the
+    highest priority can fire, each one with probability proportional to its
+    weight (the transition rate). Resolving a vanishing marking gives the
+    probability of reaching every tangible marking and the expected number
+    of firings of every immediate transition on the way.
+
+    Immediate transitions can lead back to a vanishing marking already on
+    the way (e.g. t1: A -> B, t2: B -> A and t3: B -> C). The vanishing
+    markings are grouped in strongly connected sets (Tarjan's algorithm),
+    and the outcome of every set V is P_VT + P_VV.(I - P_VV)^-1.P_VT, where
+    P_VV are the probabilities among the markings of the set and P_VT the
+    probabilities of leaving it (folding in the outcome of the vanishing
+    markings outside of it). The inverse is never formed: every set is a
+    sparse linear solve. Only a closed set, with no way out, is an error.
+    """
+
+    def __init__(self, net, pack, max_states = None):
+
+        super(_VanishingResolver, self).__init__()
+
+        self.net = net
+        self.pack = pack
+        self.max_states = max_states
+        self._memo = {}
+
+    def branches(self, marking, enabled):
+        """Returns (transition, probability, marking) tuples for a vanishing marking."""
+
+        net = self.net
+        fireable = net.fireable_transitions(enabled)
+        total = float(sum(net._rate[t] for t in fireable))
+        if total <= 0:
+            raise Exception('The immediate transitions enabled in marking ' + str(net.marking_dict(marking))
+                            + ' have a total weight of 0.')
+        return [(t, net._rate[t]/total, net.fire(marking, t)) for t in fireable if net._rate[t] > 0]
+
+    def _successors(self, marking, enabled):
+        """Returns (transition, probability, key, marking, enabled transitions) tuples for a vanishing marking.
+
+        The enabled transitions are None for the tangible markings.
+        """
+
+        net = self.net
+        pack = self.pack
+        is_immediate = net._is_immediate
+        successors = []
+        for t, p, new_marking in self.branches(marking, enabled):
+            new_enabled = net.enabled_transitions(new_marking)
+            if not any(is_immediate[u] for u in new_enabled):
+                new_enabled = None
+            successors.append((t, p, pack(new_marking), new_marking, new_enabled))
+        return successors
+
+    def resolve(self, key, marking, enabled):
+        """Returns ({tangible key: probability}, {immediate transition: expected firings}) for a vanishing marking."""
+
+        result = self._memo.get(key)
+        if result is not None:
+            return result
+
+        memo = self._memo
+        #Tarjan's algorithm, without recursion. Successors and markings of the vanishing markings being visited:
+        successors = {key: self._successors(marking, enabled)}
+        markings = {key: marking}
+        index = {key: 0}
+        low = {key: 0}
+        component = [key]
+        on_component = set([key])
+        calls = [[key, 0]]
+        while calls:
+            frame = calls[-1]
+            v, i = frame
+            v_successors = successors[v]
+            if i < len(v_successors):
+                frame[1] = i + 1
+                _, _, w, w_marking, w_enabled = v_successors[i]
+                if w_enabled is None or w in memo:
+                    continue
+                if w not in index:
+                    if self.max_states is not None and len(memo) + len(index) >= self.max_states:
+                        raise Exception('The CTMC has more than ' + str(self.max_states) + ' vanishing markings.')
+                    index[w] = low[w] = len(index)
+                    component.append(w)
+                    on_component.add(w)
+                    successors[w] = self._successors(w_marking, w_enabled)
+                    markings[w] = w_marking
+                    calls.append([w, 0])
+                elif w in on_component:
+                    low[v] = min(low[v], index[w])
+                continue
+
+            calls.pop()
+            if calls:
+                u = calls[-1][0]
+                low[u] = min(low[u], low[v])
+            if low[v] == index[v]:
+                start = len(component) - 1
+                while component[start] != v:
+                    start -= 1
+                members = component[start:]
+                del component[start:]
+                on_component.difference_update(members)
+                self._solve(members, successors, markings)
+                for w in members:
+                    del successors[w]
+                    del markings[w]
+
+        return memo[key]
+
+    def _solve(self, members, successors, markings):
+        """Memoizes the outcome of every marking of a strongly connected set of vanishing markings."""
+
+        memo = self._memo
+        position = dict((w, i) for i, w in enumerate(members))
+
+        #Rows of P_VV, and of the outcome of leaving the set (P_VT with the outcome of the vanishing markings outside):
+        inner = []
+        targets = [{} for _ in members]
+        firings = [{} for _ in members]
+        has_exit = False
+        for i, w in enumerate(members):
+            w_targets, w_firings = targets[i], firings[i]
+            for t, p, new_key, _, new_enabled in successors[w]:
+                w_firings[t] = w_firings.get(t, 0.0) + p
+                if new_key in position:
+                    inner.append((i, position[new_key], p))
+                    continue
+                has_exit = True
+                if new_enabled is None:
+                    w_targets[new_key] = w_targets.get(new_key, 0.0) + p
+                else:
+                    child_targets, child_firings = memo[new_key]
+                    for key, q in child_targets.iteritems():
+                        w_targets[key] = w_targets.get(key, 0.0) + p*q
+                    for u, c in child_firings.iteritems():
+                        w_firings[u] = w_firings.get(u, 0.0) + p*c
+
+        if not has_exit:
+            raise Exception('Vanishing loop: marking ' + str(self.net.marking_dict(markings[members[0]]))
+                            + ' is in a closed set of vanishing markings, with no way out to a tangible marking'
+                            + ' (immediate transitions can fire forever).')
+
+        if not inner:
+            for i, w in enumerate(members):
+                memo[w] = (targets[i], firings[i])
+            return
+
+        #Solves (I - P_VV).X = [P_VT, firings] for all the outcome columns at once:
+        n = len(members)
+        target_keys = sorted(set(key for w_targets in targets for key in w_targets))
+        column = dict((key, j) for j, key in enumerate(target_keys))
+        num_targets = len(target_keys)
+        rows, cols, vals = [], [], []
+        for i in xrange(n):
+            for key, q in targets[i].iteritems():
+                rows.append(i)
+                cols.append(column[key])
+                vals.append(q)
+            for u, c in firings[i].iteritems():
+                rows.append(i)
+                cols.append(num_targets + u)
+                vals.append(c)
+        B = sp.csc_matrix((vals, (rows, cols)), shape = (n, num_targets + self.net.num_transitions))
+        i_idx, j_idx, p_vals = zip(*inner)
+        P = sp.csc_matrix((p_vals, (i_idx, j_idx)), shape = (n, n))
+        X = spla.spsolve((sp.identity(n, format = 'csc') - P).tocsc(), B)
+        #With a single outcome column the solution comes back as a dense vector:
+        X = X.tocsr() if sp.issparse(X) else sp.csr_matrix(np.asarray(X).reshape(n, -1))
+
+        for i, w in enumerate(members):
+            w_targets = {}
+            w_firings = {}
+            for j, x in zip(X.indices[X.indptr[i]:X.indptr[i + 1]], X.data[X.indptr[i]:X.indptr[i + 1]]):
+                if x == 0:
+                    continue
+                if j < num_targets:
+                    w_targets[target_keys[j]] = float(x)
+                else:
+                    w_firings[int(j - num_targets)] = float(x)
+            memo[w] = (w_targets, w_firings)
+
+def build_ctmc(petri_net, max_states = None, typecode = None):
+    """Builds the CTMC of a PetriNet (or CompiledNet) with immediate and timed stochastic transitions.
+
+    Tangible markings are explored breadth first. Every timed transition
+    enabled in a tangible marking fires with its rate (single server
+    semantics). Vanishing markings are eliminated as they are found: their
+    probability of reaching every tangible marking is folded into the rates
+    (see _VanishingResolver). Self loops do not appear in Q but do count in
+    transition_rates.
+
+    Keyword Arguments:
+    max_states -- If set, an exception is raised when more tangible markings,
+                  or more vanishing markings, are found.
+    typecode -- Array typecode used to pack markings (see Reachability.marking_typecode).
+
+    Returns a CTMC object.
+    """
+
+    net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+    states = MarkingTable(net.num_places, typecode or marking_typecode(net))
+    pack = states.pack
+    resolver = _VanishingResolver(net, pack, max_states)
+    is_immediate = net._is_immediate
+    rate = net._rate
+
+    rows = array('i')
+    cols = array('i')
+    vals = array('d')
+    rate_rows = array('i')
+    rate_cols = array('i')
+    rate_vals = array('d')
+    absorbing = array('i')
+
+    def add_state(key):
+        state, is_new = states.add(key)
+        if is_new and max_states is not None and len(states) > max_states:
+            raise Exception('The CTMC has more than ' + str(max_states) + ' tangible states.')
+        return state
+
+    marking = [int(m) for m in net.init_marking]
+    enabled = net.enabled_transitions(marking)
+    initial_probs = {}
+    if any(is_immediate[t] for t in enabled):
+        targets, _ = resolver.resolve(pack(marking), marking, enabled)
+        for key, p in sorted(targets.iteritems()):
+            state = add_state(key)
+            initial_probs[state] = initial_probs.get(state, 0.0) + p
+    else:
+        initial_probs[add_state(pack(marking))] = 1.0
+
+    state = 0
+    while state < len(states):
+        marking = states.get(state)
+        enabled = net.enabled_transitions(marking)
+        timed = [t for t in enabled if rate[t] > 0]
+        if not timed:
+            absorbing.append(state)
+
+        for t in timed:
+            r = rate[t]
+            rate_rows.append(state)
+            rate_cols.append(t)
+            rate_vals.append(r)
+
+            new_marking = net.fire(marking, t)
+            new_key = pack(new_marking)
+            new_enabled = net.enabled_transitions(new_marking)
+            if not any(is_immediate[u] for u in new_enabled):
+                targets = ((new_key, 1.0),)
+            else:
+                targets, firings = resolver.resolve(new_key, new_marking, new_enabled)
+                targets = sorted(targets.iteritems())
+                for u, c in firings.iteritems():
+                    rate_rows.append(state)
+                    rate_cols.append(u)
+                    rate_vals.append(r*c)
+
+            for key, p in targets:
+                target = add_state(key)
+                if target != state:
+                    rows.append(state)
+                    cols.append(target)
+                    vals.append(r*p)
+        state += 1
+
+    n = len(states)
+    rows = np.frombuffer(rows, dtype = np.int32) if len(rows) else np.zeros(0, dtype = np.int32)
+    cols = np.frombuffer(cols, dtype = np.int32) if len(cols) else np.zeros(0, dtype = np.int32)
+    vals = np.frombuffer(vals, dtype = np.float64) if len(vals) else np.zeros(0)
+    Q = sp.coo_matrix((vals, (rows, cols)), shape = (n, n)).tocsr()
+    Q = (Q - sp.diags(np.asarray(Q.sum(axis = 1)).ravel(), 0, shape = (n, n))).tocsr()
+    Q.sum_duplicates()
+
+    transition_rates = sp.coo_matrix((np.array(rate_vals, dtype = np.float64),
+                                      (np.array(rate_rows, dtype = np.int32), np.array(rate_cols, dtype = np.int32))),
+                                     shape = (n, net.num_transitions)).tocsr()
+
+    initial = np.zeros(n)
+    for s, p in initial_probs.iteritems():
+        initial[s] = p
+
+    return CTMC(net, states, Q, initial, transition_rates, absorbing)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+import numpy as np
+
+from PetriNets import TransitionTypes
+
+GOAL_REACHED = 'GOAL_REACHED'
+GOAL_NOT_REACHED = 'GOAL_NOT_REACHED'
+
+def _natural_key(node_id):
+    """Sorting key for PNLab ids, so that 'P1000' goes after 'P999'."""
+    return (len(node_id), node_id)
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+class CompiledNet(object):
+    """Compiled, read-only view of a PetriNet object.
+
+    Places and transitions are mapped to contiguous indices (sorted by id) and
+    every numeric attribute is stored in a NumPy vector, so that analysis and
+    simulation engines can work on arrays instead of walking the node and arc
+    dictionaries of the PetriNet.
+
+    The view is a snapshot: changes made to the PetriNet after compiling it
+    are not reflected, a new CompiledNet must be created instead.
+
+    Arcs are stored in CSR form, indexed by transition (pre_ptr, pre_place,
+    pre_weight and post_ptr, post_place, post_weight) and by place
+    (consumers_ptr, consumers and producers_ptr, producers). The dense
+    pre, post and incidence matrices (places x transitions) are built on
+    first access.
+    """
+
+    def __init__(self, petri_net):
+        """CompiledNet constructor
+
+            Positional Arguments:
+            petri_net -- The PetriNet object to compile.
+        """
+
+        super(CompiledNet, self).__init__()
+
+        self.name = petri_net.name
+
+        self.place_ids = tuple(sorted(petri_net.places.iterkeys(), key = _natural_key))
+        self.transition_ids = tuple(sorted(petri_net.transitions.iterkeys(), key = _natural_key))
+        self.place_index = dict((p_id, i) for i, p_id in enumerate(self.place_ids))
+        self.transition_index = dict((t_id, i) for i, t_id in enumerate(self.transition_ids))
+
+        places = [petri_net.places[p_id] for p_id in self.place_ids]
+        transitions = [petri_net.transitions[t_id] for t_id in self.transition_ids]
+
+        self.place_names = tuple(str(p) for p in places)
+        self.place_base_names = tuple(p.name for p in places)
+        self.transition_names = tuple(str(t) for t in transitions)
+
+        self.init_marking = _read_only(np.array([p.init_marking for p in places], dtype = np.int64))
+        self.capacity = _read_only(np.array([p.capacity for p in places], dtype = np.int64))
+        self.rate = _read_only(np.array([t.rate for t in transitions], dtype = np.float64))
+        self.priority = _read_only(np.array([t.priority for t in transitions], dtype = np.int64))
+        self.is_immediate = _read_only(np.array([t.type == TransitionTypes.IMMEDIATE for t in transitions], dtype = np.bool_))
+        
+        #Plain tuples of the above, indexing NumPy arrays one element at a time is slow:
+        self._rate = tuple(float(t.rate) for t in transitions)
+        self._priority = tuple(int(t.priority) for t in transitions)
+        self._is_immediate = tuple(t.type == TransitionTypes.IMMEDIATE for t in transitions)
+
+        pre = [[] for _ in xrange(len(transitions))]
+        post = [[] for _ in xrange(len(transitions))]
+        consumers = [[] for _ in xrange(len(places))]
+        producers = [[] for _ in xrange(len(places))]
+
+        for p_idx, p in enumerate(places):
+            for t_id, arc in p._outgoing_arcs.iteritems():
+                t_idx = self.transition_index[t_id]
+                pre[t_idx].append((p_idx, arc.weight))
+                consumers[p_idx].append(t_idx)
+            for t_id, arc in p._incoming_arcs.iteritems():
+                t_idx = self.transition_index[t_id]
+                post[t_idx].append((p_idx, arc.weight))
+                producers[p_idx].append(t_idx)
+
+        for arcs in pre:
+            arcs.sort()
+        for arcs in post:
+            arcs.sort()
+        for t_list in consumers:
+            t_list.sort()
+        for t_list in producers:
+            t_list.sort()
+
+        #Pure Python adjacency, for engines that work on one marking at a time:
+        self.pre_arcs = tuple(tuple(arcs) for arcs in pre)
+        self.post_arcs = tuple(tuple(arcs) for arcs in post)
+        self.place_consumers = tuple(tuple(t_list) for t_list in consumers)
+        self.place_producers = tuple(tuple(t_list) for t_list in producers)
+
+        #Net token change of every transition and capacity constraints on its output places:
+        delta = [{} for _ in xrange(len(transitions))]
+        for t_idx in xrange(len(transitions)):
+            for p_idx, w in pre[t_idx]:
+                delta[t_idx][p_idx] = delta[t_idx].get(p_idx, 0) - w
+            for p_idx, w in post[t_idx]:
+                delta[t_idx][p_idx] = delta[t_idx].get(p_idx, 0) + w
+        self.delta_arcs = tuple(tuple(sorted((p_idx, d) for p_idx, d in t_delta.iteritems() if d != 0)) for t_delta in delta)
+        self.capacity_arcs = tuple(tuple((p_idx, d, places[p_idx].capacity) for p_idx, d in t_delta if d > 0 and places[p_idx].capacity > 0)
+                                   for t_delta in self.delta_arcs)
+
+        #Transitions whose enabling may change when the marking of a place changes:
+        dependents = [set(t_list) for t_list in consumers]
+        for t_idx, cap_arcs in enumerate(self.capacity_arcs):
+            for p_idx, _, _ in cap_arcs:
+                dependents[p_idx].add(t_idx)
+        self.place_dependents = tuple(tuple(sorted(t_set)) for t_set in dependents)
+
+        self.pre_ptr, self.pre_place, self.pre_weight = self._to_csr(pre)
+        self.post_ptr, self.post_place, self.post_weight = self._to_csr(post)
+        self.consumers_ptr, self.consumers = self._to_csr([[(t, 0) for t in t_list] for t_list in consumers])[:2]
+        self.producers_ptr, self.producers = self._to_csr([[(t, 0) for t in t_list] for t_list in producers])[:2]
+
+        self._pre = None
+        self._post = None
+        self._incidence = None
+
+    @staticmethod
+    def _to_csr(rows):
+        """Aux function that packs a list of (index, value) lists into CSR arrays."""
+
+        ptr = np.zeros(len(rows) + 1, dtype = np.int64)
+        for i, row in enumerate(rows):
+            ptr[i + 1] = ptr[i] + len(row)
+        idx = np.array([k for row in rows for k, _ in row], dtype = np.int64)
+        val = np.array([v for row in rows for _, v in row], dtype = np.int64)
+        return _read_only(ptr), _read_only(idx), _read_only(val)
+
+    @property
+    def num_places(self):
+        return len(self.place_ids)
+
+    @property
+    def num_transitions(self):
+        return len(self.transition_ids)
+
+    @property
+    def pre(self):
+        """Read-only property. Dense |P| x |T| matrix of input arc weights."""
+        if self._pre is None:
+            self._pre = _read_only(self._to_dense(self.pre_ptr, self.pre_place, self.pre_weight))
+        return self._pre
+
+    @property
+    def post(self):
+        """Read-only property. Dense |P| x |T| matrix of output arc weights."""
+        if self._post is None:
+            self._post = _read_only(self._to_dense(self.post_ptr, self.post_place, self.post_weight))
+        return self._post
+
+    @property
+    def incidence(self):
+        """Read-only property. Dense |P| x |T| incidence matrix (post - pre)."""
+        if self._incidence is None:
+            self._incidence = _read_only(self.post - self.pre)
+        return self._incidence
+
+    def _to_dense(self, ptr, idx, val):
+
+        matrix = np.zeros((self.num_places, self.num_transitions), dtype = np.int64)
+        for t in xrange(self.num_transitions):
+            matrix[idx[ptr[t]:ptr[t + 1]], t] = val[ptr[t]:ptr[t + 1]]
+        return matrix
+
+    def sparse_matrices(self):
+        """Returns the pre, post and incidence matrices as SciPy CSC matrices.
+
+        Prefer this to the dense properties for nets with thousands of nodes.
+        Requires SciPy.
+        """
+
+        import scipy.sparse as sp
+
+        shape = (self.num_places, self.num_transitions)
+        pre = sp.csc_matrix((self.pre_weight, self.pre_place, self.pre_ptr), shape = shape)
+        post = sp.csc_matrix((self.post_weight, self.post_place, self.post_ptr), shape = shape)
+        return pre, post, (post - pre).tocsc()
+
+    def is_enabled(self, marking, t):
+        """Checks if transition index 't' is enabled in 'marking' (weights and capacities)."""
+
+        for p, w in self.pre_arcs[t]:
+            if marking[p] < w:
+                return False
+        for p, d, cap in self.capacity_arcs[t]:
+            if marking[p] + d > cap:
+                return False
+        return True
+
+    def enabled_transitions(self, marking):
+        """Returns the indices of all the transitions enabled in 'marking', ignoring priorities."""
+        return [t for t in xrange(self.num_transitions) if self.is_enabled(marking, t)]
+
+    def fireable_transitions(self, enabled):
+        """Filters a collection of enabled transition indices by priority.
+
+        If any immediate transition is enabled, only the immediate transitions
+        with the highest priority can fire. Otherwise every enabled (timed)
+        transition can fire. Returns a sorted list.
+        """
+
+        is_immediate = self._is_immediate
+        immediate = [t for t in enabled if is_immediate[t]]
+        if not immediate:
+            return sorted(enabled)
+        priority = self._priority
+        top = max(priority[t] for t in immediate)
+        return sorted(t for t in immediate if priority[t] == top)
+
+    def fire(self, marking, t):
+        """Returns the marking (as a list) reached after firing transition index 't' from 'marking'.
+
+        No enabling check is done.
+        """
+
+        new_marking = list(marking)
+        for p, d in self.delta_arcs[t]:
+            new_marking[p] += d
+        return new_marking
+
+    def current_marking(self, petri_net):
+        """Returns the current_marking of the PetriNet places as a vector in this view's order."""
+        return np.array([petri_net.places[p_id].current_marking for p_id in self.place_ids], dtype = np.int64)
+
+    def marking_dict(self, marking):
+        """Converts a marking vector into a dictionary with place ids as keys."""
+        return dict((self.place_ids[i], int(marking[i])) for i in xrange(self.num_places))
+
+    def places_named(self, name):
+        """Returns the indices of the places whose name (without prefixes) is 'name'."""
+        return [i for i, base_name in enumerate(self.place_base_names) if base_name == name]
+
+    def goal_places(self):
+        """Returns the indices of the GOAL_REACHED and GOAL_NOT_REACHED places, the ones the computeMC tool looks for."""
+        return self.places_named(GOAL_REACHED) + self.places_named(GOAL_NOT_REACHED)
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+from array import array
+
+import numpy as np
+
+from CompiledNet import CompiledNet
+from Reachability import MarkingTable, ReachabilityGraph
+
+#Value of an omega (arbitrarily large) component in the markings returned by CoverabilityGraph:
+OMEGA = float('inf')
+
+#Omega components are packed as -1, so markings are stored with signed typecodes:
+_PACKED_OMEGA = -1
+_COVER_OMEGA = np.iinfo(np.int64).max
+
+def _pack_omega(marking):
+    return [_PACKED_OMEGA if m == OMEGA else m for m in marking]
+
+def _unpack_omega(values):
+    return [OMEGA if m == _PACKED_OMEGA else m for m in values]
+
+class CoverabilityGraph(ReachabilityGraph):
+    """Karp-Miller coverability graph of a PetriNet.
+
+    States are omega-markings: a component equal to OMEGA means that the
+    place can hold arbitrarily many tokens. Only places without capacity can
+    get an OMEGA component. Every reachable marking is covered by (is less
+    than or equal to) the marking of some state.
+
+    Besides the ReachabilityGraph attributes, 'parent' holds the state from
+    which each state was first reached (-1 for the initial one). An edge can
+    lead to a state whose marking strictly covers the successor marking, when
+    that successor was pruned.
+    """
+
+    def __init__(self, net, states):
+
+        super(CoverabilityGraph, self).__init__(net, states)
+
+        self.parent = array('i')
+        self.pruned = 0
+
+    def marking(self, state):
+        """Returns the marking of a state as a list in the CompiledNet place order (OMEGA for omega components)."""
+        return _unpack_omega(self.states.get(state))
+
+    def marking_dict(self, state):
+        """Returns the marking of a state as a dictionary with place ids as keys (OMEGA for omega components)."""
+        return self.net.marking_dict(self.marking(state))
+
+    def state_id(self, marking):
+        """Returns the id of an omega-marking (sequence or dictionary with place ids as keys), or None."""
+
+        if isinstance(marking, dict):
+            marking = [marking.get(p_id, 0) for p_id in self.net.place_ids]
+        state = self.states.find(self.states.pack(_pack_omega(marking)))
+        return state if state >= 0 else None
+
+    def markings(self):
+        """Returns every state marking as a (states x places) NumPy array, with -1 for omega components."""
+        return self.states.to_numpy()
+
+    def unbounded_places(self):
+        """Returns the ids of the places that get an omega component (the unbounded ones, if the graph is complete)."""
+
+        if not self.num_states:
+            return []
+        omega = (self.markings() == _PACKED_OMEGA).any(axis = 0)
+        return [self.net.place_ids[p] for p in np.flatnonzero(omega)]
+
+    @property
+    def is_bounded(self):
+        """Read-only property. True if no state has an omega component."""
+        return not self.unbounded_places()
+
+    def place_bounds(self):
+        """Returns a dictionary with place ids as keys and the maximum number of tokens as values (OMEGA if unbounded)."""
+
+        markings = self.markings()
+        bounds = {}
+        for p, p_id in enumerate(self.net.place_ids):
+            column = markings[:, p]
+            if (column == _PACKED_OMEGA).any():
+                bounds[p_id] = OMEGA
+            else:
+                bounds[p_id] = int(column.max()) if len(column) else 0
+        return bounds
+
+    def covers(self, marking):
+        """Checks if a marking (sequence or dictionary with place ids as keys) is covered by some state."""
+
+        if isinstance(marking, dict):
+            marking = [marking.get(p_id, 0) for p_id in self.net.place_ids]
+        markings = self.markings().astype(np.int64)
+        markings[markings == _PACKED_OMEGA] = _COVER_OMEGA
+        return bool((markings >= np.asarray(marking, dtype = np.int64)).all(axis = 1).any())
+
+class _CoverIndex(object):
+    """Finds stored omega-markings that cover a new one.
+
+    With capacities the firing rule is not monotonic, so a marking only
+    subsumes another one if it has the same tokens in every capacitated place
+    (and at least as many in the others). Markings are grouped by their
+    capacitated components and each group is checked with NumPy.
+    """
+
+    def __init__(self, net):
+
+        super(_CoverIndex, self).__init__()
+
+        self._capacitated = [p for p in xrange(net.num_places) if net.capacity[p] > 0]
+        self._groups = {}
+
+    def _group_key(self, marking):
+        return tuple(marking[p] for p in self._capacitated)
+
+    def add(self, state, marking):
+
+        group = self._groups.get(self._group_key(marking))
+        if group is None:
+            group = self._groups[self._group_key(marking)] = [array('i'), np.zeros((16, len(marking)), dtype = np.int64), 0]
+        ids, rows, count = group
+        if count == len(rows):
+            rows = group[1] = np.concatenate((rows, np.zeros_like(rows)))
+        rows[count] = [_COVER_OMEGA if m == OMEGA else m for m in marking]
+        ids.append(state)
+        group[2] = count + 1
+
+    def covering(self, marking):
+        """Returns the id of a stored state whose marking covers 'marking', or -1."""
+
+        group = self._groups.get(self._group_key(marking))
+        if group is None:
+            return -1
+        ids, rows, count = group
+        values = np.array([_COVER_OMEGA if m == OMEGA else m for m in marking], dtype = np.int64)
+        found = np.flatnonzero((rows[:count] >= values).all(axis = 1))
+        return ids[found[0]] if len(found) else -1
+
+def coverability_typecode(net):
+    """Chooses the signed array typecode used to pack the omega-markings of a CompiledNet."""
+
+    bound = max([0] + [int(m) for m in net.init_marking] + [int(c) for c in net.capacity])
+    return 'h' if bound <= 0x7FFF else 'i'
+
+def build_coverability_graph(petri_net, max_states = None, stop_on_unbounded = False, prune = True, typecode = None):
+    """Builds the Karp-Miller coverability graph of a PetriNet (or CompiledNet).
+
+    Exploration is breadth first over the Karp-Miller tree: when a new
+    marking is greater than one of its ancestors in every place (and equal in
+    the capacitated ones), the places where it is strictly greater are
+    accelerated to OMEGA. A new marking equal to a stored one is merged with
+    it. If 'prune' is True, a new marking covered by a stored one is not
+    stored nor expanded (its behaviour is included in the one of the covering
+    state), and its edge leads to the covering state.
+
+    Priorities are ignored, as with them the firing rule is not monotonic.
+
+    Keyword Arguments:
+    max_states -- If set, exploration stops once this many states have been
+                  found; the 'complete' attribute of the result is then False.
+    stop_on_unbounded -- If True, exploration stops as soon as a place gets an
+                         omega component; unbounded_places() then returns at
+                         least one place.
+    prune -- Whether to prune markings covered by stored ones. Deadlocks of
+             pruned markings are not detected.
+    typecode -- Signed array typecode used to pack markings (see coverability_typecode).
+
+    Returns a CoverabilityGraph object.
+    """
+
+    net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+    states = MarkingTable(net.num_places, typecode or coverability_typecode(net))
+    graph = CoverabilityGraph(net, states)
+    cover_index = _CoverIndex(net) if prune else None
+
+    edge_source = graph.edge_source
+    edge_target = graph.edge_target
+    edge_transition = graph.edge_transition
+    parent = graph.parent
+    delta_arcs = net.delta_arcs
+    capacity = net.capacity
+    pack = states.pack
+
+    initial = [int(m) for m in net.init_marking]
+    states.add(pack(initial))
+    parent.append(-1)
+    if prune:
+        cover_index.add(0, initial)
+
+    next_state = 0
+    stop = False
+    while next_state < len(states) and not stop:
+        state = next_state
+        next_state += 1
+        marking = graph.marking(state)
+
+        fireable = net.enabled_transitions(marking)
+        if not fireable:
+            graph.dead_states.append(state)
+
+        for t in fireable:
+            new_marking = list(marking)
+            for p, d in delta_arcs[t]:
+                new_marking[p] += d
+
+            #Acceleration against the ancestors (including the expanded state):
+            ancestor = state
+            while ancestor >= 0:
+                old = graph.marking(ancestor)
+                if old != new_marking and all(o <= n if capacity[p] == 0 else o == n
+                                              for p, (o, n) in enumerate(zip(old, new_marking))):
+                    for p in xrange(net.num_places):
+                        if old[p] < new_marking[p]:
+                            new_marking[p] = OMEGA
+                            stop = stop or stop_on_unbounded
+                ancestor = parent[ancestor]
+
+            key = pack(_pack_omega(new_marking))
+            target = states.find(key)
+            if target < 0 and prune:
+                target = cover_index.covering(new_marking)
+                if target >= 0:
+                    graph.pruned += 1
+            if target < 0:
+                target, _ = states.add(key)
+                parent.append(state)
+                if prune:
+                    cover_index.add(target, new_marking)
+
+            edge_source.append(state)
+            edge_target.append(target)
+            edge_transition.append(t)
+
+        graph.expanded += 1
+        if max_states is not None and len(states) >= max_states:
+            break
+
+    graph.complete = graph.expanded == len(states)
+    return graph
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+import heapq
+from fractions import gcd
+
+from CompiledNet import CompiledNet
+
+#Default limit on the number of intermediate rows of the Farkas algorithm:
+MAX_ROWS = 20000
+
+def _popcount(mask):
+    return bin(mask).count('1')
+
+def _combine(a, b, j):
+    """Combines rows a and b (with opposite signs in column j) so that column j cancels out."""
+
+    a_cols, a_coeffs, a_mask = a
+    b_cols, b_coeffs, b_mask = b
+    fa = abs(b_cols[j])
+    fb = abs(a_cols[j])
+
+    cols = {}
+    for k, v in a_cols.iteritems():
+        cols[k] = fa*v
+    for k, v in b_cols.iteritems():
+        v = cols.get(k, 0) + fb*v
+        if v:
+            cols[k] = v
+        else:
+            cols.pop(k, None)
+    coeffs = {}
+    for k, v in a_coeffs.iteritems():
+        coeffs[k] = fa*v
+    for k, v in b_coeffs.iteritems():
+        coeffs[k] = coeffs.get(k, 0) + fb*v
+
+    divisor = 0
+    for v in coeffs.itervalues():
+        divisor = gcd(divisor, v)
+    for v in cols.itervalues():
+        divisor = gcd(divisor, abs(v))
+    if divisor > 1:
+        cols = dict((k, v//divisor) for k, v in cols.iteritems())
+        coeffs = dict((k, v//divisor) for k, v in coeffs.iteritems())
+
+    return cols, coeffs, a_mask | b_mask
+
+def _same_row(a, b):
+    return a[2] == b[2] and a[0] == b[0] and a[1] == b[1]
+
+class _RowSet(object):
+    """Rows of the Farkas algorithm, indexed by the columns and by the supports they contain."""
+
+    def __init__(self):
+
+        super(_RowSet, self).__init__()
+
+        self.rows = {}
+        self.column_rows = {}
+        self.support_rows = {}
+        self.heap = []
+        self._next_id = 0
+
+    def _cost(self, k):
+        """Number of rows added minus the number of rows removed by eliminating column k."""
+
+        ids = self.column_rows[k]
+        num_pos = sum(1 for i in ids if self.rows[i][0][k] > 0)
+        num_neg = len(ids) - num_pos
+        return num_pos*num_neg - num_pos - num_neg
+
+    def _touch(self, columns):
+        for k in columns:
+            if self.column_rows.get(k):
+                heapq.heappush(self.heap, (self._cost(k), k))
+
+    def add(self, rows):
+        touched = set()
+        for row in rows:
+            row_id = self._next_id
+            self._next_id += 1
+            self.rows[row_id] = row
+            for k in row[0]:
+                self.column_rows.setdefault(k, set()).add(row_id)
+            for i in row[1]:
+                self.support_rows.setdefault(i, set()).add(row_id)
+            touched.update(row[0])
+        self._touch(touched)
+
+    def remove(self, row_ids):
+        touched = set()
+        for row_id in row_ids:
+            row = self.rows.pop(row_id)
+            for k in row[0]:
+                self.column_rows[k].discard(row_id)
+            for i in row[1]:
+                self.support_rows[i].discard(row_id)
+            touched.update(row[0])
+        self._touch(touched)
+
+    def next_column(self):
+        """Returns the column generating the fewest new rows, or None if every column is zero."""
+
+        heap = self.heap
+        while heap:
+            cost, k = heap[0]
+            if self.column_rows.get(k) and cost == self._cost(k):
+                return k
+            heapq.heappop(heap)
+        return None
+
+    def dominated(self, row):
+        """Checks if a stored row has a support strictly contained in the one of 'row', or is equal to it."""
+
+        mask = row[2]
+        candidates = set()
+        for i in row[1]:
+            candidates.update(self.support_rows[i])
+        for row_id in candidates:
+            other = self.rows[row_id]
+            if other[2] | mask == mask and (other[2] != mask or _same_row(other, row)):
+                return True
+        return False
+
+    def dominating(self, row):
+        """Returns the ids of the stored rows whose support strictly contains the one of 'row'."""
+
+        sets = sorted((self.support_rows[i] for i in row[1]), key = len)
+        candidates = set.intersection(*sets) if sets else set()
+        mask = row[2]
+        return [row_id for row_id in candidates if self.rows[row_id][2] != mask]
+
+def farkas(columns, num_rows, max_rows = MAX_ROWS):
+    """Computes the minimal-support semi-positive integer solutions of x.C = 0.
+
+    The matrix C is given sparsely, as a list with one dictionary per row
+    ({column: non-zero value}). Columns are eliminated one at a time (the one
+    generating the fewest new rows first) by combining every pair of rows
+    with opposite signs in it. Rows whose support contains the support of
+    another row can never give a minimal-support solution and are dropped
+    as soon as they appear.
+
+    Positional Arguments:
+    columns -- List of num_rows dictionaries, the non-zero entries of every row of C.
+    num_rows -- Number of rows of C.
+
+    Keyword Arguments:
+    max_rows -- If an elimination step would produce more than this many
+                rows, an exception is raised (the number of invariants can
+                grow exponentially with the size of the net).
+
+    Returns a list of dictionaries {row index: positive coefficient}.
+    """
+
+    rows = _RowSet()
+    rows.add((dict(columns[i]), {i: 1}, 1 << i) for i in xrange(num_rows))
+
+    while True:
+        j = rows.next_column()
+        if j is None:
+            break
+
+        ids = rows.column_rows[j]
+        pos = [rows.rows[i] for i in ids if rows.rows[i][0][j] > 0]
+        neg = [rows.rows[i] for i in ids if rows.rows[i][0][j] < 0]
+        if len(pos)*len(neg) > max_rows:
+            raise Exception('Invariant computation aborted: eliminating a column would combine ' + str(len(pos)*len(neg))
+                            + ' pairs of rows (limit ' + str(max_rows) + ').')
+        rows.remove(list(ids))
+
+        #Smallest supports first, so that a row is always checked against the ones it could contain:
+        combined = sorted((_combine(a, b, j) for a in pos for b in neg), key = lambda row: _popcount(row[2]))
+        for row in combined:
+            if rows.dominated(row):
+                continue
+            rows.remove(rows.dominating(row))
+            rows.add([row])
+        if len(rows.rows) > max_rows:
+            raise Exception('Invariant computation aborted: more than ' + str(max_rows) + ' intermediate rows.')
+
+    return [row[1] for _, row in sorted(rows.rows.iteritems())]
+
+def p_invariants(petri_net, max_rows = MAX_ROWS):
+    """Computes the minimal-support P-invariants of a PetriNet (or CompiledNet).
+
+    A P-invariant is a weighting y of the places such that y.C = 0, so the
+    weighted sum of tokens is the same in every reachable marking.
+
+    Returns a list of dictionaries {place id: positive integer weight}.
+    """
+
+    net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+    columns = [{} for _ in xrange(net.num_places)]
+    for t, arcs in enumerate(net.delta_arcs):
+        for p, d in arcs:
+            columns[p][t] = d
+    return [dict((net.place_ids[p], w) for p, w in sorted(inv.iteritems()))
+            for inv in farkas(columns, net.num_places, max_rows)]
+
+def t_invariants(petri_net, max_rows = MAX_ROWS):
+    """Computes the minimal-support T-invariants of a PetriNet (or CompiledNet).
+
+    A T-invariant is a firing count vector x such that C.x = 0: any firing
+    sequence with those counts leads back to the marking it started from.
+
+    Returns a list of dictionaries {transition id: positive integer count}.
+    """
+
+    net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+    columns = [dict(arcs) for arcs in net.delta_arcs]
+    return [dict((net.transition_ids[t], x) for t, x in sorted(inv.iteritems()))
+            for inv in farkas(columns, net.num_transitions, max_rows)]
+
+def invariant_token_sum(petri_net, invariant):
+    """Returns the (constant) weighted token sum of a P-invariant in the initial marking."""
+
+    net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+    return sum(w*int(net.init_marking[net.place_index[p_id]]) for p_id, w in invariant.iteritems())
+
+def _format_invariant(invariant, index, names):
+    return ' + '.join((str(w) + '*' if w != 1 else '') + names[i]
+                      for i, w in sorted((index[node_id], w) for node_id, w in invariant.iteritems()))
+
+def invariants_report(petri_net, max_rows = MAX_ROWS):
+    """Returns a text report with the P- and T-invariants of a PetriNet and the nodes they do not cover."""
+
+    net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+    lines = []
+
+    try:
+        invariants = p_invariants(net, max_rows)
+    except Exception as e:
+        lines.append('P-invariants: ' + str(e))
+    else:
+        lines.append('P-invariants (' + str(len(invariants)) + '):')
+        covered = set()
+        for inv in invariants:
+            covered.update(inv)
+            lines.append('    ' + _format_invariant(inv, net.place_index, net.place_names)
+                         + ' = ' + str(invariant_token_sum(net, inv)))
+        uncovered = [net.place_names[p] for p, p_id in enumerate(net.place_ids) if p_id not in covered]
+        if uncovered:
+            lines.append('Places not covered by any P-invariant (possibly unbounded): ' + ', '.join(uncovered))
+        else:
+            lines.append('Every place is covered by a P-invariant: the net is bounded.')
+
+    lines.append('')
+
+    try:
+        invariants = t_invariants(net, max_rows)
+    except Exception as e:
+        lines.append('T-invariants: ' + str(e))
+    else:
+        lines.append('T-invariants (' + str(len(invariants)) + '):')
+        covered = set()
+        for inv in invariants:
+            covered.update(inv)
+            lines.append('    ' + _format_invariant(inv, net.transition_index, net.transition_names))
+        uncovered = [net.transition_names[t] for t, t_id in enumerate(net.transition_ids) if t_id not in covered]
+        if uncovered:
+            lines.append('Transitions not covered by any T-invariant (cannot fire infinitely often): ' + ', '.join(uncovered))
+        else:
+            lines.append('Every transition is covered by a T-invariant.')
+
+    return '\n'.join(lines)
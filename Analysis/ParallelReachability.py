@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+import mmap
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+import traceback
+import zlib
+from array import array
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+
+from CompiledNet import CompiledNet
+from Reachability import MarkingTable, ReachabilityGraph, marking_typecode, _expand
+
+_CHUNK_STATES = 4096
+_INITIAL_SLOTS = 1024
+#Seconds to wait for a worker process to stop before terminating it:
+_STOP_TIMEOUT = 5
+
+#Slots of the visited tables start with the state id plus one, so 0 marks an empty slot:
+_SLOT_ID = struct.Struct('<i')
+_EMPTY = _SLOT_ID.pack(0)
+
+def _hash(key):
+    """Hash of a packed marking. Must give the same result in every process."""
+    return zlib.crc32(key) & 0xFFFFFFFF
+
+class _VisitedPartition(object):
+    """Open-addressing hash table with the markings owned by one worker, in a memory-mapped file.
+
+    Every process maps the partitions of all the workers, and reads them
+    directly while the frontier is expanded. Only the owner writes to its
+    partition, once every worker is done expanding. When the partition is
+    half full, the owner moves it to a new file twice as large, which the
+    other processes map before the next expansion.
+
+    Every slot holds the state id plus one (0 for empty slots) and the packed
+    marking.
+    """
+
+    def __init__(self, filename, width, slots = None):
+        """_VisitedPartition constructor
+
+            Positional Arguments:
+            filename -- Name of the file of the partition.
+            width -- Width of the packed markings, in bytes.
+
+            Keyword Arguments:
+            slots -- If set, the file is created (or replaced) with this
+                     number of empty slots (a power of 2). Otherwise an
+                     existing file is mapped.
+        """
+
+        super(_VisitedPartition, self).__init__()
+
+        self.filename = filename
+        self.width = width
+        self.slot = _SLOT_ID.size + width
+        self.count = 0
+        with open(filename, 'r+b' if slots is None else 'w+b') as f:
+            if slots is not None:
+                f.truncate(slots*self.slot)
+            self.data = mmap.mmap(f.fileno(), 0)
+        self.mask = len(self.data)//self.slot - 1
+
+    def close(self):
+        self.data.close()
+
+    def find(self, key, h):
+        """Returns the state id of a packed marking with hash 'h', or -1 if it is not in the table."""
+
+        data = self.data
+        slot = self.slot
+        mask = self.mask
+        i = h & mask
+        while True:
+            offset = i*slot
+            head = data[offset:offset + 4]
+            if head == _EMPTY:
+                return -1
+            if data[offset + 4:offset + slot] == key:
+                return _SLOT_ID.unpack(head)[0] - 1
+            i = (i + 1) & mask
+
+    def insert(self, key, h, state):
+        """Inserts a packed marking with hash 'h', known not to be in the table."""
+
+        data = self.data
+        slot = self.slot
+        mask = self.mask
+        i = h & mask
+        while data[i*slot:i*slot + 4] != _EMPTY:
+            i = (i + 1) & mask
+        offset = i*slot
+        data[offset + 4:offset + slot] = key
+        data[offset:offset + 4] = _SLOT_ID.pack(state + 1)
+        self.count += 1
+
+    def grow(self, filename, num_workers):
+        """Moves the partition to a new file with twice as many slots. Returns the new partition."""
+
+        partition = _VisitedPartition(filename, self.width, 2*(self.mask + 1))
+        data = self.data
+        slot = self.slot
+        for offset in xrange(0, len(data), slot):
+            head = data[offset:offset + 4]
+            if head != _EMPTY:
+                key = data[offset + 4:offset + slot]
+                partition.insert(key, _hash(key)//num_workers, _SLOT_ID.unpack(head)[0] - 1)
+        self.close()
+        try:
+            os.remove(self.filename)
+        except OSError:
+            #Still mapped by another process (Windows), removed with the rest of the directory.
+            pass
+        return partition
+
+def _worker(net, priorities, typecode, frontier, filenames, owner, conn):
+    """Worker process main loop.
+
+    A worker expands a slice of the frontier, which the master process writes
+    into the shared 'frontier' buffer, and looks up the successors in the
+    visited partitions of all the workers. It only sends back the edges and
+    the markings it did not find. Afterwards it inserts the new markings that
+    it owns into its own partition.
+
+    Replies are ('ok', result) tuples. If a command fails, the worker sends
+    ('error', traceback) instead and exits.
+    """
+
+    try:
+        _serve(net, priorities, typecode, frontier, filenames, owner, conn)
+    except Exception:
+        try:
+            conn.send(('error', traceback.format_exc()))
+        except (IOError, EOFError):
+            pass
+    finally:
+        conn.close()
+
+def _serve(net, priorities, typecode, frontier, filenames, owner, conn):
+
+    states = MarkingTable(net.num_places, typecode)
+    width = states.width
+    delta_arcs = net.delta_arcs
+    pack = states.pack
+    unpack = states.unpack
+    num_workers = len(filenames)
+    partitions = [_VisitedPartition(filename, width) for filename in filenames]
+    generation = 0
+
+    while True:
+        msg = conn.recv()
+        cmd = msg[0]
+
+        if cmd == 'expand':
+            chunk_start, start, count, filenames = msg[1:]
+            for k, filename in enumerate(filenames):
+                if partitions[k].filename != filename:
+                    partitions[k].close()
+                    partitions[k] = _VisitedPartition(filename, width)
+
+            sources = array('i')
+            transitions = array('i')
+            #Known successors get their state id, new ones -(1 + position in new_keys):
+            targets = array('i')
+            new = {}
+            new_keys = []
+            dead = []
+            for i in xrange(start, start + count):
+                state = chunk_start + i
+                marking = unpack(frontier[i*width:(i + 1)*width])
+                fireable = _expand(net, marking, priorities)
+                if not fireable:
+                    dead.append(state)
+                for t in fireable:
+                    new_marking = list(marking)
+                    for p, d in delta_arcs[t]:
+                        new_marking[p] += d
+                    key = pack(new_marking)
+                    h = _hash(key)
+                    target = partitions[h % num_workers].find(key, h//num_workers)
+                    if target < 0:
+                        target = new.get(key)
+                        if target is None:
+                            target = new[key] = -1 - len(new_keys)
+                            new_keys.append(key)
+                    sources.append(state)
+                    transitions.append(t)
+                    targets.append(target)
+            conn.send(('ok', (sources.tostring(), transitions.tostring(), targets.tostring(), ''.join(new_keys), dead)))
+
+        elif cmd == 'insert':
+            keys, ids = msg[1], array('i')
+            ids.fromstring(msg[2])
+            partition = partitions[owner]
+            for j, state in enumerate(ids):
+                key = keys[j*width:(j + 1)*width]
+                partition.insert(key, _hash(key)//num_workers, state)
+            if 2*partition.count > partition.mask:
+                generation += 1
+                filename = '{0}.{1}'.format(filenames[owner].rsplit('.', 1)[0], generation)
+                partition = partitions[owner] = partition.grow(filename, num_workers)
+            conn.send(('ok', partition.filename))
+
+        elif cmd == 'stop':
+            for partition in partitions:
+                partition.close()
+            return
+
+def _receive(conn):
+    """Returns the reply of a worker process, raising its exceptions again in the master process."""
+
+    try:
+        status, result = conn.recv()
+    except EOFError:
+        raise Exception('A reachability worker process exited unexpectedly.')
+    if status == 'error':
+        raise Exception('A reachability worker process failed:\n' + result)
+    return result
+
+def build_reachability_graph_parallel(petri_net, processes = None, max_states = None, priorities = True, typecode = None, chunk_states = _CHUNK_STATES):
+    """Builds the reachability graph of a PetriNet (or CompiledNet) with a pool of worker processes.
+
+    Exploration is breadth first and gives the same state ids and the same
+    edges (in the same order) as build_reachability_graph(petri_net, 'bfs').
+
+    The frontier is processed in chunks that the master process copies into a
+    shared memory buffer; each worker expands a contiguous slice of it. The
+    visited set is an open-addressing hash table in shared memory (memory
+    mapped files), partitioned by owner: every marking is owned by one worker,
+    the only one that inserts it, but every worker looks up its successors
+    directly. Only the edges and the markings that were not found go back to
+    the master process, which numbers the new markings in discovery order and
+    hands them to their owners.
+
+    Keyword Arguments:
+    processes -- Number of worker processes (defaults to the number of CPUs).
+    max_states -- If set, exploration stops once this many states have been
+                  found (checked after each chunk).
+    priorities -- See build_reachability_graph.
+    typecode -- Array typecode used to pack markings (see marking_typecode).
+    chunk_states -- Number of frontier states sent to the workers at once.
+
+    Returns a ReachabilityGraph object.
+    """
+
+    net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+    states = MarkingTable(net.num_places, typecode or marking_typecode(net))
+    graph = ReachabilityGraph(net, states)
+    width = states.width
+    num_workers = processes or multiprocessing.cpu_count()
+
+    frontier = RawArray('c', max(1, chunk_states*width))
+    tmp_dir = tempfile.mkdtemp(prefix = 'pnlab', dir = '/dev/shm' if os.path.isdir('/dev/shm') else None)
+    filenames = [os.path.join(tmp_dir, 'visited{0}.0'.format(k)) for k in xrange(num_workers)]
+    for filename in filenames:
+        _VisitedPartition(filename, width, _INITIAL_SLOTS).close()
+
+    connections = []
+    workers = []
+    try:
+        for k in xrange(num_workers):
+            master_conn, worker_conn = multiprocessing.Pipe()
+            w = multiprocessing.Process(target = _worker,
+                                        args = (net, priorities, states.typecode, frontier, filenames, k, worker_conn))
+            w.daemon = True
+            w.start()
+            #Only the worker keeps its end, so the master gets an EOFError instead of blocking if the worker dies:
+            worker_conn.close()
+            connections.append(master_conn)
+            workers.append(w)
+
+        def insert(keys):
+            """Numbers new markings (in order) and sends every one of them to its owner."""
+
+            owned_keys = [[] for _ in xrange(num_workers)]
+            owned_ids = [array('i') for _ in xrange(num_workers)]
+            for state, key in enumerate(keys, len(states)):
+                k = _hash(key) % num_workers
+                owned_keys[k].append(key)
+                owned_ids[k].append(state)
+            states.append(''.join(keys))
+
+            busy = [k for k in xrange(num_workers) if owned_ids[k]]
+            for k in busy:
+                connections[k].send(('insert', ''.join(owned_keys[k]), owned_ids[k].tostring()))
+            for k in busy:
+                filenames[k] = _receive(connections[k])
+
+        insert([states.pack([int(m) for m in net.init_marking])])
+
+        level_start = 0
+        stop = False
+        while level_start < len(states) and not stop:
+            level_end = len(states)
+            for chunk_start in xrange(level_start, level_end, chunk_states):
+                chunk_end = min(chunk_start + chunk_states, level_end)
+                count = chunk_end - chunk_start
+                frontier[:count*width] = str(states._data[chunk_start*width:chunk_end*width])
+
+                share = (count + num_workers - 1)//num_workers
+                busy = []
+                for k in xrange(num_workers):
+                    start = k*share
+                    if start >= count:
+                        break
+                    connections[k].send(('expand', chunk_start, start, min(share, count - start), filenames))
+                    busy.append(connections[k])
+
+                #Markings found by several workers are numbered once, the first time they appear:
+                new = {}
+                new_keys = []
+                for conn in busy:
+                    sources, transitions, targets, keys, dead = _receive(conn)
+                    graph.dead_states.extend(dead)
+                    local = array('i')
+                    for j in xrange(0, len(keys), width):
+                        key = keys[j:j + width]
+                        state = new.get(key)
+                        if state is None:
+                            state = new[key] = len(states) + len(new_keys)
+                            new_keys.append(key)
+                        local.append(state)
+                    if local:
+                        targets = np.frombuffer(targets, dtype = np.int32).copy()
+                        is_new = targets < 0
+                        targets[is_new] = np.frombuffer(local, dtype = np.int32)[-1 - targets[is_new]]
+                        targets = targets.tostring()
+                    graph.edge_source.fromstring(sources)
+                    graph.edge_transition.fromstring(transitions)
+                    graph.edge_target.fromstring(targets)
+
+                if new_keys:
+                    insert(new_keys)
+
+                graph.expanded += count
+                if max_states is not None and len(states) >= max_states:
+                    stop = True
+                    break
+
+            level_start = level_end
+    finally:
+        for conn in connections:
+            try:
+                conn.send(('stop',))
+            except (IOError, EOFError):
+                #The worker already exited, after an error.
+                pass
+            conn.close()
+        for w in workers:
+            w.join(_STOP_TIMEOUT)
+            if w.is_alive():
+                w.terminate()
+                w.join()
+        shutil.rmtree(tmp_dir, ignore_errors = True)
+
+    graph.complete = graph.expanded == len(states)
+    return graph
+
+def same_graph(graph, other):
+    """Checks whether two ReachabilityGraph objects have the same state ids, markings and edges."""
+
+    return (graph.num_states == other.num_states
+            and graph.states._data == other.states._data
+            and graph.edge_source == other.edge_source
+            and graph.edge_target == other.edge_target
+            and graph.edge_transition == other.edge_transition
+            and sorted(graph.dead_states) == sorted(other.dead_states))
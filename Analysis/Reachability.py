@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+from array import array
+
+import numpy as np
+
+from CompiledNet import CompiledNet
+
+_NUMPY_TYPES = {'B': np.uint8, 'H': np.uint16, 'I': np.uint32, 'b': np.int8, 'h': np.int16, 'i': np.int32}
+
+def marking_typecode(net):
+    """Chooses the smallest array typecode able to hold every marking of a CompiledNet.
+
+    Nets where every place has a capacity are packed according to the
+    largest capacity (or initial marking). Nets with unbounded places use
+    two bytes per place.
+    """
+
+    bound = max([0] + [int(m) for m in net.init_marking])
+    if net.num_places and all(c > 0 for c in net.capacity):
+        bound = max(bound, int(net.capacity.max()))
+    else:
+        bound = max(bound, 0xFFFF)
+
+    if bound <= 0xFF:
+        return 'B'
+    if bound <= 0xFFFF:
+        return 'H'
+    return 'I'
+
+class MarkingTable(object):
+    """Hash table of markings packed as fixed-width byte strings.
+
+    Markings are stored back to back in a single bytearray and identified by
+    their insertion index (state id). The hash index is an open-addressing
+    array of state ids, so each stored marking costs its packed width plus a
+    few bytes of index, instead of a tuple and a dictionary entry.
+    """
+
+    def __init__(self, num_places, typecode = 'H'):
+
+        super(MarkingTable, self).__init__()
+
+        self.num_places = num_places
+        self.typecode = typecode
+        self.width = num_places*array(typecode).itemsize
+        self._data = bytearray()
+        self._count = 0
+        self._slots = array('i', [-1])*16
+        self._mask = 15
+
+    def __len__(self):
+        return self._count
+
+    def pack(self, marking):
+        """Packs a marking (sequence of integers) into a byte string key."""
+
+        try:
+            return array(self.typecode, marking).tostring()
+        except OverflowError:
+            raise Exception("A marking does not fit in the '" + self.typecode + "' array typecode; the net may be unbounded.")
+
+    def unpack(self, key):
+        """Unpacks a byte string key into a list of integers."""
+
+        values = array(self.typecode)
+        values.fromstring(key)
+        return values.tolist()
+
+    def key(self, state):
+        """Returns the packed key of a state id."""
+
+        offset = state*self.width
+        return str(self._data[offset:offset + self.width])
+
+    def get(self, state):
+        """Returns the marking of a state id as a list of integers."""
+        return self.unpack(self.key(state))
+
+    def _find(self, key):
+
+        slots = self._slots
+        data = self._data
+        width = self.width
+        i = hash(key) & self._mask
+        while True:
+            state = slots[i]
+            if state < 0:
+                return -1
+            offset = state*width
+            if data[offset:offset + width] == key:
+                return state
+            i = (i + 1) & self._mask
+
+    def add(self, key):
+        """Adds a packed marking if it is not already stored.
+
+        Returns a tuple (state id, True if it was added).
+        """
+
+        if self._mask < 0:
+            self._grow()
+        slots = self._slots
+        data = self._data
+        width = self.width
+        i = hash(key) & self._mask
+        while True:
+            state = slots[i]
+            if state < 0:
+                break
+            offset = state*width
+            if data[offset:offset + width] == key:
+                return state, False
+            i = (i + 1) & self._mask
+
+        state = self._count
+        slots[i] = state
+        data.extend(key)
+        self._count += 1
+        if 2*self._count > self._mask:
+            self._grow()
+        return state, True
+
+    def append(self, keys):
+        """Appends packed markings known to be new, without hashing them.
+
+        'keys' is a byte string with one or more packed markings back to back.
+        The hash index is rebuilt the next time it is needed.
+        Returns the state id of the first appended marking.
+        """
+
+        state = self._count
+        self._data.extend(keys)
+        self._count += len(keys)//self.width
+        self._mask = -1
+        return state
+
+    def find(self, key):
+        """Returns the state id of a packed marking, or -1 if it is not in the table."""
+
+        if self._mask < 0:
+            self._grow()
+        return self._find(key)
+
+    def _grow(self):
+        """Rebuilds the hash index, doubling its size (or sizing it for the current count)."""
+
+        size = max(16, 2*(self._mask + 1))
+        while size < 2*self._count + 2:
+            size *= 2
+        mask = size - 1
+        slots = array('i', [-1])*size
+        data = self._data
+        width = self.width
+        for state in xrange(self._count):
+            offset = state*width
+            i = hash(str(data[offset:offset + width])) & mask
+            while slots[i] >= 0:
+                i = (i + 1) & mask
+            slots[i] = state
+        self._slots = slots
+        self._mask = mask
+
+    def to_numpy(self):
+        """Returns every stored marking as a (states x places) NumPy array (a copy)."""
+
+        matrix = np.frombuffer(bytes(self._data), dtype = _NUMPY_TYPES[self.typecode])
+        return matrix.reshape((self._count, self.num_places)).copy()
+
+    @property
+    def nbytes(self):
+        """Read-only property. Approximate memory used by the table, in bytes."""
+        return len(self._data) + len(self._slots)*self._slots.itemsize
+
+class ReachabilityGraph(object):
+    """Reachability graph of a PetriNet.
+
+    States are identified by integer ids (0 is the initial marking) and their
+    markings are kept in a MarkingTable. Edges are stored in three flat
+    arrays: edge_source, edge_target and edge_transition (transition indices
+    of the CompiledNet).
+    """
+
+    def __init__(self, net, states):
+
+        super(ReachabilityGraph, self).__init__()
+
+        self.net = net
+        self.states = states
+        self.edge_source = array('i')
+        self.edge_target = array('i')
+        self.edge_transition = array('i')
+        self.dead_states = array('i')
+        self.expanded = 0
+        self.complete = False
+        self._out_ptr = None
+        self._out_order = None
+
+    @property
+    def num_states(self):
+        return len(self.states)
+
+    @property
+    def num_edges(self):
+        return len(self.edge_source)
+
+    def marking(self, state):
+        """Returns the marking of a state as a list, in the CompiledNet place order."""
+        return self.states.get(state)
+
+    def marking_dict(self, state):
+        """Returns the marking of a state as a dictionary with place ids as keys."""
+        return self.net.marking_dict(self.states.get(state))
+
+    def state_id(self, marking):
+        """Returns the id of a marking (sequence or dictionary with place ids as keys), or None if it was not reached."""
+
+        if isinstance(marking, dict):
+            marking = [marking.get(p_id, 0) for p_id in self.net.place_ids]
+        state = self.states.find(self.states.pack(marking))
+        return state if state >= 0 else None
+
+    def _build_adjacency(self):
+
+        source = np.frombuffer(self.edge_source, dtype = np.int32) if self.num_edges else np.zeros(0, dtype = np.int32)
+        self._out_order = np.argsort(source, kind = 'mergesort')
+        counts = np.bincount(source, minlength = self.num_states)
+        self._out_ptr = np.concatenate(([0], np.cumsum(counts)))
+
+    def successors(self, state):
+        """Returns a list of (transition index, target state) tuples for a state."""
+
+        if self._out_ptr is None or len(self._out_ptr) != self.num_states + 1:
+            self._build_adjacency()
+        edges = self._out_order[self._out_ptr[state]:self._out_ptr[state + 1]]
+        return [(self.edge_transition[e], self.edge_target[e]) for e in edges]
+
+    def edges(self):
+        """Iterates over the edges as (source state, transition id, target state) tuples."""
+
+        transition_ids = self.net.transition_ids
+        for e in xrange(self.num_edges):
+            yield self.edge_source[e], transition_ids[self.edge_transition[e]], self.edge_target[e]
+
+    def deadlocks(self):
+        """Returns the sorted ids of the expanded states in which no transition can fire."""
+        return sorted(self.dead_states)
+
+    def markings(self):
+        """Returns every reached marking as a (states x places) NumPy array."""
+        return self.states.to_numpy()
+
+def _expand(net, marking, priorities):
+    """Returns the transition indices that can fire in 'marking'."""
+
+    enabled = net.enabled_transitions(marking)
+    if priorities:
+        return net.fireable_transitions(enabled)
+    return enabled
+
+def build_reachability_graph(petri_net, order = 'bfs', max_states = None, priorities = True, typecode = None, reduction = None):
+    """Builds the reachability graph of a PetriNet (or CompiledNet).
+
+    Keyword Arguments:
+    order -- 'bfs' (breadth first) or 'dfs' (depth first) exploration order,
+             which also determines the numbering of the states.
+    max_states -- If set, exploration stops once this many states have been
+                  found; the 'complete' attribute of the result is then False.
+    priorities -- If True (default) immediate transitions have precedence over
+                  stochastic ones and higher priorities over lower ones, as in
+                  the TokenGame. If False, every enabled transition can fire.
+    typecode -- Array typecode used to pack markings (see marking_typecode).
+    reduction -- A StubbornSets object. If given, only the transitions of a
+                 stubborn set are fired in each marking, which gives a smaller
+                 graph with the same deadlocks and the same reachability of
+                 the goal places (see StubbornSets). When there are goal
+                 places, a state is fully expanded whenever one of its
+                 reduced successors had already been found, so that no
+                 cycle of reduced states can postpone a transition forever.
+
+    Returns a ReachabilityGraph object.
+    """
+
+    if order not in ('bfs', 'dfs'):
+        raise Exception("Exploration order must be either 'bfs' or 'dfs'.")
+
+    net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+    states = MarkingTable(net.num_places, typecode or marking_typecode(net))
+    graph = ReachabilityGraph(net, states)
+
+    edge_source = graph.edge_source
+    edge_target = graph.edge_target
+    edge_transition = graph.edge_transition
+    delta_arcs = net.delta_arcs
+    pack = states.pack
+    add = states.add
+
+    def add_edge(state, marking, t):
+        """Fires t in the marking of 'state' and stores the edge. Returns True if the target is new."""
+
+        new_marking = list(marking)
+        for p, d in delta_arcs[t]:
+            new_marking[p] += d
+        target, is_new = add(pack(new_marking))
+        if is_new and order == 'dfs':
+            stack.append(target)
+        edge_source.append(state)
+        edge_target.append(target)
+        edge_transition.append(t)
+        return is_new
+
+    states.add(pack([int(m) for m in net.init_marking]))
+    stack = [0]
+    next_state = 0
+
+    while True:
+        if order == 'bfs':
+            if next_state == len(states):
+                break
+            state = next_state
+            next_state += 1
+        else:
+            if not stack:
+                break
+            state = stack.pop()
+
+        marking = states.get(state)
+        if reduction is None:
+            fireable = _expand(net, marking, priorities)
+        else:
+            fireable = reduction.fireable(marking)
+        if not fireable:
+            graph.dead_states.append(state)
+
+        all_new = True
+        for t in fireable:
+            all_new = add_edge(state, marking, t) and all_new
+
+        if reduction is not None and reduction.goal_places and not all_new:
+            reduced = set(fireable)
+            for t in _expand(net, marking, priorities):
+                if t not in reduced:
+                    add_edge(state, marking, t)
+
+        graph.expanded += 1
+        if max_states is not None and len(states) >= max_states:
+            break
+
+    graph.complete = graph.expanded == len(states)
+    return graph
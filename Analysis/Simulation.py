@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+import multiprocessing
+import random
+
+import numpy as np
+from scipy.stats import t as student_t
+
+from CompiledNet import CompiledNet
+from TokenGame import TokenGame
+
+#Default limit on the number of consecutive immediate firings, to detect vanishing loops:
+MAX_IMMEDIATE = 100000
+
+def replicate(net, end_time, warmup = 0.0, seed = None, max_immediate = MAX_IMMEDIATE):
+    """Simulates one run of a CompiledNet from time 0 to end_time (Gillespie's direct method).
+
+    In a tangible marking the time to the next firing is exponential with
+    the sum of the rates of the enabled timed transitions, and each one fires
+    with probability proportional to its rate. In a vanishing marking one of
+    the enabled immediate transitions with the highest priority fires at
+    once, chosen with probability proportional to its weight (the transition
+    rate). Enabling respects arc weights and capacities (see TokenGame).
+
+    Only the interval [warmup, end_time] is observed. A dead marking is kept
+    until end_time.
+
+    Returns (mean tokens, throughputs, number of firings): lists with the
+    time average of the marking of every place and the firings per time unit
+    of every transition over the observed interval.
+    """
+
+    rng = random.Random(seed)
+    game = TokenGame(net)
+    marking = game.marking
+    rate = net._rate
+    delta_arcs = net.delta_arcs
+    enabled_immediate = game._enabled_immediate
+    enabled_timed = game._enabled_timed
+
+    area = [0.0]*net.num_places
+    last = [warmup]*net.num_places
+    firings = [0]*net.num_transitions
+    t = 0.0
+    immediate_run = 0
+
+    while True:
+        if enabled_immediate:
+            immediate_run += 1
+            if immediate_run > max_immediate:
+                raise Exception('Vanishing loop: more than ' + str(max_immediate) + ' consecutive immediate firings in marking '
+                                + str(net.marking_dict(marking)) + '.')
+            candidates = [u for u in net.fireable_transitions(enabled_immediate) if rate[u] > 0]
+            if not candidates:
+                raise Exception('The immediate transitions enabled in marking ' + str(net.marking_dict(marking))
+                                + ' have a total weight of 0.')
+        else:
+            immediate_run = 0
+            candidates = [u for u in enabled_timed if rate[u] > 0]
+            if not candidates:
+                break
+
+        total = 0.0
+        for u in candidates:
+            total += rate[u]
+        if not enabled_immediate:
+            t += rng.expovariate(total)
+            if t >= end_time:
+                break
+
+        x = rng.random()*total
+        for chosen in candidates:
+            x -= rate[chosen]
+            if x < 0:
+                break
+
+        if t >= warmup:
+            firings[chosen] += 1
+            for p, _ in delta_arcs[chosen]:
+                area[p] += marking[p]*(t - last[p])
+                last[p] = t
+        game.fire_index(chosen, check = False)
+
+    observed = end_time - warmup
+    mean_tokens = [(area[p] + marking[p]*(end_time - last[p]))/observed for p in xrange(net.num_places)]
+    throughputs = [f/observed for f in firings]
+    return mean_tokens, throughputs, game.fired
+
+#Net of the worker processes, set once by the pool initializer instead of being sent with every task:
+_worker_net = None
+
+def _init_worker(net):
+    global _worker_net
+    _worker_net = net
+
+def _worker_replicate(args):
+    return replicate(_worker_net, *args)
+
+def _confidence_interval(samples, confidence):
+    """Returns the means and the half widths of the Student t confidence intervals of the columns of 'samples'."""
+
+    n = samples.shape[0]
+    means = samples.mean(axis = 0)
+    if n < 2:
+        return means, np.repeat(np.nan, samples.shape[1])
+    quantile = student_t.ppf((1.0 + confidence)/2.0, n - 1)
+    return means, quantile*samples.std(axis = 0, ddof = 1)/np.sqrt(n)
+
+class SimulationResult(object):
+    """Results of independent simulation replications of a PetriNet.
+
+    Attributes:
+    net -- The simulated CompiledNet.
+    end_time, warmup -- Every replication was observed between warmup and end_time.
+    confidence -- Confidence level of the intervals.
+    seed -- Master seed, the replication seeds are drawn from it.
+    tokens -- NumPy array (replications x places) with the mean tokens of every replication.
+    throughputs -- NumPy array (replications x transitions) with the throughputs of every replication.
+    firings -- Number of firings of every replication.
+    """
+
+    def __init__(self, net, end_time, warmup, confidence, seed, tokens, throughputs, firings):
+
+        super(SimulationResult, self).__init__()
+
+        self.net = net
+        self.end_time = end_time
+        self.warmup = warmup
+        self.confidence = confidence
+        self.seed = seed
+        self.tokens = tokens
+        self.throughputs = throughputs
+        self.firings = firings
+
+    @property
+    def replications(self):
+        return len(self.firings)
+
+    def mean_tokens(self):
+        """Returns a dictionary with place ids as keys and (mean, confidence interval half width) tuples as values."""
+
+        means, half_widths = _confidence_interval(self.tokens, self.confidence)
+        return dict((p_id, (float(means[p]), float(half_widths[p]))) for p, p_id in enumerate(self.net.place_ids))
+
+    def mean_throughputs(self):
+        """Returns a dictionary with transition ids as keys and (mean, confidence interval half width) tuples as values."""
+
+        means, half_widths = _confidence_interval(self.throughputs, self.confidence)
+        return dict((t_id, (float(means[t]), float(half_widths[t]))) for t, t_id in enumerate(self.net.transition_ids))
+
+    def __str__(self):
+
+        net = self.net
+        level = '{0:g}%'.format(100*self.confidence)
+        lines = [str(self.replications) + ' replications of ' + '{0:g}'.format(self.end_time) + ' time units'
+                 + (' (warm-up ' + '{0:g}'.format(self.warmup) + ')' if self.warmup else '')
+                 + ', ' + str(sum(self.firings)) + ' firings, seed ' + str(self.seed) + '.']
+        lines.append('')
+        lines.append('{0:<40}{1:>16}{2:>16}'.format('Place', 'Mean tokens', '+/- (' + level + ')'))
+        tokens = self.mean_tokens()
+        for p, p_id in enumerate(net.place_ids):
+            mean, half_width = tokens[p_id]
+            lines.append('{0:<40}{1:>16.6f}{2:>16.6f}'.format(net.place_names[p][:39], mean, half_width))
+        lines.append('')
+        lines.append('{0:<40}{1:>16}{2:>16}'.format('Transition', 'Throughput', '+/- (' + level + ')'))
+        throughputs = self.mean_throughputs()
+        for t, t_id in enumerate(net.transition_ids):
+            mean, half_width = throughputs[t_id]
+            lines.append('{0:<40}{1:>16.6f}{2:>16.6f}'.format(net.transition_names[t][:39], mean, half_width))
+        return '\n'.join(lines)
+
+def simulate(petri_net, end_time, replications = 10, warmup = 0.0, seed = None, processes = None,
+             confidence = 0.95, max_immediate = MAX_IMMEDIATE):
+    """Runs independent replications of a stochastic simulation of a PetriNet (or CompiledNet), see replicate().
+
+    Every replication has its own random stream, seeded from a master
+    random generator, so results only depend on 'seed' and not on the
+    number of processes or on how replications are scheduled.
+
+    Keyword Arguments:
+    replications -- Number of independent replications.
+    warmup -- Initial time discarded from the statistics of every replication.
+    seed -- Master seed. If None, one is chosen at random (and stored in the result).
+    processes -- Number of worker processes (defaults to the number of CPUs).
+                 With 1 process, replications run in the calling process.
+    confidence -- Confidence level of the intervals reported.
+    max_immediate -- Maximum number of consecutive immediate firings.
+
+    Returns a SimulationResult object.
+    """
+
+    if end_time <= warmup or warmup < 0:
+        raise Exception('The simulation end time must be greater than the warm-up time, which must not be negative.')
+    if replications < 1:
+        raise Exception('At least one replication is needed.')
+
+    net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(32)
+    master = random.Random(seed)
+    tasks = [(end_time, warmup, master.getrandbits(64), max_immediate) for _ in xrange(replications)]
+
+    processes = min(processes or multiprocessing.cpu_count(), replications)
+    if processes == 1:
+        results = [replicate(net, *task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, (net,))
+        try:
+            results = pool.map(_worker_replicate, tasks, chunksize = 1)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    tokens = np.array([r[0] for r in results], dtype = np.float64).reshape(replications, net.num_places)
+    throughputs = np.array([r[1] for r in results], dtype = np.float64).reshape(replications, net.num_transitions)
+    return SimulationResult(net, end_time, warmup, confidence, seed, tokens, throughputs, [r[2] for r in results])
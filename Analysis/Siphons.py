@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+from CompiledNet import CompiledNet
+
+class _Structure(object):
+    """Arcs of a CompiledNet, oriented so that siphons of the structure are siphons of the net.
+
+    A siphon is a set of places S such that every transition putting tokens
+    into S also takes tokens from S. Traps are the siphons of the reversed
+    net, so the same code enumerates both, with the arcs swapped.
+    """
+
+    def __init__(self, net, reverse = False):
+
+        super(_Structure, self).__init__()
+
+        pre = tuple(tuple(p for p, _ in arcs) for arcs in net.pre_arcs)
+        post = tuple(tuple(p for p, _ in arcs) for arcs in net.post_arcs)
+        if reverse:
+            self.inputs, self.outputs = post, pre
+            self.producers, self.consumers = net.place_consumers, net.place_producers
+        else:
+            self.inputs, self.outputs = pre, post
+            self.producers, self.consumers = net.place_producers, net.place_consumers
+
+    def shrink(self, siphon, removed):
+        """Returns the largest siphon contained in a siphon minus the 'removed' places.
+
+        Only the transitions that lose input places need to be checked, so
+        the cost depends on the part of the net affected by the removal.
+        """
+
+        result = set(siphon)
+        count = {}
+        stack = list(removed)
+        while stack:
+            p = stack.pop()
+            if p not in result:
+                continue
+            result.discard(p)
+            for t in self.consumers[p]:
+                if t in count:
+                    count[t] -= 1
+                else:
+                    count[t] = sum(1 for q in self.inputs[t] if q in result)
+                if count[t] == 0:
+                    stack.extend(q for q in self.outputs[t] if q in result)
+        return result
+
+    def maximal(self, places):
+        """Returns the largest siphon contained in a set of place indices."""
+
+        places = set(places)
+        violating = [p for p in places
+                     if any(not any(q in places for q in self.inputs[t]) for t in self.producers[p])]
+        return self.shrink(places, violating)
+
+    def minimal_containing(self, siphon, required):
+        """Returns a siphon contained in 'siphon' which includes 'required' and is minimal among those.
+
+        Places are removed greedily, trying first large groups of them. A
+        place that cannot be removed cannot be removed from any smaller
+        siphon either, so the result is minimal.
+        """
+
+        candidates = sorted(siphon - required)
+        size = max(1, len(candidates)//2)
+        while candidates:
+            smaller = self.shrink(siphon, candidates[:size])
+            if smaller and required <= smaller:
+                siphon = smaller
+                candidates = [p for p in candidates[size:] if p in siphon]
+            elif size > 1:
+                size //= 2
+            else:
+                candidates = candidates[1:]
+                size = max(1, len(candidates)//2)
+        return siphon
+
+    def is_minimal(self, siphon):
+        return all(not self.shrink(siphon, [p]) for p in siphon)
+
+    def enumerate(self, num_places, max_count = None):
+        """Enumerates the minimal siphons of this structure (sets of place indices).
+
+        The search space (siphons within a set of allowed places R that
+        include a set of required places I) is split around a siphon S found
+        in it, minimal among those including I: for every place s_j of S not
+        in I, a subproblem excludes s_j and requires s_1 ... s_j-1. Every
+        siphon other than supersets of S falls in exactly one subproblem, so
+        each minimal siphon is found once. Subproblems are represented by the
+        largest siphon in R, and pruned if it does not include I.
+        """
+
+        result = []
+        root = self.maximal(xrange(num_places))
+        stack = [(root, frozenset())] if root else []
+        while stack:
+            largest, required = stack.pop()
+            siphon = self.minimal_containing(largest, required)
+            if self.is_minimal(siphon):
+                result.append(siphon)
+                if max_count is not None and len(result) > max_count:
+                    raise Exception('Siphon enumeration aborted: more than ' + str(max_count) + ' minimal siphons or traps.')
+            free = sorted(siphon - required)
+            for j, p in enumerate(free):
+                sub_required = required.union(free[:j])
+                sub_largest = self.shrink(largest, [p])
+                if sub_largest and sub_required <= sub_largest:
+                    stack.append((sub_largest, sub_required))
+        return result
+
+def _net(petri_net):
+    return petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+
+def _ids(net, places):
+    return sorted((net.place_ids[p] for p in places), key = net.place_index.get)
+
+def minimal_siphons(petri_net, max_count = None):
+    """Enumerates the minimal siphons of a PetriNet (or CompiledNet).
+
+    A siphon is a set of places such that every transition putting tokens
+    into it also takes tokens from it: once empty, it stays empty.
+
+    Keyword Arguments:
+    max_count -- If set, an exception is raised when more minimal siphons are found.
+
+    Returns a sorted list of lists of place ids.
+    """
+
+    net = _net(petri_net)
+    return sorted(_ids(net, siphon) for siphon in _Structure(net).enumerate(net.num_places, max_count))
+
+def minimal_traps(petri_net, max_count = None):
+    """Enumerates the minimal traps of a PetriNet (or CompiledNet).
+
+    A trap is a set of places such that every transition taking tokens from
+    it also puts tokens into it: once marked, it stays marked.
+
+    Returns a sorted list of lists of place ids.
+    """
+
+    net = _net(petri_net)
+    return sorted(_ids(net, trap) for trap in _Structure(net, reverse = True).enumerate(net.num_places, max_count))
+
+def _unsafe(net, siphons):
+    """Returns (siphon, maximal trap) tuples of place index sets for the siphons without a marked trap."""
+
+    traps = _Structure(net, reverse = True)
+    result = []
+    for siphon in siphons:
+        trap = traps.maximal(siphon)
+        if not any(net.init_marking[p] > 0 for p in trap):
+            result.append((siphon, trap))
+    return result
+
+def unsafe_siphons(petri_net, max_count = None):
+    """Finds the minimal siphons that contain no initially marked trap.
+
+    Such a siphon may be emptied, after which the transitions taking tokens
+    from it are dead: it is a potential cause of deadlock. If every minimal
+    siphon contains a marked trap (Commoner's property), no marking reachable
+    in the net is a total deadlock (for nets where every transition has input
+    places and arc weights are 1).
+
+    Returns a sorted list of (siphon, maximal trap) tuples of lists of place
+    ids, where the maximal trap inside the siphon is empty or unmarked.
+    """
+
+    net = _net(petri_net)
+    siphons = _Structure(net).enumerate(net.num_places, max_count)
+    return sorted((_ids(net, siphon), _ids(net, trap)) for siphon, trap in _unsafe(net, siphons))
+
+def siphons_report(petri_net, max_count = None):
+    """Returns a text report with the minimal siphons and traps of a PetriNet, flagging the unsafe siphons."""
+
+    net = _net(petri_net)
+    names = lambda places: '{' + ', '.join(net.place_names[p] for p in sorted(places)) + '}'
+    lines = []
+
+    siphons = sorted(_Structure(net).enumerate(net.num_places, max_count), key = sorted)
+    unsafe = set(frozenset(siphon) for siphon, _ in _unsafe(net, siphons))
+    lines.append('Minimal siphons (' + str(len(siphons)) + '):')
+    for siphon in siphons:
+        flag = ''
+        if siphon in unsafe:
+            flag = '    [NO MARKED TRAP]' if any(net.init_marking[p] > 0 for p in siphon) else '    [UNMARKED]'
+        lines.append('    ' + names(siphon) + flag)
+
+    traps = sorted(_Structure(net, reverse = True).enumerate(net.num_places, max_count), key = sorted)
+    lines.append('')
+    lines.append('Minimal traps (' + str(len(traps)) + '):')
+    for trap in traps:
+        lines.append('    ' + names(trap))
+
+    lines.append('')
+    if unsafe:
+        lines.append(str(len(unsafe)) + ' siphon(s) contain no marked trap and may be emptied, causing a deadlock.')
+    else:
+        lines.append('Every minimal siphon contains a marked trap.')
+    return '\n'.join(lines)
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from scipy.sparse.csgraph import connected_components
+
+from CTMC import CTMC, build_ctmc
+
+METHODS = ('power', 'gauss-seidel', 'sor', 'gmres', 'bicgstab')
+
+#Order in which methods are tried by the 'auto' method, for irreducible chains:
+_AUTO_METHODS = ('bicgstab', 'gmres', 'gauss-seidel', 'power')
+
+class SteadyState(object):
+    """Steady-state solution of a CTMC.
+
+    Attributes:
+    ctmc -- The solved CTMC object.
+    pi -- Steady-state probability vector (NumPy array, one entry per state).
+    method -- Method that produced the solution.
+    iterations -- Iterations done by that method.
+    residual -- Final residual, |pi.Q|_1 divided by the largest exit rate.
+    history -- Residuals monitored during the iterations (for the Krylov
+               methods, one per iteration; for the others, one per check).
+    attempts -- (method, error message) tuples of the methods that failed
+                before, when using automatic fallback.
+    """
+
+    def __init__(self, ctmc, pi, method, iterations, residual, history, attempts):
+
+        super(SteadyState, self).__init__()
+
+        self.ctmc = ctmc
+        self.pi = pi
+        self.method = method
+        self.iterations = iterations
+        self.residual = residual
+        self.history = history
+        self.attempts = attempts
+
+    def mean_tokens(self):
+        """Returns a dictionary with place ids as keys and the mean number of tokens as values."""
+
+        net = self.ctmc.net
+        means = self.ctmc.markings().T.dot(self.pi) if self.ctmc.num_states else np.zeros(net.num_places)
+        return dict((p_id, float(means[p])) for p, p_id in enumerate(net.place_ids))
+
+    def marked_probability(self):
+        """Returns a dictionary with place ids as keys and the probability of the place being marked as values."""
+
+        net = self.ctmc.net
+        marked = (self.ctmc.markings() > 0).T.dot(self.pi) if self.ctmc.num_states else np.zeros(net.num_places)
+        return dict((p_id, float(marked[p])) for p, p_id in enumerate(net.place_ids))
+
+    def throughputs(self):
+        """Returns a dictionary with transition ids as keys and their mean firing rates as values."""
+
+        net = self.ctmc.net
+        rates = self.ctmc.transition_rates.T.dot(self.pi)
+        return dict((t_id, float(rates[t])) for t, t_id in enumerate(net.transition_ids))
+
+    def __str__(self):
+
+        net = self.ctmc.net
+        lines = ['Steady state of ' + str(self.ctmc.num_states) + ' tangible states, method: ' + self.method
+                 + ', iterations: ' + str(self.iterations) + ', residual: ' + '{0:.3e}'.format(self.residual)]
+        for method, error in self.attempts:
+            lines.append('    (' + method + ' failed: ' + error + ')')
+        lines.append('')
+        lines.append('{0:<40}{1:>16}{2:>16}'.format('Place', 'Mean tokens', 'P(marked)'))
+        means = self.mean_tokens()
+        marked = self.marked_probability()
+        for p, p_id in enumerate(net.place_ids):
+            lines.append('{0:<40}{1:>16.6f}{2:>16.6f}'.format(net.place_names[p][:39], means[p_id], marked[p_id]))
+        lines.append('')
+        lines.append('{0:<40}{1:>16}'.format('Transition', 'Throughput'))
+        throughputs = self.throughputs()
+        for t, t_id in enumerate(net.transition_ids):
+            lines.append('{0:<40}{1:>16.6f}'.format(net.transition_names[t][:39], throughputs[t_id]))
+        return '\n'.join(lines)
+
+class _System(object):
+    """The system pi.Q = 0 in column form: A.x = 0 with A = Q transposed."""
+
+    def __init__(self, ctmc):
+
+        super(_System, self).__init__()
+
+        self.A = ctmc.Q.T.tocsr()
+        self.n = ctmc.num_states
+        exit_rates = ctmc.exit_rates
+        self.scale = float(exit_rates.max()) if self.n and exit_rates.max() > 0 else 1.0
+
+    def residual(self, x):
+        return float(np.abs(self.A.dot(x)).sum())/self.scale
+
+def _normalize(x):
+
+    total = x.sum()
+    if not np.isfinite(total) or total == 0:
+        raise Exception('the iteration diverged.')
+    return x/total
+
+def _probabilities(x):
+    """Normalizes a converged solution, clipping round-off negative entries."""
+
+    x = _normalize(x)
+    if x.min() < -1e-8:
+        raise Exception('the solution has negative probabilities.')
+    x = np.maximum(x, 0.0)
+    return x/x.sum()
+
+def _power(system, x0, tol, max_iterations, monitor, check_every = 10):
+    """Power method on the uniformized chain P = I + Q/lambda."""
+
+    A = system.A
+    lam = system.scale*1.02
+    x = x0.copy()
+    for k in xrange(1, max_iterations + 1):
+        y = A.dot(x)
+        x = x + y/lam
+        if k % check_every == 0 or k == max_iterations:
+            x = _normalize(x)
+            residual = float(np.abs(y).sum())/system.scale
+            monitor(k, residual)
+            if residual < tol:
+                return x, k
+    raise Exception('no convergence after ' + str(max_iterations) + ' iterations.')
+
+def _lower_solver(M):
+    """Factorizes a lower triangular matrix with SuperLU; natural ordering and no pivoting, so there is no fill-in."""
+
+    try:
+        return spla.splu(sp.csc_matrix(M), permc_spec = 'NATURAL', diag_pivot_thresh = 0.0, options = {'SymmetricMode': True})
+    except RuntimeError as e:
+        raise Exception('the triangular factor is singular (' + str(e) + ').')
+
+def _sor(system, x0, tol, max_iterations, monitor, omega = 1.0):
+    """Gauss-Seidel (omega = 1) or SOR iteration, (D + omega.L).x' = ((1 - omega).D - omega.U).x.
+
+    The triangular matrix is factorized once with SuperLU (natural ordering,
+    so there is no fill-in) and every sweep is a compiled triangular solve.
+    """
+
+    #E.g. a chain of one state, whose triangular matrix is singular (its only entry is 0):
+    if system.residual(x0) < tol:
+        return x0, 0
+    A = system.A
+    D = sp.diags(A.diagonal(), 0, format = 'csr')
+    L = sp.tril(A, -1, format = 'csr')
+    U = sp.triu(A, 1, format = 'csr')
+    N = ((1.0 - omega)*D - omega*U).tocsr()
+    lu = _lower_solver(D + omega*L)
+
+    x = x0.copy()
+    for k in xrange(1, max_iterations + 1):
+        x = _normalize(lu.solve(N.dot(x)))
+        residual = system.residual(x)
+        monitor(k, residual)
+        if residual < tol:
+            return x, k
+    raise Exception('no convergence after ' + str(max_iterations) + ' iterations.')
+
+def _krylov_call(solver, B, c, x0, M, tol, max_iterations, callback):
+    """Calls a SciPy Krylov solver, whose tolerance argument is 'rtol' in recent versions and 'tol' in older ones."""
+
+    try:
+        return solver(B, c, x0 = x0, rtol = tol, atol = 0.0, maxiter = max_iterations, M = M, callback = callback)
+    except TypeError:
+        return solver(B, c, x0 = x0, tol = tol, atol = 0.0, maxiter = max_iterations, M = M, callback = callback)
+
+def _krylov(system, method, tol, max_iterations, monitor):
+    """GMRES or BiCGSTAB on the deflated, non-singular system.
+
+    The probability of the state with the largest exit rate is fixed to 1,
+    removing its equation; the rest is solved with a Gauss-Seidel
+    preconditioner (a solve with the lower triangle, which unlike an ILU
+    factorization has no fill-in and scales to millions of states) and the
+    solution is normalized. The chain must be irreducible.
+    """
+
+    A = system.A
+    n = system.n
+    if system.residual(np.ones(n)/n) < tol:
+        return np.ones(n), 0
+    k = int(np.argmax(-A.diagonal()))
+    keep = np.concatenate((np.arange(k), np.arange(k + 1, n)))
+    B = A[keep][:, keep].tocsr()
+    c = -np.asarray(A[keep][:, k].todense()).ravel()
+
+    M = spla.LinearOperator(B.shape, _lower_solver(sp.tril(B, format = 'csc')).solve)
+
+    iterations = [0]
+    def callback(arg):
+        iterations[0] += 1
+        if np.ndim(arg) == 0:
+            monitor(iterations[0], float(arg))
+        elif iterations[0] % 10 == 0:
+            x = np.insert(arg, k, 1.0)
+            monitor(iterations[0], system.residual(x/x.sum()))
+
+    solver = spla.gmres if method == 'gmres' else spla.bicgstab
+    #Starting from every state as likely as state k (a zero guess makes BiCGSTAB break down on cyclic chains):
+    y, info = _krylov_call(solver, B, c, np.ones(n - 1), M, tol, max_iterations, callback)
+
+    #A breakdown can also mean that the exact solution was found:
+    x = np.insert(y, k, 1.0)
+    if info != 0 and not system.residual(_normalize(x)) < tol:
+        if info < 0:
+            raise Exception('breakdown of the ' + method + ' iteration.')
+        raise Exception('no convergence after ' + str(iterations[0]) + ' iterations.')
+    return x, iterations[0]
+
+def is_irreducible(ctmc):
+    """Checks if every state of a CTMC can be reached from every other one."""
+
+    if ctmc.num_states <= 1:
+        return True
+    num_components, _ = connected_components(ctmc.Q, directed = True, connection = 'strong')
+    return num_components == 1
+
+def solve_steady_state(model, method = 'auto', tol = 1e-10, max_iterations = 10000, omega = 1.0, callback = None):
+    """Computes the steady-state probabilities of a CTMC (or of the CTMC of a PetriNet).
+
+    Keyword Arguments:
+    method -- One of METHODS or 'auto'. 'auto' tries, for irreducible
+              chains, BiCGSTAB, GMRES, Gauss-Seidel and the power method in
+              that order, until one converges. For chains that are not
+              irreducible the steady state depends on the initial state and
+              only the power method (started from the initial distribution)
+              is used.
+    tol -- Tolerance on the residual |pi.Q|_1/max exit rate (and the
+           relative residual of the Krylov methods).
+    max_iterations -- Maximum number of iterations of every method.
+    omega -- Relaxation factor of the 'sor' method (between 0 and 2).
+    callback -- Function called with (method, iteration, residual) to
+                monitor the convergence.
+
+    Returns a SteadyState object. Raises an exception if no method converges.
+    """
+
+    ctmc = model if isinstance(model, CTMC) else build_ctmc(model)
+    if method != 'auto' and method not in METHODS:
+        raise Exception("Unknown steady-state method '" + str(method) + "'.")
+
+    system = _System(ctmc)
+    if system.n == 0:
+        raise Exception('The CTMC has no states.')
+
+    irreducible = is_irreducible(ctmc)
+    if method == 'auto':
+        methods = _AUTO_METHODS if irreducible else ('power',)
+    else:
+        methods = (method,)
+
+    attempts = []
+    for m in methods:
+        history = []
+        def monitor(iteration, residual):
+            history.append(residual)
+            if callback is not None:
+                callback(m, iteration, residual)
+        try:
+            if m == 'power':
+                x, iterations = _power(system, ctmc.initial, tol, max_iterations, monitor)
+            elif m in ('gauss-seidel', 'sor'):
+                if not irreducible:
+                    raise Exception('the chain is not irreducible.')
+                x0 = np.ones(system.n)/system.n
+                x, iterations = _sor(system, x0, tol, max_iterations, monitor, omega if m == 'sor' else 1.0)
+            else:
+                if not irreducible:
+                    raise Exception('the chain is not irreducible.')
+                x, iterations = _krylov(system, m, tol, max_iterations, monitor)
+            x = _probabilities(x)
+        except Exception as e:
+            attempts.append((m, str(e)))
+            continue
+        return SteadyState(ctmc, x, m, iterations, system.residual(x), history, attempts)
+
+    raise Exception('No steady-state method converged: ' + '; '.join(m + ': ' + e for m, e in attempts))
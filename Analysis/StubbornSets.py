@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+from CompiledNet import CompiledNet
+
+class StubbornSets(object):
+    """Stubborn set computation for partial-order reduced state-space exploration.
+
+    In every marking only the enabled transitions of a stubborn set are
+    fired. Stubborn sets are closed under the structural relations of the
+    net, computed once:
+    - An enabled transition brings in every transition that consumes from one
+      of its input places, or that puts tokens into one of the capacitated
+      places it puts tokens into (the transitions it is in conflict with).
+    - A disabled transition brings in every transition that can increase the
+      marking of one of its insufficiently marked input places (or decrease
+      the marking of a full capacitated output place).
+
+    This preserves every deadlock of the net. To also preserve the
+    reachability of the goal places, the producers of every unmarked goal
+    place are added to each stubborn set.
+
+    When priorities are taken into account, only the transitions of the
+    highest enabled class (immediate before timed, then higher priority
+    before lower) can fire; every transition of a higher class is added to
+    each stubborn set as a disabled transition, so that no transition
+    outside the set can enable it. An enabled transition that may enable a
+    transition of a higher class could pre-empt the rest of its class, so it
+    brings in every transition that can fire.
+    """
+
+    def __init__(self, petri_net, goal_places = None, priorities = True, max_seeds = 8):
+        """StubbornSets constructor
+
+            Positional Arguments:
+            petri_net -- A PetriNet or CompiledNet object.
+
+            Keyword Arguments:
+            goal_places -- Place ids whose reachability (being marked) must be
+                           preserved. Defaults to the GOAL_REACHED and
+                           GOAL_NOT_REACHED places.
+            priorities -- See Reachability.build_reachability_graph.
+            max_seeds -- Number of enabled transitions tried as the starting
+                         point of the stubborn set; the smallest result is kept.
+        """
+
+        super(StubbornSets, self).__init__()
+
+        net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+        self.net = net
+        self.priorities = priorities
+        self.max_seeds = max_seeds
+
+        if goal_places is None:
+            self.goal_places = net.goal_places()
+        else:
+            self.goal_places = [net.place_index[p_id] for p_id in goal_places]
+
+        increasing = [[] for _ in xrange(net.num_places)]
+        decreasing = [[] for _ in xrange(net.num_places)]
+        for t in xrange(net.num_transitions):
+            for p, d in net.delta_arcs[t]:
+                if d > 0:
+                    increasing[p].append(t)
+                else:
+                    decreasing[p].append(t)
+        self._increasing = increasing
+        self._decreasing = decreasing
+
+        conflicts = []
+        for t in xrange(net.num_transitions):
+            t_conflicts = set()
+            for p, _ in net.pre_arcs[t]:
+                t_conflicts.update(net.place_consumers[p])
+            for p, _, _ in net.capacity_arcs[t]:
+                t_conflicts.update(increasing[p])
+            t_conflicts.discard(t)
+            conflicts.append(tuple(sorted(t_conflicts)))
+        self._conflicts = conflicts
+
+        if priorities:
+            self._level = [(net._is_immediate[t], net._priority[t] if net._is_immediate[t] else 0) for t in xrange(net.num_transitions)]
+        else:
+            self._level = [(False, 0)]*net.num_transitions
+
+        #Transitions that may enable one of a higher class, which would pre-empt
+        #every other transition of their own class:
+        level = self._level
+        self._may_preempt = [False]*net.num_transitions
+        for h in xrange(net.num_transitions):
+            enablers = set()
+            for p, _ in net.pre_arcs[h]:
+                enablers.update(increasing[p])
+            for p, _, _ in net.capacity_arcs[h]:
+                enablers.update(decreasing[p])
+            for t in enablers:
+                if level[t] < level[h]:
+                    self._may_preempt[t] = True
+
+    def _scapegoat(self, marking, t):
+        """Returns the transitions that may enable the disabled transition t."""
+
+        net = self.net
+        for p, w in net.pre_arcs[t]:
+            if marking[p] < w:
+                return self._increasing[p]
+        for p, d, cap in net.capacity_arcs[t]:
+            if marking[p] + d > cap:
+                return self._decreasing[p]
+        return ()
+
+    def _closure(self, marking, seeds, fireable, level):
+
+        stubborn = set()
+        stack = list(seeds)
+        while stack:
+            t = stack.pop()
+            if t in stubborn:
+                continue
+            stubborn.add(t)
+            if t in fireable:
+                if self._may_preempt[t]:
+                    stack.extend(fireable)
+                stack.extend(self._conflicts[t])
+            elif self._level[t] >= level:
+                stack.extend(self._scapegoat(marking, t))
+        return stubborn
+
+    def fireable(self, marking):
+        """Returns the sorted indices of the transitions to fire in 'marking'."""
+
+        net = self.net
+        enabled = net.enabled_transitions(marking)
+        if not enabled:
+            return []
+        level = max(self._level[t] for t in enabled)
+        fireable = set(t for t in enabled if self._level[t] == level)
+        if len(fireable) == 1:
+            return list(fireable)
+
+        seeds = [t for t in xrange(net.num_transitions) if self._level[t] > level]
+        for p in self.goal_places:
+            if marking[p] == 0:
+                seeds.extend(self._increasing[p])
+
+        best = None
+        for t in sorted(fireable)[:self.max_seeds]:
+            stubborn = self._closure(marking, seeds + [t], fireable, level)
+            candidate = fireable.intersection(stubborn)
+            if best is None or len(candidate) < len(best):
+                best = candidate
+                if len(best) == 1:
+                    break
+        return sorted(best)
+
+class ReductionReport(object):
+    """Side by side comparison of a full and a stubborn-set reduced reachability graph."""
+
+    def __init__(self, full, reduced, goal_places):
+
+        super(ReductionReport, self).__init__()
+
+        self.full = full
+        self.reduced = reduced
+        self.goal_places = goal_places
+
+    def _summary(self, graph):
+
+        markings = graph.markings()
+        goals = dict((graph.net.place_ids[p], bool((markings[:, p] > 0).any()) if graph.num_states else False)
+                     for p in self.goal_places)
+        return {
+                'states': graph.num_states,
+                'edges': graph.num_edges,
+                'deadlocks': len(graph.dead_states),
+                'complete': graph.complete,
+                'goals': goals
+                }
+
+    def __str__(self):
+
+        full = self._summary(self.full)
+        reduced = self._summary(self.reduced)
+        lines = ['{0:<24}{1:>14}{2:>14}'.format('', 'Full', 'Stubborn')]
+        for key in ('states', 'edges', 'deadlocks', 'complete'):
+            lines.append('{0:<24}{1:>14}{2:>14}'.format(key.capitalize(), str(full[key]), str(reduced[key])))
+        for p_id in sorted(full['goals']):
+            label = 'Reaches ' + self.full.net.place_names[self.full.net.place_index[p_id]]
+            lines.append('{0:<24}{1:>14}{2:>14}'.format(label[:23], str(full['goals'][p_id]), str(reduced['goals'][p_id])))
+        if full['states']:
+            lines.append('State reduction: {0:.1f}%'.format(100.0*(1.0 - float(reduced['states'])/full['states'])))
+        return '\n'.join(lines)
+
+def reduction_report(petri_net, goal_places = None, priorities = True, max_states = None):
+    """Builds the full and the stubborn-set reduced reachability graphs of a PetriNet.
+
+    Returns a ReductionReport; str() of it gives a side by side table of
+    state, edge and deadlock counts and goal place reachability.
+    """
+
+    from Reachability import build_reachability_graph
+
+    net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+    reduction = StubbornSets(net, goal_places, priorities)
+    full = build_reachability_graph(net, max_states = max_states, priorities = priorities)
+    reduced = build_reachability_graph(net, max_states = max_states, priorities = priorities, reduction = reduction)
+    return ReductionReport(full, reduced, reduction.goal_places)
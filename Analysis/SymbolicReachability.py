@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+import sys
+
+from CompiledNet import CompiledNet
+
+class SymbolicStateSpace(object):
+    """Reachable markings of a PetriNet encoded as a multi-valued decision diagram (MDD).
+
+    Every place is one level of the MDD (level 1 is the bottom one, level K
+    the top one) and its domain is 0..bound, where the bound is the place
+    capacity or, for unbounded places, a value given by the caller. The MDD
+    is quasi-reduced: every path from the root goes through all the levels.
+    Node 0 is the empty set and node 1 the terminal node.
+
+    The reachable set is computed with the saturation strategy: transitions
+    are grouped by their top level and fired exhaustively, bottom-up, so that
+    every node is saturated (closed under the transitions below it) before
+    it is used.
+
+    Priorities are not taken into account: the result is the reachable set
+    of the underlying P/T net, which contains the markings reachable when
+    immediate transitions pre-empt timed ones.
+    """
+
+    def __init__(self, petri_net, bounds = None, default_bound = None, order = None):
+        """SymbolicStateSpace constructor. Computes the reachable set.
+
+            Positional Arguments:
+            petri_net -- A PetriNet or CompiledNet object.
+
+            Keyword Arguments:
+            bounds -- Dictionary with place ids as keys and token bounds as
+                      values, for places without capacity.
+            default_bound -- Bound for the places without capacity that are
+                             not in 'bounds'. If a transition would exceed a
+                             bound that is not a capacity, an exception is raised.
+            order -- List of place ids from the top level to the bottom one.
+                     Defaults to the reverse of the CompiledNet place order.
+        """
+
+        super(SymbolicStateSpace, self).__init__()
+
+        net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+        self.net = net
+        bounds = bounds or {}
+
+        if order is None:
+            order = list(reversed(net.place_ids))
+        if sorted(order) != sorted(net.place_ids):
+            raise Exception('The variable order must contain every place id exactly once.')
+
+        self.num_levels = net.num_places
+        #_level_place[k] is the place index at level k (level 0 is the terminal level):
+        self._level_place = [None] + [net.place_index[p_id] for p_id in reversed(order)]
+        self._place_level = dict((p, k) for k, p in enumerate(self._level_place) if k > 0)
+
+        self._bound = [0]
+        self._hard_bound = [True]
+        for k in xrange(1, self.num_levels + 1):
+            p = self._level_place[k]
+            p_id = net.place_ids[p]
+            if net.capacity[p] > 0:
+                bound, hard = int(net.capacity[p]), True
+            elif p_id in bounds:
+                bound, hard = int(bounds[p_id]), False
+            elif default_bound is not None:
+                bound, hard = int(default_bound), False
+            else:
+                raise Exception("Place '" + p_id + "' has no capacity, a bound must be given for it.")
+            if net.init_marking[p] > bound:
+                raise Exception("The initial marking of place '" + p_id + "' exceeds its bound.")
+            self._bound.append(bound)
+            self._hard_bound.append(hard)
+
+        #Local effect of every transition on the levels it touches, as (pre, post) tuples:
+        self._effects = []
+        self._top = []
+        self._bottom = []
+        self._events_at = [[] for _ in xrange(self.num_levels + 1)]
+        for t in xrange(net.num_transitions):
+            effect = {}
+            for p, w in net.pre_arcs[t]:
+                effect[self._place_level[p]] = (w, 0)
+            for p, w in net.post_arcs[t]:
+                k = self._place_level[p]
+                effect[k] = (effect.get(k, (0, 0))[0], w)
+            self._effects.append(effect)
+            if effect:
+                top = max(effect)
+                self._top.append(top)
+                self._bottom.append(min(effect))
+                self._events_at[top].append(t)
+            else:
+                self._top.append(0)
+                self._bottom.append(0)
+
+        self._children = [None, None]
+        self._levels = [0, 0]
+        self._unique = {}
+        self._union_cache = {}
+        self._fire_cache = {}
+        self._saturated = {0: 0, 1: 1}
+
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(recursion_limit, 4*self.num_levels + 1000))
+        try:
+            self.root = self._saturate(self.num_levels, self._initial_node())
+        finally:
+            sys.setrecursionlimit(recursion_limit)
+            self._union_cache = {}
+            self._fire_cache = {}
+        self._counts = None
+
+    def _node(self, k, children):
+        """Returns the unique node at level k with the given children (a tuple)."""
+
+        if not any(children):
+            return 0
+        key = (k, children)
+        node = self._unique.get(key)
+        if node is None:
+            node = len(self._children)
+            self._children.append(children)
+            self._levels.append(k)
+            self._unique[key] = node
+        return node
+
+    def _initial_node(self):
+
+        node = 1
+        marking = self.net.init_marking
+        for k in xrange(1, self.num_levels + 1):
+            children = [0]*(self._bound[k] + 1)
+            children[int(marking[self._level_place[k]])] = node
+            node = self._node(k, tuple(children))
+        return node
+
+    def _local(self, t, k, i):
+        """Value at level k after firing transition t from value i, or None if t is disabled.
+
+        The value can exceed a bound that is not a capacity; callers raise
+        an exception only if the transition turns out to be enabled below.
+        """
+
+        effect = self._effects[t].get(k)
+        if effect is None:
+            return i
+        pre, post = effect
+        if i < pre:
+            return None
+        j = i - pre + post
+        if j > self._bound[k] and self._hard_bound[k]:
+            return None
+        return j
+
+    def _check_bound(self, k, j):
+        """Raises an exception if value j is out of the domain of level k."""
+
+        if j > self._bound[k]:
+            raise Exception("Place '" + self.net.place_ids[self._level_place[k]] + "' exceeds its bound of "
+                            + str(self._bound[k]) + ' tokens, a larger bound is needed.')
+
+    def _union(self, k, a, b):
+
+        if a == 0 or a == b:
+            return b
+        if b == 0:
+            return a
+        if k == 0:
+            return 1
+        key = (a, b) if a < b else (b, a)
+        result = self._union_cache.get(key)
+        if result is None:
+            ca = self._children[a]
+            cb = self._children[b]
+            result = self._node(k, tuple(self._union(k - 1, x, y) for x, y in zip(ca, cb)))
+            #Unions are only taken of saturated nodes, and a union of saturated sets is saturated:
+            self._saturated[result] = result
+            self._union_cache[key] = result
+        return result
+
+    def _saturate(self, k, node):
+        """Returns the saturated version of a node at level k."""
+
+        result = self._saturated.get(node)
+        if result is not None:
+            return result
+
+        children = [self._saturate(k - 1, c) for c in self._children[node]]
+        events = self._events_at[k]
+        changed = True
+        while changed:
+            changed = False
+            for t in events:
+                for i in xrange(len(children)):
+                    if children[i] == 0:
+                        continue
+                    j = self._local(t, k, i)
+                    if j is None:
+                        continue
+                    f = self._fire(t, k - 1, children[i])
+                    if f == 0:
+                        continue
+                    self._check_bound(k, j)
+                    u = self._union(k - 1, f, children[j])
+                    if u != children[j]:
+                        children[j] = u
+                        changed = True
+
+        result = self._node(k, tuple(children))
+        self._saturated[node] = result
+        self._saturated[result] = result
+        return result
+
+    def _fire(self, t, k, node):
+        """Fires transition t on the levels k and below of a saturated node; returns a saturated node."""
+
+        if node == 0 or k < self._bottom[t]:
+            return node
+        key = (t, node)
+        result = self._fire_cache.get(key)
+        if result is not None:
+            return result
+
+        children = [0]*(self._bound[k] + 1)
+        for i, c in enumerate(self._children[node]):
+            if c == 0:
+                continue
+            j = self._local(t, k, i)
+            if j is None:
+                continue
+            f = self._fire(t, k - 1, c)
+            if f:
+                self._check_bound(k, j)
+                children[j] = self._union(k - 1, f, children[j])
+
+        result = self._saturate(k, self._node(k, tuple(children)))
+        self._fire_cache[key] = result
+        return result
+
+    @property
+    def num_nodes(self):
+        """Read-only property. Number of MDD nodes created (including the non-reachable intermediate ones)."""
+        return len(self._children)
+
+    def count(self):
+        """Returns the number of reachable markings (a Python long, no enumeration is done)."""
+
+        if self._counts is None:
+            counts = {0: 0, 1: 1}
+            stack = [self.root]
+            while stack:
+                node = stack[-1]
+                if node in counts:
+                    stack.pop()
+                    continue
+                pending = [c for c in self._children[node] if c not in counts]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                counts[node] = sum(counts[c] for c in self._children[node])
+                stack.pop()
+            self._counts = counts
+        return self._counts[self.root]
+
+    def contains(self, marking):
+        """Checks if a marking (sequence in CompiledNet order or dictionary with place ids as keys) is reachable."""
+
+        if isinstance(marking, dict):
+            marking = [marking.get(p_id, 0) for p_id in self.net.place_ids]
+        node = self.root
+        for k in xrange(self.num_levels, 0, -1):
+            value = marking[self._level_place[k]]
+            children = self._children[node]
+            if value < 0 or value >= len(children):
+                return False
+            node = children[value]
+            if node == 0:
+                return False
+        return node == 1
+
+    def __contains__(self, marking):
+        return self.contains(marking)
+
+    def reachable_nodes(self):
+        """Returns the number of MDD nodes reachable from the root (the size of the encoding)."""
+
+        seen = set([self.root])
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if self._levels[node] == 0:
+                continue
+            for c in self._children[node]:
+                if c > 1 and c not in seen:
+                    seen.add(c)
+                    stack.append(c)
+        return len(seen)
+
+    def iter_markings(self):
+        """Generator of the reachable markings, as lists in CompiledNet order. Only practical for small sets."""
+
+        marking = [0]*self.net.num_places
+        stack = [(self.root, self.num_levels, 0)]
+        while stack:
+            node, k, i = stack.pop()
+            if k == 0:
+                yield list(marking)
+                continue
+            children = self._children[node]
+            while i < len(children) and children[i] == 0:
+                i += 1
+            if i == len(children):
+                continue
+            stack.append((node, k, i + 1))
+            marking[self._level_place[k]] = i
+            stack.append((children[i], k - 1, 0))
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+from CompiledNet import CompiledNet
+
+class TokenGame(object):
+    """Firing engine (token game) for a PetriNet object.
+
+    Keeps the current marking and the set of enabled transitions. After each
+    firing only the transitions that depend on the places whose marking
+    changed are re-checked (see CompiledNet.place_dependents), instead of
+    checking every transition of the net.
+
+    Enabling respects arc weights and place capacities (a capacity of 0 means
+    unbounded). If any immediate transition is enabled, only the immediate
+    transitions with the highest priority can fire; timed stochastic
+    transitions can only fire when no immediate transition is enabled.
+    """
+
+    def __init__(self, petri_net, marking = None):
+        """TokenGame constructor
+
+            Positional Arguments:
+            petri_net -- A PetriNet object. It is compiled once, later changes
+                         to its structure are not seen by the engine. A
+                         CompiledNet can also be given, but then the
+                         current_marking methods are not available.
+
+            Keyword Arguments:
+            marking -- Initial marking, see reset(). Defaults to the
+                       places' initial marking.
+        """
+
+        super(TokenGame, self).__init__()
+
+        self.petri_net = petri_net
+        self.net = petri_net if isinstance(petri_net, CompiledNet) else CompiledNet(petri_net)
+        self.reset(marking)
+
+    def reset(self, marking = None):
+        """Sets the current marking and recomputes the enabled set from scratch.
+
+        'marking' can be None (use the places' init_marking), a dictionary
+        with place ids as keys or a sequence in the CompiledNet place order.
+        """
+
+        net = self.net
+        if marking is None:
+            self.marking = [int(m) for m in net.init_marking]
+        elif isinstance(marking, dict):
+            self.marking = [int(marking.get(p_id, 0)) for p_id in net.place_ids]
+        else:
+            if len(marking) != net.num_places:
+                raise Exception('Marking length does not match the number of places.')
+            self.marking = [int(m) for m in marking]
+
+        self._enabled_immediate = set()
+        self._enabled_timed = set()
+        for t in xrange(net.num_transitions):
+            self._update(t)
+
+        self.fired = 0
+
+    def load_current_marking(self):
+        """Resets the engine to the current_marking attribute of the PetriNet places."""
+        self.reset(self.net.current_marking(self.petri_net))
+
+    def store_current_marking(self):
+        """Writes the engine's marking into the current_marking attribute of the PetriNet places."""
+
+        places = self.petri_net.places
+        for p_id, m in zip(self.net.place_ids, self.marking):
+            places[p_id].current_marking = m
+
+    def _update(self, t):
+        """Re-checks the enabling of transition index 't'."""
+
+        if self.net._is_immediate[t]:
+            enabled_set = self._enabled_immediate
+        else:
+            enabled_set = self._enabled_timed
+
+        if self.net.is_enabled(self.marking, t):
+            enabled_set.add(t)
+        else:
+            enabled_set.discard(t)
+
+    @property
+    def enabled(self):
+        """Read-only property. Set of indices of the enabled transitions, ignoring priorities."""
+        return self._enabled_immediate | self._enabled_timed
+
+    @property
+    def is_dead(self):
+        """Read-only property. True if no transition is enabled."""
+        return not (self._enabled_immediate or self._enabled_timed)
+
+    @property
+    def is_vanishing(self):
+        """Read-only property. True if an immediate transition is enabled."""
+        return bool(self._enabled_immediate)
+
+    def fireable_indices(self):
+        """Returns the sorted indices of the transitions that can fire, taking priorities into account."""
+
+        if self._enabled_immediate:
+            return self.net.fireable_transitions(self._enabled_immediate)
+        return sorted(self._enabled_timed)
+
+    def fireable(self):
+        """Returns the ids of the transitions that can fire, taking priorities into account."""
+        return [self.net.transition_ids[t] for t in self.fireable_indices()]
+
+    def fire_index(self, t, check = True):
+        """Fires transition index 't' and updates the enabled set incrementally.
+
+        If 'check' is True, an exception is raised when the transition
+        cannot fire in the current marking.
+        Returns the indices of the places whose marking changed.
+        """
+
+        net = self.net
+        if check and t not in self.fireable_indices():
+            raise Exception("Transition '" + net.transition_ids[t] + "' cannot fire in the current marking.")
+
+        marking = self.marking
+        changed = []
+        for p, d in net.delta_arcs[t]:
+            marking[p] += d
+            changed.append(p)
+
+        affected = set()
+        for p in changed:
+            affected.update(net.place_dependents[p])
+        for t_dep in affected:
+            self._update(t_dep)
+
+        self.fired += 1
+        return changed
+
+    def fire(self, transition):
+        """Fires a transition, given as a Transition object or its id [i. e. repr(transition_obj)].
+
+        Raises an exception if the transition cannot fire in the current marking.
+        Returns the ids of the places whose marking changed.
+        """
+
+        t = self.net.transition_index[repr(transition) if not isinstance(transition, basestring) else transition]
+        return [self.net.place_ids[p] for p in self.fire_index(t)]
+
+    def marking_dict(self):
+        """Returns the current marking as a dictionary with place ids as keys."""
+        return self.net.marking_dict(self.marking)
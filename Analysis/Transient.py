@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+import math
+
+import numpy as np
+import scipy.sparse as sp
+
+from CompiledNet import GOAL_REACHED
+from CTMC import CTMC, build_ctmc
+
+def fox_glynn(qt, epsilon = 1e-10):
+    """Computes the Poisson(qt) probabilities needed to keep the truncation error below epsilon.
+
+    Following Fox and Glynn, the weights are computed from the mode outwards
+    with the recurrences w(i+1) = w(i).qt/(i+1) and w(i-1) = w(i).i/qt,
+    starting from w(mode) = 1, so that nothing overflows or underflows, and
+    normalized at the end. Each tail is cut when a geometric bound of its
+    remaining mass falls below epsilon/2.
+
+    Returns (left, right, weights), where weights[k] is the probability of
+    left + k events, for k = 0 ... right - left.
+    """
+
+    if qt < 0:
+        raise Exception('The Poisson parameter must not be negative.')
+    if qt == 0:
+        return 0, 0, np.ones(1)
+
+    qt = float(qt)
+    mode = int(math.floor(qt))
+    upper = [1.0]
+    lower = []
+    total = 1.0
+
+    #Right tail: the ratios qt/(i+1) are smaller than 1 and decreasing beyond the mode.
+    i = mode
+    w = 1.0
+    while True:
+        r = qt/(i + 1)
+        if w*r/(1.0 - r) <= epsilon/2*total:
+            break
+        w *= r
+        i += 1
+        upper.append(w)
+        total += w
+    right = i
+
+    #Left tail: the ratios i/qt are smaller than 1 and decreasing below the mode.
+    i = mode
+    w = 1.0
+    while i > 0:
+        r = i/qt
+        if r < 1.0 and w*r/(1.0 - r) <= epsilon/2*total:
+            break
+        w *= r
+        i -= 1
+        lower.append(w)
+        total += w
+    left = i
+
+    lower.reverse()
+    weights = np.array(lower + upper)
+    return left, right, weights/weights.sum()
+
+class Transient(object):
+    """Transient solution of a CTMC over a grid of time points.
+
+    Attributes:
+    ctmc -- The solved CTMC object.
+    times -- NumPy array with the time points.
+    probabilities -- NumPy array (time points x states) with the state
+                     probabilities at every time point.
+    goal_states -- Boolean NumPy array marking the goal states, which were
+                   made absorbing, or None if there was no goal.
+    steps -- Number of vector-matrix products done.
+    steady_state_step -- Step at which the uniformized chain reached its
+                         steady state (the remaining Poisson terms were
+                         added at once), or None.
+    """
+
+    def __init__(self, ctmc, times, probabilities, goal_states, steps, steady_state_step):
+
+        super(Transient, self).__init__()
+
+        self.ctmc = ctmc
+        self.times = times
+        self.probabilities = probabilities
+        self.goal_states = goal_states
+        self.steps = steps
+        self.steady_state_step = steady_state_step
+
+    def probability(self, states):
+        """Returns the probability of being in any of the states given (ids or a boolean mask), at every time point."""
+        return self.probabilities[:, states].sum(axis = 1) if len(self.ctmc.states) else np.zeros(len(self.times))
+
+    @property
+    def goal_probability(self):
+        """Read-only property. Probability of having reached the goal by every time point, or None if there was no goal."""
+        if self.goal_states is None:
+            return None
+        return self.probability(self.goal_states)
+
+    def mean_tokens(self):
+        """Returns a dictionary with place ids as keys and NumPy arrays with the mean number of tokens at every time point as values."""
+
+        means = self.probabilities.dot(self.ctmc.markings())
+        return dict((p_id, means[:, p]) for p, p_id in enumerate(self.ctmc.net.place_ids))
+
+    def marked_probability(self):
+        """Returns a dictionary with place ids as keys and NumPy arrays with the probability of the place being marked as values."""
+
+        marked = self.probabilities.dot(self.ctmc.markings() > 0)
+        return dict((p_id, marked[:, p]) for p, p_id in enumerate(self.ctmc.net.place_ids))
+
+    def __str__(self):
+
+        goal = self.goal_probability
+        lines = ['Transient solution of ' + str(self.ctmc.num_states) + ' tangible states, '
+                 + str(self.steps) + ' steps' + (', steady state detected at step ' + str(self.steady_state_step)
+                                                 if self.steady_state_step is not None else '') + '.']
+        lines.append('')
+        lines.append('{0:>16}'.format('Time') + ('{0:>20}'.format('P(goal reached)') if goal is not None else ''))
+        for i, t in enumerate(self.times):
+            lines.append('{0:>16.6g}'.format(t) + ('{0:>20.10f}'.format(goal[i]) if goal is not None else ''))
+
+        if len(self.times):
+            net = self.ctmc.net
+            means = self.mean_tokens()
+            lines.append('')
+            lines.append('{0:<40}{1:>24}'.format('Place', 'Mean tokens at t = ' + '{0:.6g}'.format(self.times[-1])))
+            for p, p_id in enumerate(net.place_ids):
+                lines.append('{0:<40}{1:>24.6f}'.format(net.place_names[p][:39], means[p_id][-1]))
+        return '\n'.join(lines)
+
+def goal_states(ctmc, goal_places = None):
+    """Returns a boolean NumPy array marking the tangible states where any of the goal places is marked.
+
+    Keyword Arguments:
+    goal_places -- List of place ids. By default, the places named GOAL_REACHED.
+    """
+
+    net = ctmc.net
+    if goal_places is None:
+        places = net.places_named(GOAL_REACHED)
+    else:
+        places = [net.place_index[p_id] for p_id in goal_places]
+    if not places or not ctmc.num_states:
+        return np.zeros(ctmc.num_states, dtype = bool)
+    return (ctmc.markings()[:, places] > 0).any(axis = 1)
+
+def transient_analysis(model, times, goal_places = None, epsilon = 1e-10, steady_state_tol = 1e-12):
+    """Computes the state probabilities of a CTMC (or of the CTMC of a PetriNet) at a grid of time points.
+
+    The chain is uniformized, P = I + Q/lambda, and the probabilities at time
+    t are the sum of pi0.P^k weighted with the Poisson(lambda.t) probabilities
+    (see fox_glynn). The vectors pi0.P^k are computed only once, as sparse
+    matrix-vector products, and added to every time point whose truncation
+    window contains k, so one sweep gives the whole curve. When two
+    consecutive vectors differ by less than steady_state_tol (in 1-norm) the
+    uniformized chain has reached its steady state, and the Poisson terms
+    still pending are added at once.
+
+    The goal states (tangible markings where a goal place is marked) are made
+    absorbing, so their probability at time t is the probability of having
+    reached the goal within t.
+
+    Positional Arguments:
+    times -- Sequence of non-negative time points.
+
+    Keyword Arguments:
+    goal_places -- List of place ids. By default, the places named GOAL_REACHED,
+                   if any. An empty list disables the goal.
+    epsilon -- Truncation error allowed at every time point.
+    steady_state_tol -- Tolerance of the steady-state detection (0 disables it).
+
+    Returns a Transient object.
+    """
+
+    ctmc = model if isinstance(model, CTMC) else build_ctmc(model)
+    times = np.atleast_1d(np.asarray(times, dtype = np.float64))
+    if (times < 0).any():
+        raise Exception('Time points must not be negative.')
+
+    n = ctmc.num_states
+    goal = goal_states(ctmc, goal_places)
+    Q = ctmc.Q
+    if goal.any():
+        Q = sp.diags((~goal).astype(np.float64), 0).dot(Q).tocsr()
+    else:
+        goal = goal if goal_places else None
+
+    probabilities = np.zeros((len(times), n))
+    exit_rates = -Q.diagonal()
+    lam = 1.02*float(exit_rates.max()) if n else 0.0
+    if lam == 0:
+        probabilities[:] = ctmc.initial
+        return Transient(ctmc, times, probabilities, goal, 0, None)
+
+    PT = (sp.identity(n, format = 'csr') + Q/lam).T.tocsr()
+    windows = [fox_glynn(lam*t, epsilon) for t in times]
+    lefts = np.array([left for left, _, _ in windows])
+    rights = np.array([right for _, right, _ in windows])
+    remaining = np.ones(len(times))
+
+    v = ctmc.initial.copy()
+    last = int(rights.max())
+    steady_state_step = None
+    k = 0
+    while True:
+        active = np.flatnonzero((lefts <= k) & (rights >= k))
+        if len(active):
+            w = np.array([windows[i][2][k - lefts[i]] for i in active])
+            probabilities[active] += w[:, np.newaxis]*v
+            remaining[active] -= w
+        if k == last:
+            break
+
+        new_v = PT.dot(v)
+        k += 1
+        if steady_state_tol > 0 and np.abs(new_v - v).sum() < steady_state_tol:
+            pending = np.flatnonzero(rights >= k)
+            probabilities[pending] += np.maximum(remaining[pending], 0.0)[:, np.newaxis]*new_v
+            steady_state_step = k
+            break
+        v = new_v
+
+    return Transient(ctmc, times, probabilities, goal, k, steady_state_step)
@@ -246,4 +246,39 @@ class PredicateUpdater(object):
     
     def ok_callback(self, event = None):
         self.value_set = True
-        self.window.destroy()
\ No newline at end of file
+        self.window.destroy()
+
+class ReportDialog(object):
+    
+    def __init__(self, title, text, width = 80, height = 25):
+        super(ReportDialog, self).__init__()
+        
+        self.window = tk.Toplevel()
+        self.window.title(title)
+        self.window.rowconfigure(0, weight = 1)
+        self.window.columnconfigure(0, weight = 1)
+        
+        self.window.bind('<KeyPress-Escape>', self.ok_callback)
+        self.window.bind('<KeyPress-Return>', self.ok_callback)
+        
+        self.text = tk.Text(self.window, width = width, height = height, wrap = tk.NONE)
+        self.text.insert(tk.END, text)
+        self.text.configure(state = tk.DISABLED)
+        self.text.grid(row = 0, column = 0, sticky = tk.NSEW)
+        
+        ysb = ttk.Scrollbar(self.window, orient = tk.VERTICAL, command = self.text.yview)
+        xsb = ttk.Scrollbar(self.window, orient = tk.HORIZONTAL, command = self.text.xview)
+        self.text.configure(yscrollcommand = ysb.set, xscrollcommand = xsb.set)
+        ysb.grid(row = 0, column = 1, sticky = tk.NS)
+        xsb.grid(row = 1, column = 0, sticky = tk.EW)
+        
+        button_frame = tk.Frame(self.window)
+        button_frame.grid(row = 2, column = 0, sticky = tk.N)
+        
+        ok_button = tk.Button(button_frame, text = 'Ok', command = self.ok_callback)
+        ok_button.grid(row = 0, column = 0)
+        
+        self.window.focus_set()
+    
+    def ok_callback(self, event = None):
+        self.window.destroy()
@@ -734,11 +734,7 @@ class PNEditor(Tkinter.Canvas):
             center_offset = Vec2((canvas_width - w*scale_factor)/2, 0)
         
         # (new_pos - (0, 0))*scale_factor
-        for p in self._petri_net.places.itervalues():
-            p.position = (p.position + offset)*scale_factor + center_offset
-        
-        for t in self._petri_net.transitions.itervalues():
-            t.position = (t.position + offset)*scale_factor + center_offset
+        self._petri_net.transform_positions(scale_factor, offset*scale_factor + center_offset)
         
         self._offset = (self._offset + offset)*scale_factor + center_offset
         
@@ -898,8 +894,8 @@ class PNEditor(Tkinter.Canvas):
         self._hide_menu()
         name = self._get_place_name()
         p = self._petri_net.places[name]
-        incoming_arcs = p.incoming_arcs
-        outgoing_arcs = p.outgoing_arcs
+        incoming_arcs = p.incoming_arcs.copy()
+        outgoing_arcs = p.outgoing_arcs.copy()
         self.remove_place(name)
         self._add_to_undo(['remove_place', 'Remove Place.', p, incoming_arcs, outgoing_arcs, Vec2(self._offset), self._current_scale])
     
@@ -908,8 +904,8 @@ class PNEditor(Tkinter.Canvas):
         self._hide_menu()
         name = self._get_transition_name()
         t = self._petri_net.transitions[name]
-        incoming_arcs = t.incoming_arcs
-        outgoing_arcs = t.outgoing_arcs
+        incoming_arcs = t.incoming_arcs.copy()
+        outgoing_arcs = t.outgoing_arcs.copy()
         self.remove_transition(name)
         self._add_to_undo(['remove_transition', 'Remove Transition.', t, incoming_arcs, outgoing_arcs, Vec2(self._offset), self._current_scale])
     
@@ -964,10 +960,7 @@ class PNEditor(Tkinter.Canvas):
         if entry_y > h:
             diff = Vec2(0.0, h - entry_y)
             self.move('all', diff.x, diff.y)
-            for p in self._petri_net.places.itervalues():
-                p.position += diff
-            for t in self._petri_net.transitions.itervalues():
-                t.position += diff
+            self._petri_net.translate_positions(diff)
             self._draw_all_arcs()
             if self._grid:
                 self._grid_offset = (self._grid_offset + diff).int
@@ -999,10 +992,7 @@ class PNEditor(Tkinter.Canvas):
             #old_t.position.y -= entry_y - h
             diff = Vec2(0.0, h - entry_y)
             self.move('all', diff.x, diff.y)
-            for p in self._petri_net.places.itervalues():
-                p.position += diff
-            for t in self._petri_net.transitions.itervalues():
-                t.position += diff
+            self._petri_net.translate_positions(diff)
             self._draw_all_arcs()
             if self._grid:
                 self._grid_offset = (self._grid_offset + diff).int
@@ -1330,10 +1320,7 @@ class PNEditor(Tkinter.Canvas):
         if entry_y > h:
             diff = Vec2(0.0, h - entry_y)
             self.move('all', diff.x, diff.y)
-            for p in self._petri_net.places.itervalues():
-                p.position += diff
-            for t in self._petri_net.transitions.itervalues():
-                t.position += diff
+            self._petri_net.translate_positions(diff)
             self._draw_all_arcs()
             if self._grid:
                 self._grid_offset = (self._grid_offset + diff).int
@@ -1369,10 +1356,7 @@ class PNEditor(Tkinter.Canvas):
         if entry_y > h:
             diff = Vec2(0.0, h - entry_y)
             self.move('all', diff.x, diff.y)
-            for p in self._petri_net.places.itervalues():
-                p.position += diff
-            for t in self._petri_net.transitions.itervalues():
-                t.position += diff
+            self._petri_net.translate_positions(diff)
             self._draw_all_arcs()
             if self._grid:
                 self._grid_offset = (self._grid_offset + diff).int
@@ -1919,10 +1903,7 @@ class PNEditor(Tkinter.Canvas):
         self.scale('all', e.x, e.y, scale_factor, scale_factor)
         self._current_scale = round(self._current_scale * scale_factor, 8)
         self._petri_net.scale = self._current_scale
-        for p in self._petri_net.places.itervalues():
-            p.position = e + (p.position - e)*scale_factor
-        for t in self._petri_net.transitions.itervalues():
-            t.position = e + (t.position - e)*scale_factor
+        self._petri_net.scale_positions(e, scale_factor)
         self._offset = e + (self._offset - e)*scale_factor
         self._draw_all_arcs()
         if self._grid:
@@ -1941,10 +1922,7 @@ class PNEditor(Tkinter.Canvas):
         self.scale('all', e.x, e.y, scale_factor, scale_factor)
         self._current_scale = round(self._current_scale * scale_factor, 8)
         self._petri_net.scale = self._current_scale
-        for p in self._petri_net.places.itervalues():
-            p.position = e + (p.position - e)*scale_factor
-        for t in self._petri_net.transitions.itervalues():
-            t.position = e + (t.position - e)*scale_factor
+        self._petri_net.scale_positions(e, scale_factor)
         self._offset = e + (self._offset - e)*scale_factor
         self._draw_all_arcs()
         if self._grid:
@@ -2063,10 +2041,7 @@ class PNEditor(Tkinter.Canvas):
             self._draw_item_arcs(self._anchor_node)
         
         if self._anchor_tag == 'all':
-            for p in self._petri_net.places.itervalues():
-                p.position += diff
-            for t in self._petri_net.transitions.itervalues():
-                t.position += diff
+            self._petri_net.translate_positions(diff)
             self._offset += diff
             #self._draw_all_arcs()
             if self._grid:
@@ -3,6 +3,7 @@
 @author: Adrián Revuelta Cuauhtli
 '''
 
+import re
 import sys
 import os
 import tkMessageBox
@@ -19,12 +20,19 @@ import tempfile
 from lxml import etree as ET
 from subprocess import call
 
-from PetriNets import PetriNet, PlaceTypes
+from PetriNets import PetriNet, PlaceTypes, PlaceFlags
+import Snapshot
 from GUI.TabManager import TabManager
 from GUI.PNEditor import PNEditor
-from GUI.AuxDialogs import InputDialog, MoveDialog, SelectItemDialog, PredicateUpdater
+from GUI.AuxDialogs import InputDialog, MoveDialog, SelectItemDialog, PredicateUpdater, ReportDialog
 from PNLab2PIPE import pnlab2pipe
 from PIPE2PNLab import pipe2pnlab
+from Analysis.Invariants import invariants_report
+from Analysis.Siphons import siphons_report
+from Analysis.SteadyState import solve_steady_state
+from Analysis.Transient import transient_analysis
+from Analysis.Absorption import absorption_analysis
+from Analysis.Simulation import simulate
 
 class PNLab(object):
     
@@ -56,6 +64,7 @@ class PNLab(object):
                                   state = 'readonly')
         self.mode_var.set('Editor')
         mode_combo.grid(row = 0, column = 1, sticky = tk.E)
+        mode_combo.bind('<<ComboboxSelected>>', self.mode_selected)
         
         project_frame = tk.Frame(self.root, width = PNLab.EXPLORER_WIDTH)
         project_frame.grid(row = 1, column = 0, sticky = tk.NSEW)
@@ -120,13 +129,19 @@ class PNLab(object):
         analysis_menu.add_command(label="Set Predicate Init Values", command = self.update_predicates)
         analysis_menu.add_command(label="Generate FullPetriNet", command = self.get_full_pn)
         analysis_menu.add_command(label = 'ComputeMC', command = self.computeMC)
+        analysis_menu.add_separator()
+        analysis_menu.add_command(label = 'P/T Invariants', command = self.show_invariants)
+        analysis_menu.add_command(label = 'Siphons and Traps', command = self.show_siphons)
+        analysis_menu.add_command(label = 'Steady State', command = self.show_steady_state)
+        analysis_menu.add_command(label = 'Transient Analysis', command = self.show_transient)
+        analysis_menu.add_command(label = 'Goal Probability', command = self.show_absorption)
         
         menubar.add_cascade(label = 'Analysis Tools', menu = analysis_menu)
         
         '''
         mode_menu = tk.Menu(menubar, tearoff = False)
         mode_menu.add_command(label = 'Editing Mode')
-        mode_menu.add_command(label = 'Simulation Mode')
+        mode_menu.add_command(label = 'Simulation Mode', command = self.run_simulation)
         mode_menu.add_command(label = 'Execution Mode')
         menubar.add_cascade(label = 'Set mode...', menu = mode_menu)
         '''
@@ -298,6 +313,9 @@ class PNLab(object):
         except Exception as e:
             tkMessageBox.showerror('Error loading PetriNet.', 'An error occurred while loading the PetriNet object.\n\n' + str(e))
         
+        return self._insert_petri_net(pn, parent)
+    
+    def _insert_petri_net(self, pn, parent):
         name = pn.name
         item_id = parent + name
         
@@ -483,6 +501,9 @@ class PNLab(object):
         zip_file = zipfile.ZipFile(self.file_path, 'r')
         tmp_dir = tempfile.mkdtemp()
         
+        #Nets from the snapshot cache of the project, if it is up to date with its PNML files:
+        cached_nets = Snapshot.load_project_cache(self.file_path, zip_file)
+        
         for x in zip_file.infolist():
             prev_sep = -1
             sep_index = x.filename.find('/', 0)
@@ -499,6 +520,9 @@ class PNLab(object):
                 last_sep = x.filename.rfind('/') + 1
                 filename = x.filename[last_sep:]
                 parent = x.filename[:last_sep]
+                if cached_nets is not None:
+                    self._insert_petri_net(cached_nets[x.filename], parent)
+                    continue
                 file_path = os.path.join(tmp_dir, filename)
                 f = open(file_path, 'w')
                 data = zip_file.read(x)
@@ -508,6 +532,8 @@ class PNLab(object):
                 os.remove(file_path)
             
         os.rmdir(tmp_dir)
+        if cached_nets is None:
+            self._save_cache(zip_file)
         zip_file.close()
         
         self.status_var.set('Opened: ' + self.file_path)
@@ -517,6 +543,10 @@ class PNLab(object):
             self.save_as()
             return
         
+        #Nets opened from the snapshot cache read their PNML file from the project file, before it is written again:
+        for pne in self.petri_nets.itervalues():
+            pne._petri_net._load_tree()
+        
         try:
             zip_file = zipfile.ZipFile(self.file_path, "w")
         except:
@@ -545,6 +575,7 @@ class PNLab(object):
                 os.remove(file_path)
         
         os.rmdir(tmp_dir)
+        self._save_cache(zip_file)
         zip_file.close()
         
         try:
@@ -559,6 +590,18 @@ class PNLab(object):
         pne = self.tab_manager.widget_dict[tab_id]
         pne.status_var.set('File saved: ' + self.file_path)
     
+    def _save_cache(self, zip_file):
+        """Writes the snapshot cache of the project, which makes opening it again much faster.
+        
+        The cache is optional: if it cannot be written, the project is opened from its PNML files.
+        """
+        
+        petri_nets = dict((item_id + '.pnml', pne._petri_net) for item_id, pne in self.petri_nets.iteritems())
+        try:
+            Snapshot.save_project_cache(self.file_path, zip_file, petri_nets)
+        except Exception as e:
+            print 'warning: Snapshot cache could not be written.', e
+    
     def save_as(self):
         zip_filename = tkFileDialog.asksaveasfilename(
                                                   defaultextension = '.rpnp',
@@ -604,8 +647,8 @@ class PNLab(object):
             for current in children:
                 pne = self.petri_nets[current]
                 
-                for p in pne._petri_net.places.itervalues():
-                    if p.type == PlaceTypes.PREDICATE and p.name not in preds:
+                for p in pne._petri_net.find_places(PlaceTypes.PREDICATE):
+                    if p.name not in preds:
                         preds[p.name] = int((p.init_marking > 0) != p._isNegated)
         
         dialog = PredicateUpdater(preds)
@@ -619,9 +662,8 @@ class PNLab(object):
             for current in children:
                 pne = self.petri_nets[current]
                 
-                for p in pne._petri_net.places.itervalues():
-                    if p.type == PlaceTypes.PREDICATE:
-                        p.init_marking = int((dialog.preds[p.name].get() == 'True') != p._isNegated)
+                for p in pne._petri_net.find_places(PlaceTypes.PREDICATE):
+                    p.init_marking = int((dialog.preds[p.name].get() == 'True') != p._isNegated)
                 
                 pne._draw_petri_net()
         
@@ -675,9 +717,8 @@ class PNLab(object):
                 tmp = ET.SubElement(model, 'FilePath')
                 tmp.text = os.path.basename(path)
                 
-                for p in pne._petri_net.places.itervalues():
-                    
-                    if p.type == PlaceTypes.PREDICATE and p.name not in added_predicates:
+                for p in pne._petri_net.find_places(PlaceTypes.PREDICATE):
+                    if p.name not in added_predicates:
                         added_predicates.add(p.name)
                         predicate = ET.SubElement(root_pred, 'Predicate')
                         tmp = ET.SubElement(predicate, 'Name')
@@ -687,14 +728,14 @@ class PNLab(object):
                         tmp = ET.SubElement(predicate, 'Comment')
                         tmp.text = '...'
                 
-                    if f == 'Actions/':
-                        if p._isRunningCondition:
-                            tmp = ET.SubElement(model, 'RunningCondition')
-                            tmp.text = ('NOT_' if p._isNegated else '') + p.name
-                        
-                        if p._isEffect:
-                            tmp = ET.SubElement(model, 'DesiredEffect')
-                            tmp.text = ('NOT_' if p._isNegated else '') + p.name
+                if f == 'Actions/':
+                    for p in pne._petri_net.find_places(flags = [PlaceFlags.RUNNING_CONDITION]):
+                        tmp = ET.SubElement(model, 'RunningCondition')
+                        tmp.text = ('NOT_' if p._isNegated else '') + p.name
+                    
+                    for p in pne._petri_net.find_places(flags = [PlaceFlags.EFFECT]):
+                        tmp = ET.SubElement(model, 'DesiredEffect')
+                        tmp.text = ('NOT_' if p._isNegated else '') + p.name
                 
                 file_path = os.path.join(tmp_dir, path)
                 et = pne._petri_net.to_ElementTree()
@@ -757,6 +798,143 @@ class PNLab(object):
         path = os.path.abspath(os.path.dirname(__file__))
         path = os.path.join(path, 'Analysis_tools', 'computeMC')
         call([path, '-s', filename])
+    
+    def _get_current_pne(self):
+        try:
+            tab_id = self.tab_manager.select()
+        except:
+            tab_id = None
+        
+        if not tab_id:
+            tkMessageBox.showwarning('No Petri Net selected.', 'Please open the Petri Net to analyze in the workspace first.')
+            return None
+        
+        return self.tab_manager.widget_dict[tab_id]
+    
+    def _show_report(self, title, text):
+        dialog = ReportDialog(title, text)
+        dialog.window.transient(self.root)
+    
+    def show_invariants(self):
+        
+        pne = self._get_current_pne()
+        if pne is None:
+            return
+        
+        try:
+            report = invariants_report(pne._petri_net)
+        except Exception as e:
+            tkMessageBox.showerror('Error computing invariants.', 'An error occurred while computing the invariants.\n\n' + str(e))
+            return
+        
+        self._show_report('P/T Invariants - ' + pne._petri_net.name, report)
+    
+    def show_siphons(self):
+        
+        pne = self._get_current_pne()
+        if pne is None:
+            return
+        
+        try:
+            report = siphons_report(pne._petri_net)
+        except Exception as e:
+            tkMessageBox.showerror('Error computing siphons.', 'An error occurred while computing the siphons and traps.\n\n' + str(e))
+            return
+        
+        self._show_report('Siphons and Traps - ' + pne._petri_net.name, report)
+    
+    def show_steady_state(self):
+        
+        pne = self._get_current_pne()
+        if pne is None:
+            return
+        
+        try:
+            report = str(solve_steady_state(pne._petri_net))
+        except Exception as e:
+            tkMessageBox.showerror('Error computing the steady state.', 'An error occurred while computing the steady state.\n\n' + str(e))
+            return
+        
+        self._show_report('Steady State - ' + pne._petri_net.name, report)
+    
+    def show_transient(self):
+        
+        pne = self._get_current_pne()
+        if pne is None:
+            return
+        
+        horizon = self._ask_number('Time horizon',
+                                   'Please input the time up to which the state probabilities are computed.',
+                                   'Time', '10.0', re.compile('^[0-9]+(\.[0-9]+)?$'),
+                                   'Please input a non-negative number.')
+        if horizon is None:
+            return
+        horizon = float(horizon)
+        
+        try:
+            report = str(transient_analysis(pne._petri_net, [horizon*i/20.0 for i in xrange(21)]))
+        except Exception as e:
+            tkMessageBox.showerror('Error computing the transient solution.', 'An error occurred while computing the transient solution.\n\n' + str(e))
+            return
+        
+        self._show_report('Transient Analysis - ' + pne._petri_net.name, report)
+    
+    def show_absorption(self):
+        
+        pne = self._get_current_pne()
+        if pne is None:
+            return
+        
+        try:
+            report = str(absorption_analysis(pne._petri_net))
+        except Exception as e:
+            tkMessageBox.showerror('Error computing the absorption probabilities.', 'An error occurred while analyzing the absorbing chain.\n\n' + str(e))
+            return
+        
+        self._show_report('Goal Probability - ' + pne._petri_net.name, report)
+    
+    def mode_selected(self, event = None):
+        
+        if self.mode_var.get() == 'Simulation':
+            self.run_simulation()
+    
+    def _ask_number(self, title, text, label, value, regex, error_message):
+        dialog = InputDialog(title, text, label, regex = regex, value = value, error_message = error_message)
+        dialog.window.transient(self.root)
+        self.root.wait_window(dialog.window)
+        if not dialog.value_set:
+            return None
+        return dialog.input_var.get()
+    
+    def run_simulation(self):
+        
+        try:
+            pne = self._get_current_pne()
+            if pne is None:
+                return
+            
+            end_time = self._ask_number('Simulation time',
+                                        'Please input the time simulated by every replication.',
+                                        'Time', '1000.0', re.compile('^[0-9]+(\.[0-9]+)?$'),
+                                        'Please input a positive number.')
+            if end_time is None or float(end_time) <= 0:
+                return
+            replications = self._ask_number('Replications',
+                                            'Please input the number of independent replications.',
+                                            'Replications', '10', re.compile('^[1-9][0-9]*$'),
+                                            'Please input a positive integer.')
+            if replications is None:
+                return
+            
+            try:
+                report = str(simulate(pne._petri_net, float(end_time), int(replications)))
+            except Exception as e:
+                tkMessageBox.showerror('Error running the simulation.', 'An error occurred while running the simulation.\n\n' + str(e))
+                return
+            
+            self._show_report('Simulation - ' + pne._petri_net.name, report)
+        finally:
+            self.mode_var.set('Editor')
 
 if __name__ == '__main__':
     w = PNLab()
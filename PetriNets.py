@@ -4,16 +4,73 @@
 """
 
 import abc
+import collections
 import copy
-import io
 #import xml.etree.ElementTree as ET
 import lxml.etree as ET
+import numpy as np
 
 from utils.Vector import Vec2
 import os
 
 VERSION = '0.8'
 
+#Children of the PNML elements that PNLab reads and writes, by the path of the element ('toolspecific' stands
+#for the PNLab toolspecific element only). Paths that are not keys are generated whole. Detached nets keep
+#any other content in a side store (see PetriNet.detach):
+_KNOWN_CHILDREN = {'net': ('name', 'page', 'toolspecific'),
+                   'net/name': ('text',),
+                   'net/toolspecific': ('scale',),
+                   'place': ('name', 'initialMarking', 'toolspecific', 'graphics'),
+                   'place/name': ('text', 'graphics'),
+                   'place/name/graphics': ('offset',),
+                   'place/initialMarking': ('text',),
+                   'place/toolspecific': ('type', 'capacity', 'isRunningCondition', 'isEffect', 'isOutput', 'isNegated'),
+                   'place/graphics': ('position', 'dimension', 'fill', 'line'),
+                   'transition': ('name', 'toolspecific', 'graphics'),
+                   'transition/name': ('text', 'graphics'),
+                   'transition/name/graphics': ('offset',),
+                   'transition/toolspecific': ('type', 'isHorizontal', 'rate', 'priority'),
+                   'transition/graphics': ('position', 'dimension', 'fill', 'line'),
+                   'arc': ('inscription',),
+                   'arc/inscription': ('text',)
+                   }
+
+def _strip_namespaces(root):
+    """Removes the namespaces from the tags and attributes of an element and its descendants."""
+    
+    for el in root.iter():
+        if not isinstance(el.tag, basestring):
+            continue
+        if el.tag[0] == '{':
+            el.tag = el.tag[el.tag.find('}') + 1:]
+        for key in el.attrib.keys():
+            if key[0] == '{':
+                el.set(key[key.find('}') + 1:], el.attrib.pop(key))
+
+def _indent(el, level):
+    """Indents an element in place the way lxml's pretty printing does at a given depth, and returns it.
+    
+    Like libxml2, elements with text (or tails) among their children are
+    left as they are, with all of their descendants.
+    """
+    
+    if el.text is not None:
+        return el
+    children = list(el)
+    for child in children:
+        if child.tail is not None:
+            return el
+    indent = '\n' + '  '*(level + 1)
+    el.text = indent
+    for child in children:
+        #Leaves are left as they are, this saves most of the calls:
+        if len(child):
+            _indent(child, level + 1)
+        child.tail = indent
+    children[-1].tail = indent[:-2]
+    return el
+
 def _get_treeElement(parent, tag = 'text', attr = None):
     """Aux function to search or create a certain ElementTree element."""
     
@@ -38,6 +95,146 @@ class TransitionTypes(object):
     IMMEDIATE = 'immediate'
     TIMED_STOCHASTIC = 'stochastic'
 
+class PlaceFlags(object):
+    """'Enum' class for the Place flags indexed by the PetriNet (the values are the Node attribute names)."""
+    
+    RUNNING_CONDITION = '_isRunningCondition'
+    EFFECT = '_isEffect'
+    OUTPUT = '_isOutput'
+    NEGATED = '_isNegated'
+
+def _indexed_flag(attr):
+    """Property for a node flag stored in 'attr', which keeps the secondary indexes of the node's PetriNet up to date."""
+    
+    def getter(self):
+        return getattr(self, attr)
+    
+    def setter(self, value):
+        setattr(self, attr, value)
+        if self.petri_net is not None:
+            self.petri_net._reindex_node(self)
+    
+    return property(getter, setter)
+
+#Shared by the nodes that are not referenced from other pages, instead of an empty set per node:
+_NO_REFERENCES = frozenset()
+
+class _CoordinateStore(object):
+    """Positions of the nodes of a PetriNet, one row of a NumPy array per node.
+    
+    Rows of removed nodes are reused. Every row is kept rounded to 8
+    decimals, like the coordinates of Vec2 objects.
+    """
+    
+    def __init__(self, capacity = 64):
+        
+        super(_CoordinateStore, self).__init__()
+        
+        self.array = np.zeros((capacity, 2))
+        self.size = 0
+        self._free = []
+    
+    def allocate(self, position):
+        """Stores a position in a free row and returns its index."""
+        
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self.size == len(self.array):
+                self.array = np.concatenate((self.array, np.zeros((len(self.array), 2))))
+            row = self.size
+            self.size += 1
+        self.set(row, position)
+        return row
+    
+    def release(self, row):
+        self._free.append(row)
+    
+    def get(self, row, axis):
+        return float(self.array[row, axis])
+    
+    def set(self, row, position):
+        self.array[row, 0] = round(position.x, 8)
+        self.array[row, 1] = round(position.y, 8)
+    
+    def transform(self, scale, offset):
+        """Scales every position and then adds 'offset' to it, in one vectorized operation."""
+        
+        rows = self.array[:self.size]
+        rows *= scale
+        rows += (offset.x, offset.y)
+        np.around(rows, 8, rows)
+
+class ArcsView(collections.Mapping):
+    """Read-only, live view of the incoming or outgoing arcs of a node.
+    
+    Works like a dictionary with the string representations of the nodes at
+    the other end of the arcs as keys and _Arc objects as values, without
+    copying them. It reflects later changes to the arcs of the node, so use
+    copy() to keep the current arcs.
+    """
+    
+    __slots__ = ('_arcs',)
+    
+    def __init__(self, arcs):
+        self._arcs = arcs
+    
+    def __getitem__(self, key):
+        return self._arcs[key]
+    
+    def __iter__(self):
+        return iter(self._arcs)
+    
+    def __len__(self):
+        return len(self._arcs)
+    
+    def __contains__(self, key):
+        return key in self._arcs
+    
+    def __repr__(self):
+        return 'ArcsView(' + repr(self._arcs) + ')'
+    
+    def iterkeys(self):
+        return self._arcs.iterkeys()
+    
+    def itervalues(self):
+        return self._arcs.itervalues()
+    
+    def iteritems(self):
+        return self._arcs.iteritems()
+    
+    def copy(self):
+        """Returns a dictionary with the current arcs (the _Arc objects are not copied)."""
+        return dict(self._arcs)
+
+class _PositionView(Vec2):
+    """Vec2 whose coordinates are a row of a _CoordinateStore, so changing them moves the node.
+    
+    Arithmetic operators return plain Vec2 objects.
+    """
+    
+    __slots__ = ('_store', '_row')
+    
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+    
+    @property
+    def x(self):
+        return self._store.get(self._row, 0)
+    
+    @x.setter
+    def x(self, value):
+        self._store.array[self._row, 0] = round(value, 8)
+    
+    @property
+    def y(self):
+        return self._store.get(self._row, 1)
+    
+    @y.setter
+    def y(self, value):
+        self._store.array[self._row, 1] = round(value, 8)
+
 class Node(object):
     """PetriNets Node class, which is extended by Place and Transition Classes.
         NOTICE: Arc does not extend from this class.
@@ -45,6 +242,15 @@ class Node(object):
     
     __metaclass__ = abc.ABCMeta
     
+    #No per-instance __dict__, to keep nets with hundreds of thousands of nodes small:
+    __slots__ = ('_runningCondition', '_effect', '_output', '_negated', '_index_keys', '_name', '_type',
+                 'petri_net', '_position', '_row', '_incoming_arcs', '_outgoing_arcs', 'hasTreeElement', '_references', '_id')
+    
+    _isRunningCondition = _indexed_flag('_runningCondition')
+    _isEffect = _indexed_flag('_effect')
+    _isOutput = _indexed_flag('_output')
+    _isNegated = _indexed_flag('_negated')
+    
     def __init__(self, name, nodeType, position):
         """Node constructor
         
@@ -59,6 +265,10 @@ class Node(object):
         if not name:
             raise Exception('A Node name must be a non-empty string.')
         
+        self.petri_net = None
+        #Keys under which the node is stored in the secondary indexes of its PetriNet:
+        self._index_keys = ()
+        
         if nodeType == PlaceTypes.PREDICATE and name[:2] == 'r.':
             name = name[2:]
             self._isRunningCondition = True
@@ -85,12 +295,13 @@ class Node(object):
         
         self._name = name
         self._type = nodeType
-        self.petri_net = None
+        #Own position while the node is not in a PetriNet, which stores it in its coordinate array otherwise (row _row):
+        self._row = -1
         self.position = Vec2(position)
         self._incoming_arcs = {}
         self._outgoing_arcs = {}
         self.hasTreeElement = False
-        self._references = set()
+        self._references = _NO_REFERENCES
         self._id = name.replace(' ', '_').replace('(', '__').replace(')', '__').replace(',', '_')
     
     @property
@@ -128,6 +339,38 @@ class Node(object):
             raise Exception('A Node name must be a non-empty string.')
         
         self._name = value
+        if self.petri_net is not None:
+            self.petri_net._reindex_node(self)
+    
+    @property
+    def position(self):
+        """Position of the node (a Vec2 object).
+        
+        While the node is in a PetriNet, the position is stored in a row of
+        the net's coordinate array and this is a view of it: changing its
+        coordinates moves the node. Assigning a Vec2 copies its coordinates.
+        """
+        if self._row < 0:
+            return self._position
+        return _PositionView(self.petri_net._coordinates, self._row)
+    
+    @position.setter
+    def position(self, value):
+        if self._row < 0:
+            self._position = Vec2(value)
+        else:
+            self.petri_net._coordinates.set(self._row, value)
+    
+    def _add_reference(self, ref_id):
+        """Records the id of a reference to this node (a referencePlace or referenceTransition element)."""
+        
+        if not self._references:
+            self._references = set()
+        self._references.add(ref_id)
+    
+    def _index_keys_for(self):
+        """Returns the keys under which the node must be stored in the secondary indexes of its PetriNet."""
+        return (('type', self._type), ('name', self._name))
     
     @property
     def _full_name(self):
@@ -142,17 +385,26 @@ class Node(object):
     
     @property
     def incoming_arcs(self):
-        """Read-only property. Deepcopy of the incoming arcs as a dictionaty with source
-            transition/place string representations as keys and weights as values. 
+        """Read-only property. Incoming arcs as a read-only ArcsView, with source
+            transition/place string representations as keys and _Arc objects as values. 
         """
-        return copy.deepcopy(self._incoming_arcs)
+        return ArcsView(self._incoming_arcs)
     
     @property
     def outgoing_arcs(self):
-        """Read-only property. Deepcopy of the outgoing arcs as a dictionaty with target
-            transition/place string representations as keys and weights as values. 
+        """Read-only property. Outgoing arcs as a read-only ArcsView, with target
+            transition/place string representations as keys and _Arc objects as values. 
+        """
+        return ArcsView(self._outgoing_arcs)
+    
+    def snapshot_arcs(self):
+        """Returns deep copies of the incoming and outgoing arc dictionaries, as an (incoming, outgoing) tuple.
+        
+        The copies are independent from the net (including the nodes at the
+        other end of the arcs), which makes this expensive. To keep the
+        current arcs of a node, the copy() method of the views is enough.
         """
-        return copy.deepcopy(self._outgoing_arcs)
+        return copy.deepcopy((self._incoming_arcs, self._outgoing_arcs))
     
     @abc.abstractmethod
     def _merge_treeElement(self):
@@ -183,6 +435,7 @@ class Node(object):
 class Place(Node):
     """Petri Net Place Class."""
     
+    __slots__ = ('init_marking', 'capacity', 'current_marking')
     
     def __init__(self, name, place_type = PlaceTypes.PREDICATE, position = Vec2(), init_marking = 0, capacity = 1):
         """Place constructor
@@ -204,6 +457,24 @@ class Place(Node):
         self.capacity = capacity
         self.current_marking = self.init_marking
     
+    @property
+    def type(self):
+        """Returns the type of the place. Should be a value from one of the constants in PlaceTypes class."""
+        return self._type
+    
+    @type.setter
+    def type(self, value):
+        """Sets the type of the place. Should be a value from one of the constants in PlaceTypes class."""
+        self._type = value
+        if self.petri_net is not None:
+            self.petri_net._reindex_node(self)
+    
+    def _index_keys_for(self):
+        """Returns the keys under which the place must be stored in the secondary indexes of its PetriNet, including its flags."""
+        
+        flags = (PlaceFlags.RUNNING_CONDITION, PlaceFlags.EFFECT, PlaceFlags.OUTPUT, PlaceFlags.NEGATED)
+        return super(Place, self)._index_keys_for() + tuple(('flag', flag) for flag in flags if getattr(self, flag))
+    
     @classmethod
     def fromETreeElement(cls, element):
         """Method for parsing xml nodes as an ElementTree object."""
@@ -373,7 +644,7 @@ class Place(Node):
         
         super(Place, self)._merge_treeElement()
         
-        place = self.petri_net._tree.find('//*[@id="' + self.__repr__() + '"]')
+        place = self.petri_net._elements.get(self.__repr__())
         
         place_name = _get_treeElement(place, 'name')
         tmp = _get_treeElement(place_name)
@@ -444,6 +715,8 @@ class Transition(Node):
     
     """Petri Net Transition Class."""
     
+    __slots__ = ('isHorizontal', 'rate', 'priority')
+    
     def __init__(self, name, transition_type = TransitionTypes.IMMEDIATE, position = Vec2(), isHorizontal = False, rate = 1.0, priority = 1):
         
         """Transition constructor
@@ -479,6 +752,8 @@ class Transition(Node):
     def type(self, value):
         """Sets the type of the transition. Should be a value from one of the constants in TransitionTypes class."""
         self._type = value
+        if self.petri_net is not None:
+            self.petri_net._reindex_node(self)
     
     @classmethod
     def fromETreeElement(cls, element):
@@ -595,7 +870,7 @@ class Transition(Node):
         
         super(Transition, self)._merge_treeElement()
         
-        transition = self.petri_net._tree.find('//*[@id="' + self.__repr__() + '"]')
+        transition = self.petri_net._elements.get(self.__repr__())
         
         transition_name = _get_treeElement(transition, 'name')
         tmp = _get_treeElement(transition_name)
@@ -660,6 +935,8 @@ class Transition(Node):
 
 class _Arc(object):
     
+    __slots__ = ('source', 'target', 'weight', '_treeElement', 'petri_net')
+    
     def __init__(self, source, target, weight = 1, treeElement = None):
         
         self.source = source
@@ -694,11 +971,12 @@ class _Arc(object):
     
     def _merge_treeElement(self):
         
-        el = self.petri_net._tree.find('//*[@id="' + self._treeElement + '"]')
+        el = self.petri_net._elements.get(self._treeElement)
         if el is None:
             print 'DEBUG - TE: ' + self._treeElement + ' - TreeName: ' + self.petri_net.name
             return
-        el.set('id', self.__repr__())
+        self.petri_net._set_element_id(el, self.__repr__())
+        self._treeElement = self.__repr__()
         weight = _get_treeElement(el, 'inscription')
         _get_treeElement(weight).text = str(self.weight)
 
@@ -772,26 +1050,250 @@ class PetriNet(object):
         self._place_counter = 0
         self._transition_counter = 0
         
-        root_el = ET.Element('pnml', {'xmlns': 'http://www.pnml.org/version-2009/grammar/pnml'})
-        self._tree = ET.ElementTree(root_el)
-        page = None
+        #Secondary indexes, {key: {node id: node}} with the keys of Node._index_keys_for:
+        self._place_index = {}
+        self._transition_index = {}
+        self._index_key_pool = {}
+        
+        #Positions of the nodes in the net (see Node.position):
+        self._coordinates = _CoordinateStore()
+        
+        self._tree = None
+        #Elements of the tree with an id attribute, {id: element}:
+        self._elements = {}
+        #Elements of other tools of a detached net, {node/arc id (None for the net): XML string}:
+        self._foreign = {}
+        #Id of the net element of a detached net (the XML tree has it otherwise):
+        self._net_id = None
+        #Function returning the PNML of a net read from a snapshot, and the name it was read with, until its tree is built (see _defer_tree):
+        self._pnml = None
         if _net is not None:
-            root_el.append(_net)
-            try:
-                self.scale = float(_net.find('toolspecific[@tool="PNLab"]/scale/text').text)
-            except:
-                pass
-            page = _net.find('page')
+            scale = PetriNet._pnml_scale(_net)
+            if scale is not None:
+                self.scale = scale
         else:
-            _net = ET.SubElement(root_el, 'net', {'id': name,
-                                           'type': 'http://www.pnml.org/version-2009/grammar/ptnet'
-                                           })
+            _net = ET.Element('net', {'id': name,
+                                      'type': 'http://www.pnml.org/version-2009/grammar/ptnet'
+                                      })
+        self._set_tree(_net, name)
+    
+    def _set_tree(self, net, name):
+        """Makes a net element of a PNML file (or a new one) the XML tree of the net, with the given name."""
         
-        tmp = _get_treeElement(_net, 'name')
+        root_el = ET.Element('pnml', {'xmlns': 'http://www.pnml.org/version-2009/grammar/pnml'})
+        self._tree = ET.ElementTree(root_el)
+        root_el.append(net)
+        page = net.find('page')
+        
+        tmp = _get_treeElement(net, 'name')
         tmp = _get_treeElement(tmp)
         tmp.text = name
         if page is None:
-            ET.SubElement(_net, 'page', {'id': 'PNLab_top_lvl'})
+            ET.SubElement(net, 'page', {'id': 'PNLab_top_lvl'})
+        #True once the objects are merged into the tree, which then has their values as they are saved:
+        self._tree_merged = False
+        self._index_elements()
+    
+    def _defer_tree(self, read_pnml, name):
+        """Drops the XML tree of the net, which is built from a PNML file the first time it is needed.
+        
+        Positional Arguments:
+        read_pnml -- Function that returns the content of the PNML file.
+        name -- The name the net is read with.
+        
+        The net must have the objects that from_ElementTree would read from
+        the first net of the file, with the same ids (Snapshot builds them).
+        The net behaves as if it kept the tree since it was loaded: see
+        _load_tree.
+        """
+        
+        self._tree = None
+        self._elements = {}
+        self._pnml = (read_pnml, name)
+    
+    def _load_tree(self):
+        """Builds the XML tree of the net if it was deferred (see _defer_tree), the way from_ElementTree reads it."""
+        
+        if self._pnml is None:
+            return
+        read_pnml, name = self._pnml
+        root = ET.fromstring(read_pnml())
+        self._pnml = None
+        
+        _strip_namespaces(root)
+        ET.cleanup_namespaces(root)
+        net = root.find('net')
+        PetriNet._rename_elements(net, PetriNet._pnml_ids(net))
+        self._set_tree(net, name)
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_elements']
+        return state
+    
+    def __setstate__(self, state):
+        #The copied tree has new elements, so the element index is built again:
+        self.__dict__.update(state)
+        self._index_elements()
+    
+    def _index_elements(self):
+        """Builds the id index of the elements of the tree. With repeated ids, the first element in document order is kept."""
+        
+        self._elements = {}
+        if self._tree is None:
+            return
+        for el in self._tree.getroot().iterfind('.//*[@id]'):
+            self._elements.setdefault(el.get('id'), el)
+    
+    def _set_element_id(self, el, el_id):
+        """Changes the id of an element of the tree, updating the id index."""
+        
+        old_id = el.get('id')
+        if self._elements.get(old_id) is el:
+            del self._elements[old_id]
+        el.set('id', el_id)
+        self._elements[el_id] = el
+    
+    def _append_element(self, parent, el):
+        """Appends a new element (with an id) to an element of the tree, updating the id index."""
+        
+        parent.append(el)
+        self._elements[el.get('id')] = el
+    
+    def _remove_element(self, el_id):
+        """Removes the element with the given id from the tree and from the id index."""
+        
+        self._load_tree()
+        el = self._elements.pop(el_id)
+        el.getparent().remove(el)
+    
+    @property
+    def detached(self):
+        """Read-only property. True if the net does not keep an XML tree (see detach)."""
+        return self._tree is None and self._pnml is None
+    
+    def detach(self):
+        """Drops the XML tree kept since the net was loaded, to save memory.
+        
+        The content of the net, node and arc elements that PNLab does not
+        use (e.g. the toolspecific elements of other tools, or unknown
+        children of their graphics) is kept as XML strings in a side store,
+        and the tree is generated again from the objects (adding that content
+        back) every time the net is saved. The id of the net element is kept
+        too. Pages and reference nodes are not kept: saved nets have one page.
+        """
+        
+        self._load_tree()
+        if self._tree is None:
+            return
+        
+        self._foreign = self._foreign_content()
+        self._net_id = self._tree.find('net').get('id', self.name)
+        for nodes in (self.places, self.transitions):
+            for node in nodes.itervalues():
+                node.hasTreeElement = False
+                node._references = _NO_REFERENCES
+        for p in self.places.itervalues():
+            for arcs in (p._incoming_arcs, p._outgoing_arcs):
+                for arc in arcs.itervalues():
+                    arc._treeElement = None
+        
+        self._tree = None
+        self._elements = {}
+    
+    def _foreign_content(self):
+        """Returns the side store the net has (or would have once detached), as a new dictionary."""
+        
+        self._load_tree()
+        if self._tree is None:
+            return dict(self._foreign)
+        
+        #Elements of the tree by the key of their content in the side store:
+        elements = [(None, self._tree.find('net'))]
+        for nodes in (self.places, self.transitions):
+            for node in nodes.itervalues():
+                if node.hasTreeElement:
+                    elements.append((repr(node), self._elements.get(repr(node))))
+        for p in self.places.itervalues():
+            for arcs in (p._incoming_arcs, p._outgoing_arcs):
+                for arc in arcs.itervalues():
+                    if arc.hasTreeElement:
+                        elements.append((repr(arc), self._elements.get(arc._treeElement)))
+        
+        foreign = {}
+        for key, el in elements:
+            children = self._foreign_children(el) if el is not None else ''
+            if children:
+                foreign[key] = children
+        return foreign
+    
+    @staticmethod
+    def _foreign_children(el, path = None):
+        """Returns the content of an element that PNLab does not use, as an XML string.
+        
+        Unknown children are kept whole. The known children that hold others
+        (see _KNOWN_CHILDREN) are kept as an empty copy with just their
+        unknown content, if they have any, which _merge_foreign puts back into
+        the element that PNLab generates.
+        
+        Keyword Arguments:
+        path -- Path of the element, its tag by default.
+        """
+        
+        if path is None:
+            path = el.tag
+        return ''.join(PetriNet._foreign_child(child, path) for child in el)
+    
+    @staticmethod
+    def _foreign_child(child, path):
+        """Returns the content of a child of the element with the given path that PNLab does not use (see _foreign_children)."""
+        
+        tag = child.tag
+        if not isinstance(tag, basestring):
+            return ''
+        if tag not in _KNOWN_CHILDREN.get(path, ()) or (tag == 'toolspecific' and child.get('tool') != 'PNLab'):
+            if child.nsmap:
+                #Namespaces declared by the ancestors, which are still in a partial tree while streaming, are left out:
+                child = copy.deepcopy(child)
+                ET.cleanup_namespaces(child)
+            return ET.tostring(child, with_tail = False)
+        
+        child_path = path + '/' + tag
+        if child_path not in _KNOWN_CHILDREN:
+            return ''
+        content = PetriNet._foreign_children(child, child_path)
+        if not content:
+            return ''
+        empty = ET.tostring(ET.Element(tag, child.attrib))
+        return empty[:-2] + '>' + content + '</' + tag + '>'
+    
+    @staticmethod
+    def _merge_foreign(el, foreign, path):
+        """Adds the elements of the side store (see _foreign_children) to an element generated by PNLab, with the given path."""
+        
+        known = _KNOWN_CHILDREN.get(path, ())
+        for child in foreign:
+            tag = child.tag
+            if tag in known and path + '/' + tag in _KNOWN_CHILDREN and (tag != 'toolspecific' or child.get('tool') == 'PNLab'):
+                target = el.find('toolspecific[@tool="PNLab"]' if tag == 'toolspecific' else tag)
+                if target is not None:
+                    PetriNet._merge_foreign(target, list(child), path + '/' + tag)
+                    continue
+            el.append(child)
+    
+    def _store_foreign(self, key, foreign):
+        """Adds an XML string to the side store of a detached net."""
+        
+        if foreign:
+            self._foreign[key] = self._foreign.get(key, '') + foreign
+    
+    def _foreign_elements(self, key):
+        """Returns a list with the elements kept in the side store of a detached net for a node, arc or the net (key None)."""
+        
+        foreign = self._foreign.get(key)
+        if not foreign:
+            return []
+        return list(ET.fromstring('<foreign>' + foreign + '</foreign>'))
         
     
     def add_place(self, p):
@@ -806,12 +1308,7 @@ class PetriNet(object):
         
         self._place_counter += 1
         p._id = "P{:0>3d}".format(self._place_counter)
-        
-        p._incoming_arcs = {}
-        p._outgoing_arcs = {}
-        self.places[repr(p)] = p
-        
-        p.petri_net = self
+        self._insert_node(p, self.places)
     
     def add_transition(self, t):
         """Adds a transition from the Petri Net.
@@ -824,12 +1321,20 @@ class PetriNet(object):
         
         self._transition_counter += 1
         t._id = "T{:0>3d}".format(self._transition_counter)
+        self._insert_node(t, self.transitions)
+    
+    def _insert_node(self, node, nodes):
+        """Adds a node, which already has its id, to the net ('nodes' is the places or the transitions dictionary)."""
+        
+        position = Vec2(node.position)
         
-        t._incoming_arcs = {}
-        t._outgoing_arcs = {}
-        self.transitions[repr(t)] = t
+        node._incoming_arcs = {}
+        node._outgoing_arcs = {}
+        nodes[repr(node)] = node
         
-        t.petri_net = self
+        node.petri_net = self
+        self._attach_position(node, position)
+        self._reindex_node(node)
     
     def remove_place(self, place):
         """Removes a place from the Petri Net.
@@ -855,11 +1360,13 @@ class PetriNet(object):
             self.remove_arc(p, self.transitions[t])
         
         for ref in p._references:
-            el = self._tree.find('//*[@id="' + ref + '"]')
-            el.getparent().remove(el)
+            self._remove_element(ref)
         
         p = self.places.pop(key)
-        p._references.clear()
+        self._foreign.pop(key, None)
+        self._unindex_node(p)
+        self._detach_position(p)
+        p._references = _NO_REFERENCES
         p.petri_net = None
         
         return p
@@ -887,15 +1394,110 @@ class PetriNet(object):
             self.remove_arc(t, self.places[p])
         
         for ref in t._references:
-            el = self._tree.find('//*[@id="' + ref + '"]')
-            el.getparent().remove(el)
+            self._remove_element(ref)
         
         t = self.transitions.pop(key)
-        t._references.clear()
+        self._foreign.pop(key, None)
+        self._unindex_node(t)
+        self._detach_position(t)
+        t._references = _NO_REFERENCES
         t.petri_net = None
         
         return t
     
+    def _attach_position(self, node, position):
+        """Moves the position of a node being added into the coordinate array."""
+        
+        node._row = self._coordinates.allocate(position)
+        node._position = None
+    
+    def _detach_position(self, node):
+        """Gives a node being removed its own position again."""
+        
+        position = Vec2(node.position)
+        self._coordinates.release(node._row)
+        node._row = -1
+        node._position = position
+    
+    def transform_positions(self, scale = 1.0, offset = Vec2()):
+        """Scales the position of every node by 'scale' and then adds 'offset' (a Vec2), with one vectorized operation."""
+        self._coordinates.transform(scale, offset)
+    
+    def translate_positions(self, offset):
+        """Adds 'offset' (a Vec2) to the position of every node, with one vectorized operation."""
+        self._coordinates.transform(1.0, offset)
+    
+    def scale_positions(self, center, scale):
+        """Scales the position of every node around 'center' (a Vec2), with one vectorized operation."""
+        self._coordinates.transform(scale, center*(1.0 - scale))
+    
+    def _unindex_node(self, node):
+        """Removes a node from the secondary indexes."""
+        
+        index = self._place_index if isinstance(node, Place) else self._transition_index
+        node_id = repr(node)
+        for key in node._index_keys:
+            nodes = index.get(key)
+            if nodes is not None:
+                nodes.pop(node_id, None)
+                if not nodes:
+                    del index[key]
+        node._index_keys = ()
+    
+    def _reindex_node(self, node):
+        """Updates the secondary indexes after a node was added or its name, type or flags changed."""
+        
+        self._unindex_node(node)
+        index = self._place_index if isinstance(node, Place) else self._transition_index
+        node_id = repr(node)
+        #Key tuples are shared by every node with the same key:
+        keys = tuple(self._index_key_pool.setdefault(key, key) for key in node._index_keys_for())
+        for key in keys:
+            index.setdefault(key, {})[node_id] = node
+        node._index_keys = keys
+    
+    @staticmethod
+    def _find(index, keys):
+        """Returns the nodes stored under every key, intersecting the smallest index sets first."""
+        
+        sets = sorted((index.get(key, {}) for key in keys), key = len)
+        if not sets[0]:
+            return []
+        return [node for node_id, node in sets[0].iteritems() if all(node_id in other for other in sets[1:])]
+    
+    def find_places(self, place_type = None, name = None, flags = ()):
+        """Finds places through the secondary indexes, without scanning the net.
+        
+        Keyword Arguments:
+        place_type -- If set, only places of this type (one of the PlaceTypes constants).
+        name -- If set, only places with this name (without prefixes, i. e. place.name).
+        flags -- Sequence of PlaceFlags constants, only places with all these flags set.
+        
+        Returns a list of Place objects. If no criteria is given, every place is returned.
+        """
+        
+        keys = ([('type', place_type)] if place_type is not None else []) + \
+                ([('name', name)] if name is not None else []) + [('flag', flag) for flag in flags]
+        if not keys:
+            return self.places.values()
+        return PetriNet._find(self._place_index, keys)
+    
+    def find_transitions(self, transition_type = None, name = None):
+        """Finds transitions through the secondary indexes, without scanning the net.
+        
+        Keyword Arguments:
+        transition_type -- If set, only transitions of this type (one of the TransitionTypes constants).
+        name -- If set, only transitions with this name (without prefixes, i. e. transition.name).
+        
+        Returns a list of Transition objects. If no criteria is given, every transition is returned.
+        """
+        
+        keys = ([('type', transition_type)] if transition_type is not None else []) + \
+                ([('name', name)] if name is not None else [])
+        if not keys:
+            return self.transitions.values()
+        return PetriNet._find(self._transition_index, keys)
+    
     def _can_connect(self, source, target):
         """
         Checks if an arc can be created between the source and target objects. 
@@ -971,12 +1573,38 @@ class PetriNet(object):
             arc = self.transitions[src]._outgoing_arcs.pop(trgt, None)
             self.places[trgt]._incoming_arcs.pop(src, None)
         
+        if arc:
+            self._foreign.pop(repr(arc), None)
         if arc and arc.hasTreeElement:
-            arc_el = arc.petri_net._tree.find('//*[@id="' + arc._treeElement + '"]')
-            arc_el.getparent().remove(arc_el)
+            arc.petri_net._remove_element(arc._treeElement)
 
+    @staticmethod
+    def _resolve_node(elements, nodes, node_id):
+        """Returns the node with a given id in a PNML file, following reference nodes.
+        
+        'elements' has the node and reference elements, and 'nodes' the Node
+        objects, by their id in the file.
+        """
+        
+        el = elements.get(node_id)
+        visited = set()
+        while el is not None and el.tag[:9] == 'reference' and el not in visited:
+            visited.add(el)
+            el = elements.get(el.get('ref'))
+        if el is None or el.tag[:9] == 'reference':
+            raise Exception("Referenced node '" + node_id + "' was not found.")
+        return nodes[el.get('id')]
+    
     @classmethod
     def from_ElementTree(cls, et, name = None):
+        """Builds PetriNet objects from an ElementTree with PNML nets, returns a list with them.
+        
+        Every net is read in one pass through dictionaries of the elements by
+        id: places and transitions (in the net and its pages) are added first,
+        then every reference node gets a new id and is resolved to the node it
+        references, and finally the arcs are added. The element ids and the
+        attributes pointing to them are renamed at the end, each one once.
+        """
         
         pnets = []
         root = et.getroot()
@@ -989,126 +1617,131 @@ class PetriNet(object):
             
             pn = PetriNet(name, net)
             
-            try:
-                scale = float(net.find('toolspecific[@tool="PNLab"]/scale/text').text)
-                pn.scale = scale
-            except:
-                pass
+            #Node and reference elements by their id in the file:
+            elements = {}
+            for el in net.iter('place', 'transition', 'referencePlace', 'referenceTransition'):
+                elements.setdefault(el.get('id'), el)
             
-            first_queue = [net]
-            second_queue = []
+            #New ids, and nodes, by id in the file:
+            new_ids = {}
+            nodes = {}
             
-            while first_queue:
-                current = first_queue.pop()
-                second_queue.append(current)
-                
+            containers = PetriNet._net_containers(net)
+            for current in containers:
                 for p_el in current.findall('place'):
                     p = Place.fromETreeElement(p_el)
                     pn.add_place(p)
-                    place_id = p_el.get('id')
-                    for e in net.findall('.//referencePlace[@ref="' + place_id + '"]'):
-                        e.set('ref', repr(p))
-                    for e in net.findall('.//arc[@source="' + place_id + '"]'):
-                        e.set('source', repr(p))
-                    for e in net.findall('.//arc[@target="' + place_id + '"]'):
-                        e.set('target', repr(p))
-                    p_el.set('id', repr(p))
+                    new_ids[p_el.get('id')] = repr(p)
+                    nodes[p_el.get('id')] = p
                 for t_el in current.findall('transition'):
                     t = Transition.fromETreeElement(t_el)
                     pn.add_transition(t)
-                    transition_id = t_el.get('id')
-                    for e in net.findall('.//referenceTransition[@ref="' + transition_id + '"]'):
-                        e.set('ref', repr(t))
-                    for e in net.findall('.//arc[@source="' + transition_id + '"]'):
-                        e.set('source', repr(t))
-                    for e in net.findall('.//arc[@target="' + transition_id + '"]'):
-                        e.set('target', repr(t))
-                    t_el.set('id', repr(t))
-                
-                pages = current.findall('page')
-                if pages:
-                    first_queue += pages
+                    new_ids[t_el.get('id')] = repr(t)
+                    nodes[t_el.get('id')] = t
             
-            while second_queue:
-                current = second_queue.pop()
-                
-                for ref in net.findall('.//referencePlace'):
-                    reference = ref
-                    try:
-                        while reference.tag[:9] == 'reference':
-                            reference = net.find('.//*[@id="' + reference.get('ref') + '"]')
-                    except:
-                        raise Exception("Referenced node '" + ref.get('ref') + "' was not found.")
-                    
-                    place_id = ref.get('id')
-                    pn._place_counter += 1
-                    new_id = 'P{:0>3d}'.format(pn._place_counter)
-                    for e in net.findall('.//referencePlace[@ref="' + place_id + '"]'):
-                        e.set('ref', new_id)
-                    for e in net.findall('.//arc[@source="' + place_id + '"]'):
-                        e.set('source', new_id)
-                    for e in net.findall('.//arc[@target="' + place_id + '"]'):
-                        e.set('target', new_id)
-                    ref.set('id', new_id)
-                    pn.places[reference.get('id')]._references.add(new_id)
-                
-                for ref in net.findall('.//referenceTransition'):
-                    reference = ref
-                    try:
-                        while reference.tag[:9] == 'reference':
-                            reference = net.find('.//*[@id="' + reference.get('ref') + '"]')
-                    except:
-                        raise Exception("Referenced node '" + ref.get('ref') + "' was not found.")
-                    
-                    transition_id = ref.get('id')
-                    pn._transition_counter += 1
-                    new_id = 'P{:0>3d}'.format(pn._transition_counter)
-                    for e in net.findall('.//referenceTransition[@ref="' + transition_id + '"]'):
-                        e.set('ref', new_id)
-                    for e in net.findall('.//arc[@source="' + transition_id + '"]'):
-                        e.set('source', new_id)
-                    for e in net.findall('.//arc[@target="' + transition_id + '"]'):
-                        e.set('target', new_id)
-                    ref.set('id', new_id)
-                    pn.places[reference.get('id')]._references.add(new_id)
-                
+            for tag, prefix in (('referencePlace', 'P'), ('referenceTransition', 'T')):
+                for ref in net.iter(tag):
+                    if prefix == 'P':
+                        pn._place_counter += 1
+                        new_id = 'P{:0>3d}'.format(pn._place_counter)
+                    else:
+                        pn._transition_counter += 1
+                        new_id = 'T{:0>3d}'.format(pn._transition_counter)
+                    PetriNet._resolve_node(elements, nodes, ref.get('ref'))._add_reference(new_id)
+                    new_ids[ref.get('id')] = new_id
+            
+            for current in reversed(containers):
                 for arc in current.findall('arc'):
-                    source = net.find('.//*[@id="' + arc.get('source') + '"]')
-                    try:
-                        while source.tag[:9] == 'reference':
-                            source = net.find('.//*[@id="' + source.get('ref') + '"]')
-                    except:
-                        raise Exception("Referenced node '" + arc.get('source') + "' was not found.")
-                    
-                    target = net.find('.//*[@id="' + arc.get('target') + '"]')
-                    try:
-                        while target.tag[:9] == 'reference':
-                            target = net.find('.//*[@id="' + target.get('ref') + '"]')
-                    except:
-                        raise Exception("Referenced node '" + arc.get('target') + "' was not found.")
+                    source = PetriNet._resolve_node(elements, nodes, arc.get('source'))
+                    target = PetriNet._resolve_node(elements, nodes, arc.get('target'))
                     
-                    if source.tag == 'place':
-                        source = pn.places[source.get('id')]
-                        target = pn.transitions[target.get('id')]
-                    else:
-                        source = pn.transitions[source.get('id')]
-                        target = pn.places[target.get('id')]
-                        
                     try:
                         weight = int(arc.find('inscription/text').text)
                     except:
                         weight = 1
                     pn.add_arc(source, target, weight, arc.get('id'))
-                
+            
+            PetriNet._rename_elements(net, new_ids)
+            pn._index_elements()
+            
             pnets.append(pn)
         
         return pnets
+    
+    @staticmethod
+    def _pnml_scale(net):
+        """Returns the scale of a PNML net element, or None if it has none."""
+        
+        try:
+            return float(net.find('toolspecific[@tool="PNLab"]/scale/text').text)
+        except:
+            return None
+    
+    @staticmethod
+    def _net_containers(net):
+        """Returns a PNML net element and its pages (at any depth), in the order from_ElementTree reads their nodes.
+        
+        Arcs are read in the reverse order.
+        """
         
+        containers = []
+        queue = [net]
+        while queue:
+            current = queue.pop()
+            containers.append(current)
+            queue += current.findall('page')
+        return containers
+    
+    @staticmethod
+    def _pnml_ids(net):
+        """Returns a dictionary with the ids that from_ElementTree gives to the nodes and references of a PNML net element by their id in the file."""
+        
+        new_ids = {}
+        counters = {'P': 0, 'T': 0}
+        for current in PetriNet._net_containers(net):
+            for tag, prefix in (('place', 'P'), ('transition', 'T')):
+                for el in current.findall(tag):
+                    counters[prefix] += 1
+                    new_ids[el.get('id')] = '{0}{1:0>3d}'.format(prefix, counters[prefix])
+        for tag, prefix in (('referencePlace', 'P'), ('referenceTransition', 'T')):
+            for el in net.iter(tag):
+                counters[prefix] += 1
+                new_ids[el.get('id')] = '{0}{1:0>3d}'.format(prefix, counters[prefix])
+        return new_ids
+    
+    @staticmethod
+    def _rename_elements(net, new_ids):
+        """Renames the node and reference elements of a PNML net element, and the attributes pointing to them, each one once."""
+        
+        for el in net.iter('place', 'transition', 'referencePlace', 'referenceTransition'):
+            el_id = el.get('id')
+            if el_id in new_ids:
+                el.set('id', new_ids[el_id])
+            if el.get('ref') in new_ids:
+                el.set('ref', new_ids[el.get('ref')])
+        for arc in net.iter('arc'):
+            if arc.get('source') in new_ids:
+                arc.set('source', new_ids[arc.get('source')])
+            if arc.get('target') in new_ids:
+                arc.set('target', new_ids[arc.get('target')])
+    
     
     def to_ElementTree(self):
+        """Returns an ElementTree with the PNML of the net (a copy, which can be modified)."""
+        
+        self._load_tree()
+        if self._tree is None:
+            return self._detached_ElementTree()
+        
+        self._merge_tree()
+        return copy.deepcopy(self._tree)
+    
+    def _merge_tree(self):
+        """Merges the objects of the net into the XML tree kept since it was loaded or first saved."""
         
         net = self._tree.find('net')
         page = net.find('page')
+        self._tree_merged = True
         
         toolspecific = net.find('toolspecific[@tool="PNLab"]')
         if toolspecific is None:
@@ -1122,58 +1755,93 @@ class PetriNet(object):
             if p.hasTreeElement:
                 p._merge_treeElement()
             else:
-                page.append(p._build_treeElement())
+                self._append_element(page, p._build_treeElement())
         
         for t in self.transitions.itervalues():
             if t.hasTreeElement:
                 t._merge_treeElement()
             else:
-                page.append(t._build_treeElement())
+                self._append_element(page, t._build_treeElement())
         
         for p in self.places.itervalues():
             for arc in p._incoming_arcs.itervalues():
                 if arc.hasTreeElement:
                     arc._merge_treeElement()
                 else:
-                    page.append(arc._build_treeElement())
+                    self._append_element(page, arc._build_treeElement())
 
             for arc in p._outgoing_arcs.itervalues():
                 if arc.hasTreeElement:
                     arc._merge_treeElement()
                 else:
-                    page.append(arc._build_treeElement())
+                    self._append_element(page, arc._build_treeElement())
+    
+    def _detached_ElementTree(self, page_elements = True):
+        """Generates the XML tree of a detached net from its objects and its side store.
         
-        return copy.deepcopy(self._tree)
+        Keyword Arguments:
+        page_elements -- If False, the page is left empty (write_pnml streams
+                         the places, transitions and arcs into it).
+        """
+        
+        root_el = ET.Element('pnml', {'xmlns': 'http://www.pnml.org/version-2009/grammar/pnml'})
+        net = ET.SubElement(root_el, 'net', {'id': self._net_id or self.name,
+                                             'type': 'http://www.pnml.org/version-2009/grammar/ptnet'
+                                             })
+        tmp = ET.SubElement(net, 'name')
+        tmp = ET.SubElement(tmp, 'text')
+        tmp.text = self.name
+        page = ET.SubElement(net, 'page', {'id': 'PNLab_top_lvl'})
+        if page_elements:
+            page.extend(self._detached_page_elements())
+        tmp = ET.SubElement(net, 'toolspecific', {'tool' : 'PNLab'})
+        tmp = ET.SubElement(tmp, 'scale')
+        tmp = ET.SubElement(tmp, 'scale')
+        tmp = ET.SubElement(tmp, 'text')
+        tmp.text = str(self.scale)
+        self._merge_foreign(net, self._foreign_elements(None), 'net')
+        
+        return ET.ElementTree(root_el)
     
-    @classmethod
-    def from_pnml_file(cls, filename):
-        et = ET.parse(filename)
-        # http://wiki.tei-c.org/index.php/Remove-Namespaces.xsl
-        xslt='''<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
-        <xsl:output method="xml" indent="no"/>
-        
-        <xsl:template match="/|comment()|processing-instruction()">
-            <xsl:copy>
-              <xsl:apply-templates/>
-            </xsl:copy>
-        </xsl:template>
-        
-        <xsl:template match="*">
-            <xsl:element name="{local-name()}">
-              <xsl:apply-templates select="@*|node()"/>
-            </xsl:element>
-        </xsl:template>
-        
-        <xsl:template match="@*">
-            <xsl:attribute name="{local-name()}">
-              <xsl:value-of select="."/>
-            </xsl:attribute>
-        </xsl:template>
-        </xsl:stylesheet>
-        '''
-        xslt_doc=ET.parse(io.BytesIO(xslt))
-        transform=ET.XSLT(xslt_doc)
-        et=transform(et)
+    def _detached_page_elements(self, level = None):
+        """Generates the place, transition and arc elements of a detached net, one at a time.
+        
+        Keyword Arguments:
+        level -- If given, the elements are indented the way pretty printing
+                 does at that depth.
+        """
+        
+        #Building the elements marks the objects as having one, which only holds while the tree is kept:
+        for nodes in (self.places, self.transitions):
+            for node in nodes.itervalues():
+                el = node._build_treeElement()
+                node.hasTreeElement = False
+                yield self._complete_element(el, repr(node), level)
+        
+        for p in self.places.itervalues():
+            for arcs in (p._incoming_arcs, p._outgoing_arcs):
+                for arc in arcs.itervalues():
+                    el = arc._build_treeElement()
+                    arc._treeElement = None
+                    yield self._complete_element(el, repr(arc), level)
+    
+    def _complete_element(self, el, key, level):
+        """Appends the foreign content of a node or arc to its element and indents it (if level is not None)."""
+        
+        foreign = self._foreign_elements(key)
+        self._merge_foreign(el, foreign, el.tag)
+        if level is not None:
+            #Foreign content can mix text and elements, which only _indent leaves as libxml2 does:
+            if foreign:
+                _indent(el, level)
+            else:
+                ET.indent(el, '  ', level = level)
+        return el
+    
+    @staticmethod
+    def _pnml_file_name(filename):
+        """Returns the name of the nets of a PNML file: its base name, without extension."""
+        
         filename = os.path.basename(filename)
         if '.pnml.xml' in filename:
             filename = filename[:filename.rfind('.pnml.xml')]
@@ -1181,9 +1849,167 @@ class PetriNet(object):
             filename = filename[:filename.rfind('.pnml')]
         elif '.' in filename:
             filename = filename[:filename.rfind('.')]
+        return filename
+    
+    @classmethod
+    def from_pnml_file(cls, filename, detach = False):
+        """Reads the Petri Nets of a PNML file, returns a list of PetriNet objects.
+        
+        Keyword Arguments:
+        detach -- If True, returns detached nets (see PetriNet.detach), for
+                  analysis workloads. They are read with from_pnml_stream,
+                  so the XML tree of the file is never built as a whole.
+        """
+        
+        if detach:
+            return PetriNet.from_pnml_stream(filename)
+        
+        et = ET.parse(filename)
+        _strip_namespaces(et.getroot())
+        ET.cleanup_namespaces(et)
+        
+        return PetriNet.from_ElementTree(et, name = PetriNet._pnml_file_name(filename))
+    
+    @classmethod
+    def from_pnml_stream(cls, filename):
+        """Reads the Petri Nets of a PNML file incrementally, returns a list of PetriNet objects.
+        
+        The file is parsed with lxml's iterparse: every place, transition,
+        reference and arc element is turned into an object (or a pending
+        arc) as soon as it is complete, and then cleared and removed from
+        the partial tree, so huge files can be read with memory bounded by
+        the size of the nets and not by the size of the XML.
+        
+        The nets are detached (see PetriNet.detach): the content of the net,
+        node and arc elements that PNLab does not use is kept in the side
+        store of the net. Arcs from or to reference nodes are connected
+        to the referenced nodes.
+        """
+        
+        name = PetriNet._pnml_file_name(filename)
+        pnets = []
+        pn = None
+        
+        for event, el in ET.iterparse(filename, events = ('start', 'end'), huge_tree = True):
+            tag = el.tag
+            if not isinstance(tag, basestring):
+                continue
+            if tag[0] == '{':
+                tag = tag[tag.find('}') + 1:]
+            
+            if event == 'start':
+                if tag == 'net':
+                    pn = PetriNet(name)
+                    pn.detach()
+                    pn._net_id = el.get('id', name)
+                    #Nodes, reference targets and arcs, by id in the file:
+                    nodes = {}
+                    references = {}
+                    arcs = []
+                continue
+            
+            if pn is None:
+                continue
+            
+            parent = el.getparent()
+            if tag in ('place', 'transition'):
+                _strip_namespaces(el)
+                if tag == 'place':
+                    node = Place.fromETreeElement(el)
+                    node.hasTreeElement = False
+                    pn.add_place(node)
+                else:
+                    node = Transition.fromETreeElement(el)
+                    node.hasTreeElement = False
+                    pn.add_transition(node)
+                nodes[el.get('id')] = node
+                pn._store_foreign(repr(node), PetriNet._foreign_children(el))
+            elif tag in ('referencePlace', 'referenceTransition'):
+                references[el.get('id')] = el.get('ref')
+            elif tag == 'arc':
+                _strip_namespaces(el)
+                try:
+                    weight = int(el.find('inscription/text').text)
+                except:
+                    weight = 1
+                #Children of other tools go to the side store once the arc is created:
+                arcs.append((el.get('source'), el.get('target'), weight, PetriNet._foreign_children(el)))
+            elif tag == 'net':
+                for source, target, weight, foreign in arcs:
+                    arc = pn.add_arc(PetriNet._resolve_reference(nodes, references, source),
+                                     PetriNet._resolve_reference(nodes, references, target), weight)
+                    if arc is not None:
+                        pn._store_foreign(repr(arc), foreign)
+                pnets.append(pn)
+                pn = None
+            elif parent is not None and ET.QName(parent).localname == 'net' and tag != 'page':
+                _strip_namespaces(el)
+                if tag == 'toolspecific' and el.get('tool') == 'PNLab':
+                    try:
+                        pn.scale = float(el.find('scale/text').text)
+                    except:
+                        pass
+                pn._store_foreign(None, PetriNet._foreign_child(el, 'net'))
+            else:
+                #Contents of the elements above, and pages, which are cleared as their elements complete:
+                continue
             
-        return PetriNet.from_ElementTree(et, name = filename)
+            el.clear()
+            if parent is not None:
+                while el.getprevious() is not None:
+                    del parent[0]
+        
+        return pnets
+    
+    @staticmethod
+    def _resolve_reference(nodes, references, node_id):
+        """Returns the node with a given id in a PNML file, following the reference nodes (see from_pnml_stream)."""
+        
+        visited = set()
+        while node_id in references and node_id not in visited:
+            visited.add(node_id)
+            node_id = references[node_id]
+        if node_id not in nodes:
+            raise Exception("Referenced node '" + str(node_id) + "' was not found.")
+        return nodes[node_id]
     
     def to_pnml_file(self, file_name):
-        et = self.to_ElementTree()
-        et.write(file_name, encoding = 'utf-8', xml_declaration = True, pretty_print = True)
\ No newline at end of file
+        self.write_pnml(file_name)
+    
+    def write_pnml(self, f):
+        """Writes the PNML of the net to a file object (or file name), without copying the XML tree.
+        
+        Nets that keep an XML tree merge their objects into it and write it
+        directly. Detached nets stream their page with lxml's xmlfile: the
+        element of every place, transition and arc is generated, indented
+        and written on its own, so the tree of the net is never built. The
+        output is the same, byte for byte, as writing the tree returned by
+        to_ElementTree with pretty printing.
+        """
+        
+        self._load_tree()
+        if self._tree is not None:
+            self._merge_tree()
+            self._tree.write(f, encoding = 'utf-8', xml_declaration = True, pretty_print = True)
+            return
+        
+        if not (self.places or self.transitions):
+            self._detached_ElementTree().write(f, encoding = 'utf-8', xml_declaration = True, pretty_print = True)
+            return
+        
+        if isinstance(f, basestring):
+            with open(f, 'wb') as file_obj:
+                self.write_pnml(file_obj)
+            return
+        
+        #The rest of the document is small, and written by the same serializer to get the same bytes:
+        et = self._detached_ElementTree(page_elements = False)
+        head, _, tail = ET.tostring(et, encoding = 'UTF-8', xml_declaration = True,
+                                       pretty_print = True).partition('<page id="PNLab_top_lvl"/>')
+        f.write(head)
+        with ET.xmlfile(f, encoding = 'utf-8') as xf:
+            with xf.element('page', {'id': 'PNLab_top_lvl'}):
+                for el in self._detached_page_elements(level = 3):
+                    xf.write('\n      ', el)
+                xf.write('\n    ')
+        f.write(tail)
\ No newline at end of file
@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+
+Binary snapshots of PetriNet objects, used as a cache of the nets of RPNP
+projects (PNML is still the format of the projects and of the exchange with
+other tools).
+
+A snapshot file has a header, a string pool and one entry per net. All the
+numbers are little-endian:
+
+- Header: magic 'PNLS', format version (uint16), padding (uint16), number of
+  strings (uint32), size of the pool (uint64) and number of entries (uint32).
+- String pool: the end offset of every string (uint64) and then the UTF-8
+  bytes of all of them. Strings are referred to by their index, 0 stands for
+  no string.
+- Entries: a record with the key, the signature and the name of the net
+  (string indexes), its scale (double), place and transition counters, and
+  the number of places, transitions, references and arcs (uint32), followed
+  by a table with each of them (see _PLACE, _TRANSITION, _REFERENCE and
+  _ARC). References and arcs refer to nodes by index: places first, then
+  transitions.
+
+An entry has what PetriNet.from_ElementTree reads from the first net of a
+PNML file, in the same order: nodes in the order they are added (with the
+ids they get), the references of every node, and the arcs that are added,
+with the id of their element. It is written from the objects of the net,
+right after the net is read from its PNML file or saved to it, when they
+have the values of the file; the XML tree of the net gives the order of the
+elements and the ids. Nets read from a snapshot only record where their
+PNML file is, and read it to build their XML tree the first time they need
+it (see PetriNet._defer_tree), so they are saved exactly like nets read
+from the PNML file.
+"""
+
+import gc
+import mmap
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+from PetriNets import PetriNet, Place, Transition, PlaceFlags
+from utils.Vector import Vec2
+
+FORMAT_VERSION = 2
+
+_MAGIC = 'PNLS'
+_HEADER = struct.Struct('<4sHHIQI')
+_ENTRY = struct.Struct('<IIIdIIIIII')
+
+#Bits of the flags field of the node tables:
+_FLAGS = (PlaceFlags.RUNNING_CONDITION, PlaceFlags.EFFECT, PlaceFlags.OUTPUT, PlaceFlags.NEGATED)
+
+_PLACE = np.dtype([('id', '<u4'), ('name', '<u4'), ('type', '<u4'), ('flags', 'u1'),
+                   ('init_marking', '<i8'), ('capacity', '<i8'), ('x', '<f8'), ('y', '<f8')])
+_TRANSITION = np.dtype([('id', '<u4'), ('name', '<u4'), ('type', '<u4'), ('flags', 'u1'), ('isHorizontal', 'u1'),
+                        ('rate', '<f8'), ('priority', '<i8'), ('x', '<f8'), ('y', '<f8')])
+_REFERENCE = np.dtype([('id', '<u4'), ('node', '<u4')])
+_ARC = np.dtype([('source', '<u4'), ('target', '<u4'), ('weight', '<i8'), ('element', '<u4')])
+
+class _StringPool(object):
+    """Strings of a snapshot being written, each one stored once."""
+
+    def __init__(self):
+
+        super(_StringPool, self).__init__()
+
+        #Index 0 is kept for None:
+        self.strings = ['']
+        self._index = {}
+
+    def add(self, s):
+        """Returns the index of a string (or unicode object), adding it to the pool if needed."""
+
+        if s is None:
+            return 0
+        if isinstance(s, unicode):
+            s = s.encode('utf-8')
+        index = self._index.get(s)
+        if index is None:
+            index = self._index[s] = len(self.strings)
+            self.strings.append(s)
+        return index
+
+def _flags(node):
+    flags = 0
+    for bit, flag in enumerate(_FLAGS):
+        if getattr(node, flag):
+            flags |= 1 << bit
+    return flags
+
+def _saved(value):
+    """Returns a float as it is read back from PNML, where it is written with str()."""
+    return float(str(value))
+
+def _place_row(p, node_id, pool, saved):
+    position = p.position
+    x, y = position.x, position.y
+    if saved:
+        position = Vec2(_saved(x), _saved(y))
+        x, y = position.x, position.y
+    return (pool.add(node_id), pool.add(p.name), pool.add(p.type), _flags(p), p.init_marking, p.capacity, x, y)
+
+def _transition_row(t, node_id, pool, saved):
+    position = t.position
+    x, y, rate = position.x, position.y, t.rate
+    if saved:
+        position = Vec2(_saved(x), _saved(y))
+        x, y, rate = position.x, position.y, _saved(rate)
+    return (pool.add(node_id), pool.add(t.name), pool.add(t.type), _flags(t), bool(t.isHorizontal), rate, t.priority, x, y)
+
+def _net_tables(petri_net, pool):
+    """Returns the entry record fields (without key, signature and name) and the tables of a net.
+
+    The XML tree of the net (or the one it would write, if it is detached)
+    is gone through like PetriNet.from_ElementTree does, for the order of
+    the nodes, references and arcs and the ids they get. The values come
+    from the object of every element, which has the values of the file
+    right after the net is read or saved. Elements without one (e.g. of
+    removed nodes, which stay in the tree) are read like from_ElementTree
+    does.
+    """
+
+    petri_net._load_tree()
+    if petri_net._tree is not None:
+        net = petri_net._tree.find('net')
+        detached = False
+        saved = petri_net._tree_merged
+    else:
+        net = petri_net._detached_ElementTree().getroot().find('net')
+        detached = True
+        saved = True
+
+    def node_object(el, nodes, node_id):
+        """Returns the object that the element of a node was read from or saved from, or None."""
+
+        el_id = el.get('id')
+        node = nodes.get(el_id)
+        if node is None or detached:
+            return node
+        if saved:
+            return node if node.hasTreeElement and petri_net._elements.get(el_id) is el else None
+        #Once read, the element has the id of the object read from it:
+        return node if el_id == node_id else None
+
+    #Node and reference elements by their id in the file:
+    elements = {}
+    for el in net.iter('place', 'transition', 'referencePlace', 'referenceTransition'):
+        elements.setdefault(el.get('id'), el)
+
+    #Nodes by id in the file, as (is a place, row), and their objects by row:
+    nodes = {}
+    place_objects = []
+    transition_objects = []
+    places = []
+    transitions = []
+    containers = PetriNet._net_containers(net)
+    for current in containers:
+        for p_el in current.findall('place'):
+            node_id = 'P{:0>3d}'.format(len(places) + 1)
+            p = node_object(p_el, petri_net.places, node_id)
+            place_objects.append(p)
+            nodes[p_el.get('id')] = (True, len(places))
+            places.append(_place_row(p, node_id, pool, saved) if p is not None
+                          else _place_row(Place.fromETreeElement(p_el), node_id, pool, False))
+        for t_el in current.findall('transition'):
+            node_id = 'T{:0>3d}'.format(len(transitions) + 1)
+            t = node_object(t_el, petri_net.transitions, node_id)
+            transition_objects.append(t)
+            nodes[t_el.get('id')] = (False, len(transitions))
+            transitions.append(_transition_row(t, node_id, pool, saved) if t is not None
+                               else _transition_row(Transition.fromETreeElement(t_el), node_id, pool, False))
+
+    def index(node):
+        is_place, row = node
+        return row if is_place else len(places) + row
+
+    def node_of(node):
+        is_place, row = node
+        return place_objects[row] if is_place else transition_objects[row]
+
+    place_counter = len(places)
+    transition_counter = len(transitions)
+    references = []
+    for tag in ('referencePlace', 'referenceTransition'):
+        for ref in net.iter(tag):
+            if tag == 'referencePlace':
+                place_counter += 1
+                new_id = 'P{:0>3d}'.format(place_counter)
+            else:
+                transition_counter += 1
+                new_id = 'T{:0>3d}'.format(transition_counter)
+            references.append((pool.add(new_id), index(PetriNet._resolve_node(elements, nodes, ref.get('ref')))))
+
+    arcs = []
+    connected = set()
+    for current in reversed(containers):
+        for arc_el in current.findall('arc'):
+            source = PetriNet._resolve_node(elements, nodes, arc_el.get('source'))
+            target = PetriNet._resolve_node(elements, nodes, arc_el.get('target'))
+            if source[0] == target[0]:
+                raise Exception('Arcs should go either from a place to a transition or vice versa and they should exist in the PN.')
+            #Like PetriNet.add_arc, only the first arc between two nodes is added:
+            if (source, target) in connected:
+                continue
+            connected.add((source, target))
+
+            arc_id = arc_el.get('id')
+            source_node = node_of(source)
+            target_node = node_of(target)
+            arc = None
+            if arc_id is not None and source_node is not None and target_node is not None:
+                arc = source_node._outgoing_arcs.get(repr(target_node))
+            if arc is not None:
+                if detached:
+                    found = arc_id == repr(arc)
+                else:
+                    found = arc._treeElement == arc_id and (not saved or petri_net._elements.get(arc_id) is arc_el)
+                if not found:
+                    arc = None
+            if arc is not None:
+                weight = arc.weight
+            else:
+                try:
+                    weight = int(arc_el.find('inscription/text').text)
+                except:
+                    weight = 1
+            arcs.append((index(source), index(target), weight, pool.add(arc_id)))
+
+    scale = PetriNet._pnml_scale(net)
+    record = (1.0 if scale is None else scale, place_counter, transition_counter,
+              len(places), len(transitions), len(references), len(arcs))
+    return record, (np.array(places, dtype = _PLACE), np.array(transitions, dtype = _TRANSITION),
+                    np.array(references, dtype = _REFERENCE), np.array(arcs, dtype = _ARC))
+
+def write_snapshot(filename, entries):
+    """Writes a snapshot file.
+
+    Positional Arguments:
+    filename -- Name of the file, which is replaced atomically (where the
+                system allows it), so readers never see half a snapshot.
+    entries -- Sequence of (key, signature, name, PetriNet) tuples. Keys
+               and signatures are strings for the caller (e.g. the path of
+               the net in a project, and a checksum of its PNML). The name
+               is the one the net gets when its PNML file is read. Every net
+               must have just been read from that file or saved to it.
+    """
+
+    pool = _StringPool()
+    nets = []
+    for key, signature, name, petri_net in entries:
+        record, tables = _net_tables(petri_net, pool)
+        nets.append(((pool.add(key), pool.add(signature), pool.add(name)) + record, tables))
+
+    ends = np.cumsum([len(s) for s in pool.strings], dtype = '<u8')
+    tmp_name = filename + '.tmp'
+    with open(tmp_name, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, FORMAT_VERSION, 0, len(pool.strings), int(ends[-1]), len(nets)))
+        f.write(ends.tostring())
+        f.write(''.join(pool.strings))
+        for record, tables in nets:
+            f.write(_ENTRY.pack(*record))
+            for table in tables:
+                f.write(table.tostring())
+    if os.name == 'nt' and os.path.exists(filename):
+        os.remove(filename)
+    os.rename(tmp_name, filename)
+
+def read_snapshot(filename, read_pnml):
+    """Reads a snapshot file (memory-mapped). Returns a list of (key, signature, PetriNet) tuples.
+
+    Positional Arguments:
+    read_pnml -- Function that returns, for a key and a signature, a
+                 function that returns the content of the PNML file, which
+                 the nets keep to build their XML tree.
+
+    Raises an Exception if the file is not a snapshot, or a snapshot of
+    another format version.
+    """
+
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise Exception('Not a PNLab snapshot file.')
+        data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    #The nets are built at once, the garbage collector would go through their objects again and again while they grow:
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _read_entries(data, read_pnml)
+    finally:
+        data.close()
+        if gc_enabled:
+            gc.enable()
+
+def _read_entries(data, read_pnml):
+
+    magic, version, _, num_strings, pool_size, num_entries = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        raise Exception('Not a PNLab snapshot file.')
+    if version != FORMAT_VERSION:
+        raise Exception('Unsupported snapshot format version: ' + str(version) + '.')
+
+    offset = _HEADER.size
+    ends = np.frombuffer(data, '<u8', num_strings, offset).tolist()
+    offset += 8*num_strings
+    pool = data[offset:offset + pool_size]
+    offset += pool_size
+    strings = []
+    start = 0
+    for end in ends:
+        s = pool[start:end]
+        start = end
+        #Like lxml, plain strings for ASCII text and unicode objects otherwise:
+        try:
+            s.decode('ascii')
+        except UnicodeDecodeError:
+            s = s.decode('utf-8')
+        strings.append(s)
+    strings[0] = None
+
+    entries = []
+    for _ in xrange(num_entries):
+        record = _ENTRY.unpack_from(data, offset)
+        offset += _ENTRY.size
+        key, signature, name, scale, place_counter, transition_counter = record[:6]
+        tables = []
+        for dtype, count in zip((_PLACE, _TRANSITION, _REFERENCE, _ARC), record[6:]):
+            tables.append(np.frombuffer(data, dtype, count, offset).tolist())
+            offset += dtype.itemsize*count
+
+        petri_net = _build_net(strings, strings[name], scale, *tables)
+        petri_net._place_counter = place_counter
+        petri_net._transition_counter = transition_counter
+        petri_net._defer_tree(read_pnml(strings[key], strings[signature]), strings[name])
+        entries.append((strings[key], strings[signature], petri_net))
+
+    return entries
+
+def _set_flags(node, name, flags):
+    #The constructor takes the flags from the prefixes of the name, they are set again as they were:
+    node._name = name
+    for bit, flag in enumerate(_FLAGS):
+        setattr(node, flag, bool(flags & (1 << bit)))
+
+def _build_net(strings, net_name, scale, places, transitions, references, arcs):
+
+    petri_net = PetriNet(net_name)
+    petri_net.scale = scale
+
+    nodes = []
+    for node_id, name, node_type, flags, init_marking, capacity, x, y in places:
+        p = Place(strings[name], strings[node_type], Vec2(x, y), init_marking, capacity)
+        _set_flags(p, strings[name], flags)
+        p._id = strings[node_id]
+        p.hasTreeElement = True
+        petri_net._insert_node(p, petri_net.places)
+        nodes.append(p)
+
+    for node_id, name, node_type, flags, isHorizontal, rate, priority, x, y in transitions:
+        t = Transition(strings[name], strings[node_type], Vec2(x, y), bool(isHorizontal), rate, priority)
+        _set_flags(t, strings[name], flags)
+        t._id = strings[node_id]
+        t.hasTreeElement = True
+        petri_net._insert_node(t, petri_net.transitions)
+        nodes.append(t)
+
+    for ref_id, node in references:
+        nodes[node]._add_reference(strings[ref_id])
+
+    for source, target, weight, element in arcs:
+        petri_net.add_arc(nodes[source], nodes[target], weight, strings[element])
+
+    return petri_net
+
+class _ZipMember(object):
+    """Function that reads a PNML file of an RPNP (zip) file, checking that it did not change."""
+
+    def __init__(self, project_file, path, signature):
+
+        super(_ZipMember, self).__init__()
+
+        self.project_file = project_file
+        self.path = path
+        self.signature = signature
+
+    def __call__(self):
+
+        with zipfile.ZipFile(self.project_file, 'r') as zip_file:
+            if pnml_signatures(zip_file).get(self.path) != self.signature:
+                raise Exception("The PNML file '" + self.path + "' changed since the project was opened.")
+            return zip_file.read(self.path)
+
+def cache_file_name(project_file):
+    """Returns the name of the snapshot cache of a project file."""
+    return project_file + '.snapshot'
+
+def pnml_signatures(zip_file):
+    """Returns a dictionary with the path of every PNML file of an open RPNP (zip) file as keys and its signature as values.
+
+    Signatures are made of the CRC and the size recorded by the zip file,
+    so they are read without decompressing anything.
+    """
+
+    return dict((x.filename, '{0:08x}:{1}'.format(x.CRC & 0xffffffff, x.file_size))
+                for x in zip_file.infolist() if x.filename[-5:] == '.pnml')
+
+def load_project_cache(project_file, zip_file):
+    """Returns a dictionary with the PetriNet objects of a project by the path of their PNML file, read from its snapshot cache.
+
+    Returns None if there is no cache, or it cannot be read, or it does
+    not have exactly the PNML files of the project as they are.
+
+    The nets read their PNML file from the project file when they need their
+    XML tree (e.g. to be saved), so it must not be written before that.
+    """
+
+    try:
+        entries = read_snapshot(cache_file_name(project_file),
+                                lambda path, signature: _ZipMember(project_file, path, signature))
+    except Exception:
+        return None
+
+    signatures = pnml_signatures(zip_file)
+    if len(entries) != len(signatures):
+        return None
+    petri_nets = {}
+    for key, signature, petri_net in entries:
+        if signatures.get(key) != signature:
+            return None
+        petri_nets[key] = petri_net
+    return petri_nets
+
+def save_project_cache(project_file, zip_file, petri_nets):
+    """Writes the snapshot cache of a project.
+
+    Positional Arguments:
+    zip_file -- The RPNP (zip) file of the project, with the PNML files of
+                the nets already written.
+    petri_nets -- Dictionary with the PetriNet objects of the project by the
+                  path of their PNML file, just read from them or saved to
+                  them. Nets without a PNML file in the zip file are left
+                  out.
+    """
+
+    signatures = pnml_signatures(zip_file)
+    write_snapshot(cache_file_name(project_file),
+                   [(path, signatures[path], PetriNet._pnml_file_name(path), petri_nets[path])
+                    for path in sorted(petri_nets) if path in signatures])
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+
+Compares the scalar and the batch (NumPy) simulators.
+
+Usage: python bench_batch_simulation.py [branches] [length] [replications] [end_time]
+
+Both simulators run the same number of replications in a single process.
+Besides timing them, it checks that their mean tokens and throughputs agree
+within the confidence intervals, and exits with an error status otherwise.
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from synthetic import concurrent_cycles
+from Analysis.CompiledNet import CompiledNet
+from Analysis.Simulation import simulate
+from Analysis.BatchSimulation import simulate_batch
+
+def _worst_difference(a, b):
+    """Largest difference between the means of two results, in units of their combined half widths."""
+
+    worst = 0.0
+    for x, y in ((a.mean_tokens(), b.mean_tokens()), (a.mean_throughputs(), b.mean_throughputs())):
+        for key, (mean, half_width) in x.iteritems():
+            other_mean, other_half_width = y[key]
+            scale = np.hypot(half_width, other_half_width)
+            if scale > 0:
+                worst = max(worst, abs(mean - other_mean)/scale)
+    return worst
+
+if __name__ == '__main__':
+    branches = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    replications = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    end_time = float(sys.argv[4]) if len(sys.argv) > 4 else 50.0
+
+    net = CompiledNet(concurrent_cycles(branches, length))
+
+    start = time.time()
+    scalar = simulate(net, end_time, replications, seed = 1, processes = 1)
+    scalar_time = time.time() - start
+
+    start = time.time()
+    batch = simulate_batch(net, end_time, replications, seed = 1)
+    batch_time = time.time() - start
+
+    print 'Replications: {0}, firings: {1}'.format(replications, sum(batch.firings))
+    print 'Scalar: {0:.3f} s'.format(scalar_time)
+    print 'Batch:  {0:.3f} s ({1:.1f}x)'.format(batch_time, scalar_time/batch_time)
+
+    worst = _worst_difference(scalar, batch)
+    print 'Largest difference between the means: {0:.2f} combined half widths.'.format(worst)
+    if worst > 4:
+        print 'ERROR: the simulators disagree.'
+        sys.exit(1)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+
+Compares the memory used by the nodes and arcs of a PetriNet, and the time
+of a full garbage collection, with the dict-backed layout that Place,
+Transition, _Arc and Vec2 had and with __slots__.
+
+Usage: python bench_node_memory.py [nodes ...]
+
+Defaults to nets of 10000, 100000 and 1000000 nodes (half places, half
+transitions, every transition with one input and one output arc, like
+synthetic.concurrent_cycles). Both layouts are frozen copies of the
+attributes that the classes set, as they were when they got __slots__
+(later changes, like the coordinate array that now holds the positions,
+are left out, so only this change is measured):
+
+- Dict-backed: every node, arc and position (Vec2) has a __dict__, every
+  node has its own (empty) set of references and its own index key tuples.
+- Slotted: the same attributes in __slots__, nodes without references share
+  one empty frozenset, and the index key tuples are pooled per net.
+
+For every node and arc, the size of the object is counted (with its __dict__,
+if it has one), its position, its set of references (unless it is the
+shared one) and its index keys (each key tuple once). The values of the
+attributes (names, ids, numbers) and the arc dictionaries are the same in
+both layouts and are not counted. Every net is built in a forked process,
+which also reports the growth of its resident memory (Linux only) and the
+time of a gc.collect() pass.
+"""
+
+import gc
+import os
+import sys
+import time
+
+class _DictVec2(object):
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+class _SlotVec2(object):
+
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+def _init_node(node, name, node_type, position, vec2, references):
+    #Same attributes, in the same order, as the Node constructor (the flags are stored by properties):
+    node.petri_net = None
+    node._index_keys = ()
+    node._runningCondition = False
+    node._effect = False
+    node._output = False
+    node._negated = False
+    node._name = name
+    node._type = node_type
+    node.position = vec2(*position)
+    node._incoming_arcs = {}
+    node._outgoing_arcs = {}
+    node.hasTreeElement = False
+    node._references = references
+    node._id = name
+
+class _DictPlace(object):
+
+    def __init__(self, name, position):
+        _init_node(self, name, 'regular', position, _DictVec2, set())
+        self.init_marking = 0
+        self.capacity = 0
+        self.current_marking = 0
+
+class _DictTransition(object):
+
+    def __init__(self, name, position):
+        _init_node(self, name, 'stochastic', position, _DictVec2, set())
+        self.isHorizontal = False
+        self.rate = 1.0
+        self.priority = 1
+
+class _DictArc(object):
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self.weight = 1
+        self._treeElement = None
+        self.petri_net = source.petri_net
+
+_NO_REFERENCES = frozenset()
+
+class _SlotNode(object):
+
+    __slots__ = ('_runningCondition', '_effect', '_output', '_negated', '_index_keys', '_name', '_type',
+                 'petri_net', 'position', '_incoming_arcs', '_outgoing_arcs', 'hasTreeElement', '_references', '_id')
+
+class _SlotPlace(_SlotNode):
+
+    __slots__ = ('init_marking', 'capacity', 'current_marking')
+
+    def __init__(self, name, position):
+        _init_node(self, name, 'regular', position, _SlotVec2, _NO_REFERENCES)
+        self.init_marking = 0
+        self.capacity = 0
+        self.current_marking = 0
+
+class _SlotTransition(_SlotNode):
+
+    __slots__ = ('isHorizontal', 'rate', 'priority')
+
+    def __init__(self, name, position):
+        _init_node(self, name, 'stochastic', position, _SlotVec2, _NO_REFERENCES)
+        self.isHorizontal = False
+        self.rate = 1.0
+        self.priority = 1
+
+class _SlotArc(object):
+
+    __slots__ = ('source', 'target', 'weight', '_treeElement', 'petri_net')
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self.weight = 1
+        self._treeElement = None
+        self.petri_net = source.petri_net
+
+#Classes of every layout, and whether index key tuples are pooled:
+LAYOUTS = (('dicts', _DictPlace, _DictTransition, _DictArc, False),
+           ('slots', _SlotPlace, _SlotTransition, _SlotArc, True))
+
+class _Net(object):
+    """What a PetriNet holds of its nodes: the node dictionaries and the secondary index."""
+
+    def __init__(self):
+
+        super(_Net, self).__init__()
+
+        self.places = {}
+        self.transitions = {}
+        self.index = {}
+        self.key_pool = {}
+
+def _insert(net, node, nodes, pooled):
+    nodes[node._id] = node
+    node.petri_net = net
+    keys = (('type', node._type), ('name', node._name))
+    if pooled:
+        keys = tuple(net.key_pool.setdefault(key, key) for key in keys)
+    for key in keys:
+        net.index.setdefault(key, {})[node._id] = node
+    node._index_keys = keys
+
+def _connect(arc):
+    arc.source._outgoing_arcs[arc.target._id] = arc
+    arc.target._incoming_arcs[arc.source._id] = arc
+
+def build(layout, branches, length):
+    """Builds the nodes and arcs of synthetic.concurrent_cycles(branches, length) with the classes of a layout."""
+
+    _, place_cls, transition_cls, arc_cls, pooled = layout
+    net = _Net()
+    for b in xrange(branches):
+        places = []
+        for i in xrange(length):
+            p = place_cls('b{0}_p{1}'.format(b, i), (100.0*i, 100.0*b))
+            _insert(net, p, net.places, pooled)
+            places.append(p)
+        for i in xrange(length):
+            t = transition_cls('b{0}_t{1}'.format(b, i), (100.0*i + 50, 100.0*b))
+            _insert(net, t, net.transitions, pooled)
+            _connect(arc_cls(places[i], t))
+            _connect(arc_cls(t, places[(i + 1) % length]))
+    return net
+
+def _status(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])*1024
+
+def _object_size(obj):
+    size = sys.getsizeof(obj)
+    attrs = getattr(obj, '__dict__', None)
+    if attrs is not None:
+        size += sys.getsizeof(attrs)
+    return size
+
+def measure(net):
+    """Returns the bytes of the nodes, arcs, positions, references and index keys of a net."""
+
+    keys = set()
+    total = 0
+    for nodes in (net.places, net.transitions):
+        for node in nodes.itervalues():
+            total += _object_size(node) + _object_size(node.position)
+            if node._references is not _NO_REFERENCES:
+                total += sys.getsizeof(node._references)
+            total += sys.getsizeof(node._index_keys)
+            for key in node._index_keys:
+                if id(key) not in keys:
+                    keys.add(id(key))
+                    total += sys.getsizeof(key)
+            for arc in node._outgoing_arcs.itervalues():
+                total += _object_size(arc)
+    return total
+
+def run(layout, branches, length):
+    """Builds a net in a forked process. Returns (node bytes, RSS growth bytes, GC seconds)."""
+
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        gc.collect()
+        rss = _status('VmRSS')
+        net = build(layout, branches, length)
+        rss = _status('VmRSS') - rss
+        start = time.time()
+        gc.collect()
+        gc_time = time.time() - start
+        os.write(write_end, '{0} {1} {2!r}'.format(measure(net), rss, gc_time))
+        os._exit(0)
+
+    os.close(write_end)
+    result = os.read(read_end, 256)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    nodes, rss, gc_time = result.split()
+    return int(nodes), int(rss), float(gc_time)
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    length = 50
+
+    print '{0:>10}{1:>8}{2:>14}{3:>12}{4:>14}'.format('Nodes', 'Layout', 'Objects (MB)', 'RSS (MB)', 'GC pass (s)')
+    for size in sizes:
+        branches = max(1, size//(2*length))
+        results = []
+        for layout in LAYOUTS:
+            results.append(run(layout, branches, length))
+            print '{0:>10}{1:>8}{2:>14.1f}{3:>12.1f}{4:>14.3f}'.format(2*branches*length, layout[0], results[-1][0]/1e6,
+                                                                     results[-1][1]/1e6, results[-1][2])
+        (old_objects, old_rss, old_gc), (new_objects, new_rss, new_gc) = results
+        print '{0:>10}{1:>8}{2:>14.2f}{3:>12.2f}{4:>14.2f}'.format(2*branches*length, 'ratio', float(old_objects)/new_objects,
+                                                                 float(old_rss)/new_rss, old_gc/new_gc)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+
+Compares sequential and parallel reachability graph generation.
+
+Usage: python bench_parallel_reachability.py [branches] [length] [processes]
+
+Besides timing both builders, it checks that they give the same state ids
+and the same edges, and exits with an error status otherwise.
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from synthetic import concurrent_cycles
+from Analysis.CompiledNet import CompiledNet
+from Analysis.Reachability import build_reachability_graph
+from Analysis.ParallelReachability import build_reachability_graph_parallel, same_graph
+
+if __name__ == '__main__':
+    branches = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    net = CompiledNet(concurrent_cycles(branches, length))
+
+    start = time.time()
+    sequential = build_reachability_graph(net, 'bfs')
+    sequential_time = time.time() - start
+
+    start = time.time()
+    parallel = build_reachability_graph_parallel(net, processes)
+    parallel_time = time.time() - start
+
+    print 'States: {0}, edges: {1}'.format(sequential.num_states, sequential.num_edges)
+    print 'Sequential: {0:.3f} s'.format(sequential_time)
+    print 'Parallel:   {0:.3f} s'.format(parallel_time)
+
+    if not same_graph(sequential, parallel):
+        print 'ERROR: parallel and sequential graphs differ.'
+        sys.exit(1)
+    print 'Graphs are identical.'
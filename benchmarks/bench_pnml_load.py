@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+
+Times loading PNML files of growing size, to check that it takes linear time.
+
+Usage: python bench_pnml_load.py [arcs ...]
+
+Defaults to nets of 5000, 10000, 25000 and 50000 arcs (sets of cycles of 50
+places and 50 transitions, one input and one output arc per transition),
+saved to a temporary file first. The time per arc should stay roughly
+constant as the nets grow.
+"""
+
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from synthetic import concurrent_cycles
+from PetriNets import PetriNet
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [5000, 10000, 25000, 50000]
+    length = 50
+
+    handle, filename = tempfile.mkstemp(suffix = '.pnml')
+    os.close(handle)
+    try:
+        print '{0:>10}{1:>10}{2:>14}{3:>16}'.format('Nodes', 'Arcs', 'Load (s)', 'us per arc')
+        for size in sizes:
+            branches = max(1, size//(2*length))
+            net = concurrent_cycles(branches, length)
+            net.to_pnml_file(filename)
+            del net
+
+            start = time.time()
+            loaded = PetriNet.from_pnml_file(filename)[0]
+            elapsed = time.time() - start
+
+            arcs = sum(len(p.outgoing_arcs) + len(p.incoming_arcs) for p in loaded.places.itervalues())
+            nodes = len(loaded.places) + len(loaded.transitions)
+            print '{0:>10}{1:>10}{2:>14.3f}{3:>16.1f}'.format(nodes, arcs, elapsed, 1e6*elapsed/arcs)
+    finally:
+        os.remove(filename)
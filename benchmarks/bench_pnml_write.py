@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+
+Compares the time and peak memory of writing PNML files by building (or
+copying) the whole XML tree, as the writer did before, and with write_pnml.
+
+Usage: python bench_pnml_write.py [arcs ...]
+
+Defaults to nets of 25000, 50000 and 100000 arcs (sets of cycles of 50
+places and 50 transitions, one input and one output arc per transition).
+Every net is written while it keeps its XML tree (after a first save, so the
+tree is complete) and once detached. Every write runs in a forked process,
+whose peak resident memory (Linux only) is reported as the growth over its
+memory when it started (glibc is asked to return the freed memory of
+the parent first). Both writers must give the same bytes.
+"""
+
+import ctypes
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from synthetic import concurrent_cycles
+
+def _status(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])*1024
+
+def _tree_write(net, filename):
+    et = net.to_ElementTree()
+    et.write(filename, encoding = 'utf-8', xml_declaration = True, pretty_print = True)
+
+def _stream_write(net, filename):
+    net.write_pnml(filename)
+
+def measure(write, net, filename):
+    """Runs write(net, filename) in a forked process. Returns (seconds, bytes of peak memory growth)."""
+
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        #Returns the memory freed by the parent to the system, so the writer cannot reuse it unnoticed,
+        #and resets the peak resident memory of the process to its current value:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        rss = _status('VmRSS')
+        start = time.time()
+        write(net, filename)
+        elapsed = time.time() - start
+        os.write(write_end, '{0!r} {1}'.format(elapsed, _status('VmHWM') - rss))
+        os._exit(0)
+
+    os.close(write_end)
+    result = os.read(read_end, 256)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    elapsed, peak = result.split()
+    return float(elapsed), int(peak)
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [25000, 50000, 100000]
+    length = 50
+
+    handles = [tempfile.mkstemp(suffix = '.pnml') for _ in xrange(2)]
+    for handle, _ in handles:
+        os.close(handle)
+    old_file, new_file = [filename for _, filename in handles]
+    try:
+        print '{0:>10}{1:>10}{2:>12}{3:>12}{4:>12}{5:>14}{6:>14}'.format('Arcs', 'Net', 'Tree (s)', 'Stream (s)',
+                                                                       'Speedup', 'Tree (MB)', 'Stream (MB)')
+        for size in sizes:
+            branches = max(1, size//(2*length))
+            net = concurrent_cycles(branches, length)
+            net.to_pnml_file(old_file)
+            for label in ('kept', 'detached'):
+                if label == 'detached':
+                    net.detach()
+                old_time, old_peak = measure(_tree_write, net, old_file)
+                new_time, new_peak = measure(_stream_write, net, new_file)
+                with open(old_file, 'rb') as old, open(new_file, 'rb') as new:
+                    if old.read() != new.read():
+                        raise Exception('The outputs of the writers differ.')
+                print '{0:>10}{1:>10}{2:>12.3f}{3:>12.3f}{4:>12.2f}{5:>14.1f}{6:>14.1f}'.format(
+                    2*branches*length, label, old_time, new_time, old_time/new_time, old_peak/1e6, new_peak/1e6)
+            del net
+    finally:
+        for filename in (old_file, new_file):
+            os.remove(filename)
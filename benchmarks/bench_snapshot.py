@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+
+Compares opening the nets of an RPNP project from its PNML files and from
+its snapshot cache.
+
+Usage: python bench_snapshot.py [arcs ...]
+
+Defaults to nets of 10000, 50000 and 100000 arcs (sets of cycles of 50
+places and 50 transitions, one input and one output arc per transition).
+Every net is saved in a project (zip) file, like PNLab does, and its cache
+is written next to it, from the objects of the net. Then the net is read
+back from the PNML file, and from the cache after checking that it is up to
+date (the PNML file is not read then: the net reads it from the project
+when it needs its XML tree, e.g. when it is saved). The times to write the
+PNML file and the cache are also reported.
+
+Both nets must be the same: nodes (with their ids, in the same order),
+their names, types, flags, markings, capacities, rates, priorities,
+positions and references, the arcs and their weights, and the counters,
+scale and name of the net. Saving them must give the same bytes.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from cStringIO import StringIO
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from synthetic import concurrent_cycles
+from PetriNets import PetriNet, Place
+import Snapshot
+
+def _node_state(node):
+    state = [repr(node), node.name, node.type, node.position.x, node.position.y, sorted(node._references)]
+    state += [getattr(node, flag) for flag in Snapshot._FLAGS]
+    if isinstance(node, Place):
+        state += [node.init_marking, node.capacity]
+    else:
+        state += [node.isHorizontal, node.rate, node.priority]
+    for arcs in (node._incoming_arcs, node._outgoing_arcs):
+        state.append([(repr(arc), arc.weight, arc._treeElement) for arc in arcs.itervalues()])
+    return state
+
+def net_state(net):
+    """Returns everything that is compared between the nets read from the PNML file and from the cache."""
+
+    return ([net.name, net.scale, net._place_counter, net._transition_counter]
+            + [_node_state(node) for nodes in (net.places, net.transitions) for node in nodes.itervalues()])
+
+def saved_pnml(net):
+    f = StringIO()
+    net.write_pnml(f)
+    return f.getvalue()
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 50000, 100000]
+    length = 50
+
+    tmp_dir = tempfile.mkdtemp()
+    project_file = os.path.join(tmp_dir, 'project.rpnp')
+    pnml_file = os.path.join(tmp_dir, 'cycles.pnml')
+    path = 'Tasks/cycles.pnml'
+    try:
+        print '{0:>10}{1:>16}{2:>16}{3:>16}{4:>16}{5:>10}{6:>12}'.format('Arcs', 'PNML save (s)', 'Cache save (s)',
+                                                                         'PNML open (s)', 'Cache open (s)', 'Speedup',
+                                                                         'Cache (MB)')
+        for size in sizes:
+            branches = max(1, size//(2*length))
+            net = concurrent_cycles(branches, length)
+
+            start = time.time()
+            net.to_pnml_file(pnml_file)
+            zip_file = zipfile.ZipFile(project_file, 'w')
+            zip_file.write(pnml_file, path)
+            pnml_save = time.time() - start
+            start = time.time()
+            Snapshot.save_project_cache(project_file, zip_file, {path: net})
+            cache_save = time.time() - start
+            zip_file.close()
+            os.remove(pnml_file)
+            del net
+
+            start = time.time()
+            zip_file = zipfile.ZipFile(project_file, 'r')
+            with open(pnml_file, 'wb') as f:
+                f.write(zip_file.read(path))
+            from_pnml = PetriNet.from_pnml_file(pnml_file)[0]
+            zip_file.close()
+            pnml_open = time.time() - start
+            os.remove(pnml_file)
+
+            start = time.time()
+            zip_file = zipfile.ZipFile(project_file, 'r')
+            from_cache = Snapshot.load_project_cache(project_file, zip_file)[path]
+            zip_file.close()
+            cache_open = time.time() - start
+
+            if net_state(from_cache) != net_state(from_pnml):
+                raise Exception('The nets read from the PNML file and from the cache differ.')
+            if saved_pnml(from_cache) != saved_pnml(from_pnml):
+                raise Exception('The nets read from the PNML file and from the cache are saved differently.')
+            arcs = sum(len(p.incoming_arcs) + len(p.outgoing_arcs) for p in from_cache.places.itervalues())
+            print '{0:>10}{1:>16.3f}{2:>16.3f}{3:>16.3f}{4:>16.3f}{5:>10.1f}{6:>12.1f}'.format(
+                arcs, pnml_save, cache_save, pnml_open, cache_open, pnml_open/cache_open,
+                os.path.getsize(Snapshot.cache_file_name(project_file))/1e6)
+            del from_pnml, from_cache
+    finally:
+        shutil.rmtree(tmp_dir)
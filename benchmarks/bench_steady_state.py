@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+
+Times the steady-state solvers on the CTMC of a set of concurrent cycles.
+
+Usage: python bench_steady_state.py [branches] [length] [method ...]
+
+The chain has length**branches states (8 cycles of 6 places give 1679616).
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from synthetic import concurrent_cycles
+from Analysis.CTMC import build_ctmc
+from Analysis.SteadyState import solve_steady_state
+
+if __name__ == '__main__':
+    branches = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    methods = sys.argv[3:] or ['auto', 'bicgstab', 'gmres', 'gauss-seidel', 'power']
+
+    start = time.time()
+    ctmc = build_ctmc(concurrent_cycles(branches, length))
+    print 'States: {0}, transitions: {1}, built in {2:.3f} s'.format(ctmc.num_states, ctmc.Q.nnz - ctmc.num_states,
+                                                                   time.time() - start)
+
+    for method in methods:
+        start = time.time()
+        try:
+            result = solve_steady_state(ctmc, method, tol = 1e-9)
+        except Exception as e:
+            print '{0:<14}failed: {1}'.format(method, e)
+            continue
+        print '{0:<14}{1:>8.3f} s  ({2}, {3} iterations, residual {4:.2e})'.format(method, time.time() - start, result.method,
+                                                                                result.iterations, result.residual)
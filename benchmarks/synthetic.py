@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from PetriNets import PetriNet, Place, PlaceTypes, Transition, TransitionTypes, Vec2
+
+def concurrent_cycles(branches, length, tokens = 1, name = 'cycles'):
+    """Builds a PetriNet made of 'branches' independent cycles of 'length' places each.
+
+    The first place of every cycle holds 'tokens' tokens, so the reachability
+    graph has length**branches states when tokens = 1.
+    """
+
+    pn = PetriNet(name)
+    for b in xrange(branches):
+        places = []
+        for i in xrange(length):
+            p = Place('b{0}_p{1}'.format(b, i), PlaceTypes.REGULAR, Vec2(100*i, 100*b), tokens if i == 0 else 0, 0)
+            pn.add_place(p)
+            places.append(p)
+        for i in xrange(length):
+            t = Transition('b{0}_t{1}'.format(b, i), TransitionTypes.TIMED_STOCHASTIC, Vec2(100*i + 50, 100*b), rate = 1.0 + i)
+            pn.add_transition(t)
+            pn.add_arc(places[i], t)
+            pn.add_arc(t, places[(i + 1) % length])
+    return pn
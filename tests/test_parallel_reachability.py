@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+
+Checks that the parallel reachability graph builder gives the same state ids
+and the same edges as the sequential one.
+
+Usage: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from PetriNets import PetriNet, Place, PlaceTypes, Transition, TransitionTypes, Vec2
+from Analysis.Reachability import build_reachability_graph
+from Analysis.ParallelReachability import build_reachability_graph_parallel, same_graph
+
+def _cycles(branches, length):
+    """Independent cycles of 'length' places, with a token in the first place of each one."""
+
+    pn = PetriNet('cycles')
+    for b in xrange(branches):
+        places = []
+        for i in xrange(length):
+            p = Place('b{0}_p{1}'.format(b, i), PlaceTypes.REGULAR, Vec2(), 1 if i == 0 else 0, 0)
+            pn.add_place(p)
+            places.append(p)
+        for i in xrange(length):
+            t = Transition('b{0}_t{1}'.format(b, i), TransitionTypes.TIMED_STOCHASTIC, Vec2())
+            pn.add_transition(t)
+            pn.add_arc(places[i], t)
+            pn.add_arc(t, places[(i + 1) % length])
+    return pn
+
+def _producer_consumer():
+    """Bounded buffer with immediate transitions of different priorities and a deadlock."""
+
+    pn = PetriNet('producer_consumer')
+    ready = Place('ready', PlaceTypes.REGULAR, Vec2(), 3, 0)
+    buffer_place = Place('buffer', PlaceTypes.REGULAR, Vec2(), 0, 4)
+    consumed = Place('consumed', PlaceTypes.REGULAR, Vec2(), 0, 0)
+    for p in (ready, buffer_place, consumed):
+        pn.add_place(p)
+
+    produce = Transition('produce', TransitionTypes.TIMED_STOCHASTIC, Vec2(), rate = 2.0)
+    consume = Transition('consume', TransitionTypes.IMMEDIATE, Vec2(), priority = 1)
+    drop = Transition('drop', TransitionTypes.IMMEDIATE, Vec2(), priority = 2)
+    for t in (produce, consume, drop):
+        pn.add_transition(t)
+    pn.add_arc(ready, produce)
+    pn.add_arc(produce, buffer_place, 2)
+    pn.add_arc(buffer_place, consume)
+    pn.add_arc(consume, consumed)
+    pn.add_arc(buffer_place, drop, 3)
+    return pn
+
+def _source():
+    """Unbounded net: a transition without input places that feeds a place."""
+
+    pn = PetriNet('source')
+    p = Place('p', PlaceTypes.REGULAR, Vec2(), 0, 0)
+    t = Transition('t', TransitionTypes.TIMED_STOCHASTIC, Vec2())
+    pn.add_place(p)
+    pn.add_transition(t)
+    pn.add_arc(t, p)
+    return pn
+
+class ParallelReachabilityTest(unittest.TestCase):
+
+    def assertSameGraph(self, sequential, parallel):
+
+        self.assertEqual(sequential.num_states, parallel.num_states)
+        for state in xrange(sequential.num_states):
+            self.assertEqual(sequential.marking(state), parallel.marking(state))
+        self.assertEqual(set(sequential.edges()), set(parallel.edges()))
+        self.assertEqual(sequential.deadlocks(), parallel.deadlocks())
+        self.assertEqual(sequential.complete, parallel.complete)
+        self.assertTrue(same_graph(sequential, parallel))
+
+    def test_cycles(self):
+        #More states than the initial slots of a partition, so they grow while other workers map them:
+        pn = _cycles(4, 6)
+        sequential = build_reachability_graph(pn, 'bfs')
+        for processes in (1, 2, 3):
+            parallel = build_reachability_graph_parallel(pn, processes, chunk_states = 50)
+            self.assertSameGraph(sequential, parallel)
+            self.assertEqual(parallel.num_states, 6**4)
+
+    def test_priorities(self):
+        pn = _producer_consumer()
+        for priorities in (True, False):
+            sequential = build_reachability_graph(pn, 'bfs', priorities = priorities)
+            parallel = build_reachability_graph_parallel(pn, 2, priorities = priorities, chunk_states = 3)
+            self.assertSameGraph(sequential, parallel)
+            self.assertTrue(parallel.deadlocks())
+
+    def test_state_ids(self):
+        pn = _cycles(3, 5)
+        sequential = build_reachability_graph(pn, 'bfs')
+        parallel = build_reachability_graph_parallel(pn, 2, chunk_states = 7)
+        for state in xrange(sequential.num_states):
+            self.assertEqual(parallel.state_id(sequential.marking(state)), state)
+
+    def test_worker_error(self):
+        #The markings overflow the typecode in the workers, which must report it instead of leaving the master waiting:
+        pn = _source()
+        with self.assertRaises(Exception) as sequential:
+            build_reachability_graph(pn, 'bfs', typecode = 'B')
+        for processes in (1, 2):
+            with self.assertRaises(Exception) as parallel:
+                build_reachability_graph_parallel(pn, processes, typecode = 'B', chunk_states = 10)
+            self.assertIn(str(sequential.exception), str(parallel.exception))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Adrián Revuelta Cuauhtli
+
+Checks the steady-state solvers on small chains.
+
+Usage: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from PetriNets import PetriNet, Place, PlaceTypes, Transition, TransitionTypes, Vec2
+from Analysis.SteadyState import METHODS, solve_steady_state
+
+def _dead():
+    """Net whose initial marking is dead: its CTMC has one state and no transitions."""
+
+    pn = PetriNet('dead')
+    p = Place('p', PlaceTypes.REGULAR, Vec2(), 0, 0)
+    t = Transition('t', TransitionTypes.TIMED_STOCHASTIC, Vec2())
+    pn.add_place(p)
+    pn.add_transition(t)
+    pn.add_arc(p, t)
+    return pn
+
+def _cycle(length):
+    """Cycle of 'length' places with one token, and transitions of rates 1, 2, ..."""
+
+    pn = PetriNet('cycle')
+    places = []
+    for i in xrange(length):
+        p = Place('p{0}'.format(i), PlaceTypes.REGULAR, Vec2(), 1 if i == 0 else 0, 0)
+        pn.add_place(p)
+        places.append(p)
+    for i in xrange(length):
+        t = Transition('t{0}'.format(i), TransitionTypes.TIMED_STOCHASTIC, Vec2(), rate = 1.0 + i)
+        pn.add_transition(t)
+        pn.add_arc(places[i], t)
+        pn.add_arc(t, places[(i + 1) % length])
+    return pn
+
+class SteadyStateTest(unittest.TestCase):
+
+    def test_one_state(self):
+        pn = _dead()
+        for method in METHODS + ('auto',):
+            result = solve_steady_state(pn, method)
+            self.assertEqual(result.pi.tolist(), [1.0])
+
+    def test_cycle(self):
+        #The time spent in every place is proportional to 1/rate:
+        expected = 1.0/np.arange(1.0, 5.0)
+        expected /= expected.sum()
+        for method in METHODS + ('auto',):
+            result = solve_steady_state(_cycle(4), method)
+            self.assertTrue(np.allclose(sorted(result.pi), sorted(expected), atol = 1e-8), method)
+
+if __name__ == '__main__':
+    unittest.main()
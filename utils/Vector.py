@@ -5,6 +5,9 @@
 import math
 
 class Vec2(object):
+    
+    __slots__ = ('x', 'y')
+    
     def __init__(self, x = 0, y = 0):
         super(Vec2, self).__init__()
         